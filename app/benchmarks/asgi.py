@@ -0,0 +1,56 @@
+import asyncio
+import json
+from urllib.parse import urlencode
+
+
+# Minimal in-process ASGI client so benchmarks can drive main:app without a
+# socket or an extra HTTP client dependency.
+async def call(app, method: str, path: str, params: dict = None, body=None, headers: dict = None):
+	payload = b''
+	all_headers = [(b'host', b'benchmark')]
+	if body is not None:
+		payload = json.dumps(body).encode()
+		all_headers.append((b'content-type', b'application/json'))
+	for key, value in (headers or {}).items():
+		all_headers.append((key.lower().encode(), value.encode()))
+	scope = {
+		'type': 'http',
+		'asgi': {'version': '3.0'},
+		'http_version': '1.1',
+		'method': method,
+		'scheme': 'http',
+		'path': path,
+		'raw_path': path.encode(),
+		'query_string': urlencode(params or {}, doseq=True).encode(),
+		'root_path': '',
+		'headers': all_headers,
+		'client': ('127.0.0.1', 50000),
+		'server': ('benchmark', 80),
+	}
+	done = asyncio.Event()
+	sent_body = False
+
+	async def receive():
+		nonlocal sent_body
+		if not sent_body:
+			sent_body = True
+			return {'type': 'http.request', 'body': payload, 'more_body': False}
+		# only report the disconnect once the response has gone out
+		await done.wait()
+		return {'type': 'http.disconnect'}
+
+	status = None
+	chunks = []
+
+	async def send(message):
+		nonlocal status
+		if message['type'] == 'http.response.start':
+			status = message['status']
+		elif message['type'] == 'http.response.body':
+			chunks.append(message.get('body', b''))
+			if not message.get('more_body', False):
+				done.set()
+
+	await app(scope, receive, send)
+	done.set()
+	return status, b''.join(chunks)
@@ -0,0 +1,73 @@
+# Update endpoint latency with audit logging written inline (one extra storage
+# round trip per request, the old middleware) against the batched background
+# writer in src/audit.py.
+#
+#   cd app && python -m benchmarks.audit_latency --latency 0.02 --requests 1000 --concurrency 10
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('SNS_TOPIC_ARN', '')
+
+import main
+from src import operations, repository
+from benchmarks.asgi import call
+
+
+async def enqueue_inline(item: dict):
+	# what the old middleware did: one put_item per entry before the response completes
+	await repository.run_storage(operations.log_table.put_item, item)
+
+
+async def drive(total: int, concurrency: int) -> dict:
+	gate = asyncio.Semaphore(concurrency)
+	latencies = []
+
+	async def one(i: int):
+		async with gate:
+			start = time.perf_counter()
+			status, _ = await call(main.app, 'PUT', '/api/events/bench-event/update_name', {'event_name': f'name-{i}'})
+			assert status == 200
+			latencies.append(time.perf_counter() - start)
+
+	start = time.perf_counter()
+	await asyncio.gather(*(one(i) for i in range(total)))
+	elapsed = time.perf_counter() - start
+	await main.audit_writer.stop()
+	latencies.sort()
+	return {
+		'throughput_rps': round(total / elapsed, 1),
+		'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+		'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+	}
+
+
+def main_cli():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--latency', type=float, default=0.02, help='seconds added to every storage call')
+	parser.add_argument('--requests', type=int, default=1000)
+	parser.add_argument('--concurrency', type=int, default=10)
+	args = parser.parse_args()
+
+	operations.events_table.put_item({'event_id': 'bench-event', 'group_id': 'bench-group', 'event_name': 'Benchmark'})
+	operations.storage.latency = args.latency
+
+	writer = main.audit_writer
+	writer.enqueue = enqueue_inline
+	inline = asyncio.run(drive(args.requests, args.concurrency))
+	del writer.enqueue
+	batched = asyncio.run(drive(args.requests, args.concurrency))
+	repository.shutdown()
+	print(json.dumps({
+		'inline_put_item': inline,
+		'batched_writer': batched,
+		'writer_stats': writer.stats(),
+		'config': vars(args),
+	}, indent=2))
+
+
+if __name__ == '__main__':
+	main_cli()
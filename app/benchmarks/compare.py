@@ -0,0 +1,80 @@
+# Puts two benchmark reports (JSON, e.g. from two commits) side by side: every
+# number found at the same place in both, with its change in percent. Latencies
+# (_ms, _us, _seconds) going up and throughput (_rps) going down by more than
+# --threshold percent are listed as regressions.
+#
+#   cd app && python -m benchmarks.compare before.json after.json --threshold 10
+import argparse
+import json
+import sys
+
+# lower is better for these suffixes, higher for throughput
+LATENCY_SUFFIXES = ('_ms', '_us', '_seconds')
+THROUGHPUT_SUFFIXES = ('_rps',)
+SKIPPED = {'benchmark', 'commit', 'python', 'run_at', 'config'}
+
+
+def numbers(report: dict, prefix: str = '') -> dict:
+	# path ("routes.GET /api/events.p99_ms") -> value of every number in a report
+	found = {}
+	for name, value in report.items():
+		if not prefix and name in SKIPPED:
+			continue
+		path = f'{prefix}.{name}' if prefix else name
+		if isinstance(value, dict):
+			found.update(numbers(value, path))
+		elif isinstance(value, (int, float)) and not isinstance(value, bool):
+			found[path] = value
+	return found
+
+
+def regressed(path: str, change: float, threshold: float) -> bool:
+	if path.endswith(LATENCY_SUFFIXES):
+		return change > threshold
+	if path.endswith(THROUGHPUT_SUFFIXES):
+		return change < -threshold
+	return False
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> dict:
+	before, after = numbers(baseline), numbers(current)
+	changes, regressions = {}, []
+	for path in before.keys() & after.keys():
+		old, new = before[path], after[path]
+		change = round((new - old) / old * 100, 1) if old else None
+		changes[path] = {'baseline': old, 'current': new, 'change_pct': change}
+		if change is not None and regressed(path, change, threshold):
+			regressions.append(path)
+	configs = baseline.get('config', {}), current.get('config', {})
+	return {
+		'baseline_commit': baseline.get('commit'),
+		'current_commit': current.get('commit'),
+		# runs with different settings are not comparable
+		'config_differences': {name: [configs[0].get(name), configs[1].get(name)] for name in sorted(configs[0].keys() | configs[1].keys()) if configs[0].get(name) != configs[1].get(name)},
+		'threshold_pct': threshold,
+		'regressions': sorted(regressions),
+		'changes': dict(sorted(changes.items())),
+	}
+
+
+def main_cli():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('baseline')
+	parser.add_argument('current')
+	parser.add_argument('--threshold', type=float, default=10.0, help='percent change counted as a regression')
+	parser.add_argument('--fail-on-regression', action='store_true', help='exit with status 1 when anything regressed')
+	args = parser.parse_args()
+
+	with open(args.baseline, encoding='utf-8') as source:
+		baseline = json.load(source)
+	with open(args.current, encoding='utf-8') as source:
+		current = json.load(source)
+	result = compare(baseline, current, args.threshold)
+	json.dump(result, sys.stdout, indent=2)
+	print()
+	if args.fail_on_regression and result['regressions']:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main_cli()
@@ -0,0 +1,80 @@
+# Cost of listing one group's events as the Event table grows: the old filtered
+# scan (follows LastEvaluatedKey through the whole table) against a query on the
+# group_id-time_key-index. Group size stays fixed, so the query cost should stay flat
+# while the scan cost grows with the table.
+#
+#   cd app && python -m benchmarks.group_index --sizes 1000 10000 100000 --group-size 20
+import argparse
+import json
+import sys
+import time
+
+from src.storage import create_storage
+from src.timekeys import to_utc_key
+
+
+def seed(table, total: int, group_size: int):
+	groups = max(1, total // group_size)
+	for i in range(total):
+		time = f'2024-{i % 12 + 1:02}-{i % 28 + 1:02}T{i % 24:02}:00:00'
+		table.put_item({
+			'event_id': f'event-{i:07}',
+			'group_id': f'group-{i % groups}',
+			'time': time,
+			'time_key': to_utc_key(time),
+			'event_name': f'Event {i}',
+		})
+
+
+def drain(fetch) -> int:
+	count, start_key = 0, None
+	while True:
+		page = fetch(start_key)
+		count += len(page.items)
+		start_key = page.last_key
+		if not start_key:
+			return count
+
+
+def measure(storage, fetch, repeat: int) -> dict:
+	storage.reset_stats()
+	start = time.perf_counter()
+	for _ in range(repeat):
+		found = drain(fetch)
+	elapsed = time.perf_counter() - start
+	return {
+		'events_returned': found,
+		'items_read': storage.stats['items_read'] // repeat,
+		'storage_calls': storage.stats['calls'] // repeat,
+		'ms': round(elapsed / repeat * 1000, 3),
+	}
+
+
+def main_cli():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--backend', default='memory', choices=['memory', 'sqlite'])
+	parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+	parser.add_argument('--group-size', type=int, default=20)
+	parser.add_argument('--page-size', type=int, default=100)
+	parser.add_argument('--repeat', type=int, default=5)
+	args = parser.parse_args()
+
+	results = []
+	for size in args.sizes:
+		storage = create_storage(args.backend)
+		table = storage.table('Event')
+		seed(table, size, args.group_size)
+		where = {'group_id': 'group-0'}
+		results.append({
+			'table_size': size,
+			'scan': measure(storage, lambda key: table.scan(where=where, limit=args.page_size, start_key=key), args.repeat),
+			'query': measure(storage, lambda key: table.query(
+				'group-0', index='group_id-time_key-index', limit=args.page_size, start_key=key), args.repeat),
+		})
+		storage.close()
+	json.dump({'backend': args.backend, 'group_size': args.group_size, 'results': results}, sys.stdout, indent=2)
+	print()
+
+
+if __name__ == '__main__':
+	main_cli()
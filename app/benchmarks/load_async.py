@@ -0,0 +1,83 @@
+# Load test for the async storage layer: drives main:app in-process against the
+# in-memory storage engine with every call delayed like a DynamoDB round trip, once with
+# storage calls made inline on the event loop (the old behaviour) and once
+# through the bounded executor in src/repository.py.
+#
+#   cd app && python -m benchmarks.load_async --latency 0.05 --requests 400 --concurrency 200
+import argparse
+import asyncio
+import json
+import os
+import time
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+os.environ.setdefault('SNS_TOPIC_ARN', '')
+# every request should reach storage: the event cache would answer them from memory
+os.environ['EVENT_CACHE_TTL'] = '0'
+os.environ['EVENT_CACHE_NEGATIVE_TTL'] = '0'
+
+import main
+from src import operations, repository
+from benchmarks.asgi import call
+
+
+def install_stand_in(latency: float):
+	operations.events_table.put_item({'event_id': 'bench-event', 'group_id': 'bench-group', 'event_name': 'Benchmark'})
+	operations.storage.latency = latency
+
+
+async def run_inline(func, *args, **kwargs):
+	return func(*args, **kwargs)
+
+
+async def drive(total: int, concurrency: int) -> dict:
+	gate = asyncio.Semaphore(concurrency)
+	latencies = []
+
+	async def one():
+		async with gate:
+			start = time.perf_counter()
+			status, body = await call(main.app, 'GET', '/api/events/bench-event')
+			assert status == 200, (status, body)
+			latencies.append(time.perf_counter() - start)
+
+	start = time.perf_counter()
+	await asyncio.gather(*(one() for _ in range(total)))
+	elapsed = time.perf_counter() - start
+	latencies.sort()
+	return {
+		'requests': total,
+		'elapsed_s': round(elapsed, 3),
+		'throughput_rps': round(total / elapsed, 1),
+		'p50_ms': round(latencies[len(latencies) // 2] * 1000, 1),
+		'p99_ms': round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+	}
+
+
+def main_cli():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every storage call')
+	parser.add_argument('--requests', type=int, default=400)
+	parser.add_argument('--concurrency', type=int, default=200)
+	args = parser.parse_args()
+
+	install_stand_in(args.latency)
+	results = {}
+
+	offloaded = repository.run_storage
+	repository.run_storage = run_inline
+	results['before_inline'] = asyncio.run(drive(args.requests, args.concurrency))
+	repository.run_storage = offloaded
+	results['after_executor'] = asyncio.run(drive(args.requests, args.concurrency))
+	repository.shutdown()
+
+	results['config'] = {
+		'latency_s': args.latency,
+		'concurrency': args.concurrency,
+		'storage_workers': repository.STORAGE_WORKERS,
+	}
+	print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+	main_cli()
@@ -0,0 +1,150 @@
+# Micro-benchmarks on seeded data (the same as benchmarks.routes seeds):
+# - the operations.py functions called directly, without HTTP or the storage pool
+# - each middleware on its own, wrapped around an ASGI app that answers at once,
+#   with its cost over that bare app, and a trivial request through all of main:app
+# Reports mean and p50/p95/p99 in microseconds as JSON.
+#
+#   cd app && python -m benchmarks.micro --backend sqlite --iterations 2000 --output micro.json
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.report import percentiles, write_report
+from benchmarks.routes import PLACES, WORDS, event_body, seed
+
+
+def summarize(samples: list) -> dict:
+	return {'calls': len(samples), 'mean_us': round(sum(samples) / len(samples) * 1e6, 2), **percentiles(samples, 'us')}
+
+
+def measure(func, iterations: int) -> dict:
+	samples = []
+	for i in range(iterations):
+		start = time.perf_counter()
+		func(i)
+		samples.append(time.perf_counter() - start)
+	return summarize(samples)
+
+
+async def measure_async(func, iterations: int) -> dict:
+	samples = []
+	for i in range(iterations):
+		start = time.perf_counter()
+		await func(i)
+		samples.append(time.perf_counter() - start)
+	return summarize(samples)
+
+
+def operation_benchmarks(data: dict, iterations: int, now: datetime) -> dict:
+	from src import operations
+	from src.models import Event
+
+	rng = random.Random(1)
+	events, groups, users = data['events'], data['groups'], data['users']
+	event = lambda i: events[(i * 7919) % len(events)]
+	user = lambda i: users[(i * 31) % len(users)]
+	start_key, end_key = now.isoformat(), (now + timedelta(days=30)).isoformat()
+	new_events = [Event(**event_body(rng, now)) for _ in range(iterations)]
+
+	def uncached(i):
+		operations.event_cache.invalidate(event(i))
+		operations.get_event(event(i))
+
+	# joins come before leaves and comments before their deletion, so each undoes the other
+	comment_ids = []
+	return {
+		'get_event': measure(lambda i: operations.get_event(event(i)), iterations),
+		'get_event (cache miss)': measure(uncached, iterations),
+		'get_events': measure(lambda i: operations.get_events(10), iterations),
+		'list_events_by_group_id': measure(lambda i: operations.list_events_by_group_id(groups[i % len(groups)]), iterations),
+		'list_upcoming_events': measure(lambda i: operations.list_upcoming_events(start_key, end_key), iterations),
+		'search_events': measure(lambda i: operations.search_events(WORDS[i % len(WORDS)].lower()), iterations),
+		'list_events_by_user_id': measure(lambda i: operations.list_events_by_user_id(user(i)), iterations),
+		'list_schedule_conflicts': measure(lambda i: operations.list_schedule_conflicts(user(i)), iterations),
+		'list_attendees': measure(lambda i: operations.list_attendees(event(i)), iterations),
+		'get_attendee_count': measure(lambda i: operations.get_attendee_count(event(i)), iterations),
+		'list_comments_by_event_id': measure(lambda i: operations.list_comments_by_event_id(event(i)), iterations),
+		'list_logs': measure(lambda i: operations.list_logs(), iterations),
+		'get_event_log_by_event_id': measure(lambda i: operations.get_event_log_by_event_id(event(i)), iterations),
+		'patch_event': measure(lambda i: operations.patch_event(event(i), {'location': f'{PLACES[i % len(PLACES)]} {i}'}), iterations),
+		'update_event_time': measure(lambda i: operations.update_event_time(event(i), (now + timedelta(hours=i)).replace(tzinfo=None).isoformat()), iterations),
+		'add_event': measure(lambda i: operations.add_event(user(i), groups[i % len(groups)], new_events[i]), iterations),
+		'add_event_member': measure(lambda i: operations.add_event_member(event(i), f'micro-{i}'), iterations),
+		'delete_event_member': measure(lambda i: operations.delete_event_member(event(i), f'micro-{i}'), iterations),
+		'add_comment': measure(lambda i: comment_ids.append(operations.add_comment(event(i), f'micro-{i}', 'micro')['comment_id']), iterations),
+		'delete_comment': measure(lambda i: operations.delete_comment(comment_ids[i]), iterations),
+		'build_log_item': measure(lambda i: operations.build_log_item(event(i), 'update', 'micro'), iterations),
+	}
+
+
+async def middleware_benchmarks(iterations: int) -> dict:
+	from fastapi.middleware.cors import CORSMiddleware
+	from src import operations
+	from src.audit import AuditLogWriter, AuditMiddleware
+	from benchmarks.asgi import call
+	import main
+
+	# what a handler that records a change leaves for the audit middleware
+	entry = operations.build_log_item('micro-event', 'update', 'micro')
+
+	async def bare(scope, receive, send):
+		if scope['method'] == 'PUT':
+			scope['state']['audit_logs'] = [dict(entry)]
+		await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+		await send({'type': 'http.response.body', 'body': b'{}'})
+
+	writer = AuditLogWriter(lambda: operations.log_table)
+	await writer.start()
+	audited = AuditMiddleware(bare, writer=writer)
+	cors = CORSMiddleware(bare, allow_origins=['*'], allow_credentials=True, allow_methods=['*'], allow_headers=['*'])
+	origin = {'origin': 'http://example.com'}
+	stacks = {
+		'bare app': lambda i: call(bare, 'GET', '/'),
+		'AuditMiddleware GET': lambda i: call(audited, 'GET', '/'),
+		'AuditMiddleware PUT': lambda i: call(audited, 'PUT', '/'),
+		'CORSMiddleware': lambda i: call(cors, 'GET', '/'),
+		'CORSMiddleware with Origin': lambda i: call(cors, 'GET', '/', headers=origin),
+		'main:app GET /': lambda i: call(main.app, 'GET', '/'),
+	}
+	results = {}
+	for name, func in stacks.items():
+		results[name] = await measure_async(func, iterations)
+	await writer.stop()
+	base = results['bare app']['mean_us']
+	for name, result in results.items():
+		if name != 'bare app':
+			result['overhead_mean_us'] = round(result['mean_us'] - base, 2)
+	return results
+
+
+def main_cli():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--backend', default='memory', choices=['memory', 'sqlite'])
+	parser.add_argument('--iterations', type=int, default=1000)
+	parser.add_argument('--events', type=int, default=2000)
+	parser.add_argument('--groups', type=int, default=20)
+	parser.add_argument('--users', type=int, default=500)
+	parser.add_argument('--members', type=int, default=10, help='most members seeded per event')
+	parser.add_argument('--comments', type=int, default=3, help='most comments seeded per event')
+	parser.add_argument('--seed', type=int, default=7)
+	parser.add_argument('--output', help='also write the report to this file')
+	args = parser.parse_args()
+
+	os.environ['STORAGE_BACKEND'] = args.backend
+	os.environ.setdefault('SNS_TOPIC_ARN', '')
+	now = datetime.now(timezone.utc)
+	data = seed(args, now)
+
+	results = {
+		'operations': operation_benchmarks(data, args.iterations, now),
+		'middleware': asyncio.run(middleware_benchmarks(args.iterations)),
+	}
+	config = {name: value for name, value in vars(args).items() if name != 'output'}
+	write_report('micro', config, results, args.output)
+
+
+if __name__ == '__main__':
+	main_cli()
@@ -0,0 +1,46 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+
+
+# Shared by the benchmarks: latency percentiles and the JSON report. Reports are
+# stamped with the commit and interpreter they ran on, so two runs can be put
+# side by side with benchmarks.compare.
+def percentiles(samples: list, unit: str = 'ms') -> dict:
+	# p50/p95/p99 and max of samples in seconds, in milliseconds (or microseconds)
+	if not samples:
+		return {}
+	samples = sorted(samples)
+	scale = 1e6 if unit == 'us' else 1e3
+	pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * scale, 3)
+	return {f'p50_{unit}': pick(0.50), f'p95_{unit}': pick(0.95), f'p99_{unit}': pick(0.99), f'max_{unit}': round(samples[-1] * scale, 3)}
+
+
+def git_commit() -> str:
+	try:
+		return subprocess.run(
+			['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+			cwd=os.path.dirname(os.path.abspath(__file__))
+		).stdout.strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def write_report(name: str, config: dict, results: dict, output: str = None):
+	report = {
+		'benchmark': name,
+		'commit': git_commit(),
+		'python': platform.python_version(),
+		'run_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+		'config': config,
+		**results,
+	}
+	if output:
+		with open(output, 'w', encoding='utf-8') as target:
+			json.dump(report, target, indent=2)
+			target.write('\n')
+	json.dump(report, sys.stdout, indent=2)
+	print()
@@ -0,0 +1,343 @@
+# Load test of every route: main:app runs in-process with its lifespan (audit
+# writer, outbox, change processor, search index build) against a local storage
+# stand-in, with --latency seconds added to every storage call to stand for a
+# DynamoDB round trip. The tables are seeded with groups of events, members,
+# comments and logs. Then --concurrency clients send a weighted mix of requests
+# over all routes for --duration seconds (after --warmup seconds not counted).
+# Throughput and p50/p95/p99 are reported per route as JSON; the same --seed
+# seeds the same data and request sequence per client.
+#
+#   cd app && python -m benchmarks.routes --backend sqlite --latency 0.002 --duration 30 --output before.json
+#   cd app && python -m benchmarks.routes --mix writes --route members --route comments
+#
+# Mixes: "browse" (the weights below, mostly reads), "writes" (writes ten times
+# as likely), "uniform" (every route equally likely).
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.report import percentiles, write_report
+
+STATUSES = ['Scheduled'] * 6 + ['In Progress', 'Completed', 'Cancelled']
+TAGS = ['music', 'tech', 'sports', 'art', 'food', 'outdoors', 'networking', 'workshop', 'conference', 'meetup']
+WORDS = ['Jazz', 'Python', 'Startup', 'Yoga', 'Chess', 'Film', 'Hiking', 'Design', 'Cloud', 'Poetry', 'Robotics', 'Wine']
+PLACES = ['Downtown Hall', 'Riverside Park', 'Main Library', 'Tech Hub', 'Old Theater', 'Community Center']
+
+# name is the route as declared in main.py; build returns (method, path, params,
+# body, on_response) or None when there is nothing to send right now
+Route = namedtuple('Route', 'name kind weight build')
+
+
+class Traffic:
+	# A client's view of the ids to pick from. The lists are shared by all
+	# clients (they run on one event loop), and writes made during the run add
+	# and remove ids; each client has its own random stream.
+	def __init__(self, rng: random.Random, data: dict):
+		self.rng = rng
+		self.groups = data['groups']
+		self.users = data['users']
+		self.events = data['events']
+		self.created = data['created']
+		self.members = data['members']
+		self.comments = data['comments']
+
+	def event(self) -> str:
+		return self.rng.choice(self.events)
+
+	def take(self, items: list):
+		# removes and returns a random element, or None
+		if not items:
+			return None
+		position = self.rng.randrange(len(items))
+		items[position], items[-1] = items[-1], items[position]
+		return items.pop()
+
+
+def random_time(rng: random.Random, now: datetime) -> str:
+	return (now + timedelta(days=rng.uniform(-30, 180))).replace(microsecond=0, tzinfo=None).isoformat()
+
+
+def event_body(rng: random.Random, now: datetime) -> dict:
+	return {
+		'event_id': 'new',
+		'status': rng.choice(STATUSES),
+		'capacity': rng.choice([20, 50, 100, 500]),
+		'event_name': f'{rng.choice(WORDS)} {rng.choice(["Night", "Meetup", "Workshop", "Session", "Festival"])}',
+		'description': f'{rng.choice(WORDS).lower()} and {rng.choice(WORDS).lower()} at {rng.choice(PLACES)}',
+		'location': rng.choice(PLACES),
+		'time': random_time(rng, now),
+		'group_id': 'ignored',
+		'organizer_id': 'ignored',
+		'tag_1': rng.choice(TAGS),
+		'tag_2': rng.choice(TAGS),
+		'duration': rng.choice([30, 60, 90, 120, 180]),
+	}
+
+
+def seed(args, now: datetime) -> dict:
+	from src import operations
+	from src.batch import batch_write, chunked
+	from src.models import Event
+
+	rng = random.Random(args.seed)
+	groups = [f'group-{g}' for g in range(args.groups)]
+	users = [f'user-{u}' for u in range(args.users)]
+	events, members, comments = [], [], []
+	per_group = -(-args.events // args.groups)
+	for group_id in groups:
+		batch = [Event(**event_body(rng, now)) for _ in range(min(per_group, args.events - len(events)))]
+		for chunk in chunked(batch, operations.BULK_MAX_ITEMS):
+			created = operations.add_events(f'organizer-{group_id}', group_id, chunk)
+			events += [result['event_id'] for result in created['results'] if result['status'] == 'created']
+	for event_id in events:
+		joined = rng.sample(users, rng.randint(0, min(args.members, len(users))))
+		results = operations.add_event_members(event_id, joined)['results']
+		members += [(event_id, result['user_id']) for result in results if result['status'] == 'added']
+		writers = rng.sample(users, rng.randint(0, min(args.comments, len(users))))
+		results = operations.add_comments(event_id, [{'user_id': user_id, 'text': f'see you at {event_id[:8]}'} for user_id in writers])['results']
+		comments += [result['comment_id'] for result in results if result['status'] == 'added']
+	logs = [operations.build_log_item(event_id, 'seed', f'event {event_id} seeded', rng.choice(users)) for event_id in events for _ in range(2)]
+	batch_write(operations.log_table, logs)
+	return {'groups': groups, 'users': users, 'events': events, 'created': [], 'members': members, 'comments': comments}
+
+
+def routes(now: datetime) -> list:
+	def get(path):
+		return lambda t: ('GET', path(t), None, None, None)
+
+	def update(name, param, value):
+		return lambda t: ('PUT', f'/api/events/{t.event()}/update_{name}', {param: value(t.rng)}, None, None)
+
+	def created_event(t):
+		def keep(status, body):
+			if status == 200:
+				event_id = json.loads(body).get('event_id')
+				if event_id:
+					t.events.append(event_id)
+					t.created.append(event_id)
+		return 'POST', f'/api/{t.rng.choice(t.groups)}/events', {'user_id': t.rng.choice(t.users)}, event_body(t.rng, now), keep
+
+	def created_events(t):
+		def keep(status, body):
+			if status == 200:
+				for result in json.loads(body)['results']:
+					if result['status'] == 'created':
+						t.events.append(result['event_id'])
+						t.created.append(result['event_id'])
+		return 'POST', f'/api/{t.rng.choice(t.groups)}/events:batch', {'user_id': t.rng.choice(t.users)}, [event_body(t.rng, now) for _ in range(10)], keep
+
+	def deleted_event(t):
+		# only events created during the run are deleted, so the seeded data stays
+		event_id = t.take(t.created)
+		if event_id is None:
+			return None
+		t.events.remove(event_id)
+		return 'DELETE', f'/api/events/{event_id}', None, None, None
+
+	def joined(t):
+		event_id, user_id = t.event(), t.rng.choice(t.users)
+		def keep(status, body):
+			if status == 200 and json.loads(body).get('message', '').startswith('Member added'):
+				t.members.append((event_id, user_id))
+		return 'POST', f'/api/events/{event_id}/members', {'user_id': user_id}, None, keep
+
+	def joined_many(t):
+		event_id, user_ids = t.event(), t.rng.sample(t.users, 10)
+		def keep(status, body):
+			if status == 200:
+				t.members += [(event_id, result['user_id']) for result in json.loads(body)['results'] if result['status'] == 'added']
+		return 'POST', f'/api/events/{event_id}/members:batch', None, user_ids, keep
+
+	def left(t):
+		member = t.take(t.members)
+		if member is None:
+			return None
+		return 'DELETE', f'/api/events/{member[0]}/members', {'user_id': member[1]}, None, None
+
+	def commented(t):
+		event_id = t.event()
+		def keep(status, body):
+			comment_id = json.loads(body).get('comment_id') if status == 200 else None
+			if comment_id:
+				t.comments.append(comment_id)
+		return 'POST', f'/api/events/{event_id}/comments', {'user_id': t.rng.choice(t.users), 'comment': 'count me in'}, None, keep
+
+	def commented_many(t):
+		event_id = t.event()
+		def keep(status, body):
+			if status == 200:
+				t.comments += [result['comment_id'] for result in json.loads(body)['results'] if result['status'] == 'added']
+		body = [{'user_id': user_id, 'text': 'sounds good'} for user_id in t.rng.sample(t.users, 10)]
+		return 'POST', f'/api/events/{event_id}/comments:batch', None, body, keep
+
+	def comment_edited(t):
+		if not t.comments:
+			return None
+		return 'PUT', f'/api/events/{t.event()}/comments', {'comment_id': t.rng.choice(t.comments), 'comment': 'edited'}, None, None
+
+	def comment_deleted(t):
+		comment_id = t.take(t.comments)
+		if comment_id is None:
+			return None
+		return 'DELETE', f'/api/events/{t.event()}/comments', {'comment_id': comment_id}, None, None
+
+	def searched(t):
+		return 'GET', '/api/events/search', {'q': t.rng.choice(WORDS).lower()[:t.rng.randint(3, 6)], 'tag': t.rng.sample(TAGS, t.rng.randint(0, 1))}, None, None
+
+	def upcoming(t):
+		start = (now + timedelta(days=t.rng.uniform(-5, 30))).replace(microsecond=0, tzinfo=None)
+		end = start + timedelta(days=t.rng.choice([7, 30]))
+		return 'GET', '/api/events/upcoming', {'from': start.isoformat(), 'to': end.isoformat()}, None, None
+
+	return [
+		Route('GET /', 'read', 0.5, get(lambda t: '/')),
+		Route('GET /api/metrics', 'read', 0.2, get(lambda t: '/api/metrics')),
+		Route('GET /api/{group_id}/events', 'read', 12, get(lambda t: f'/api/{t.rng.choice(t.groups)}/events')),
+		Route('GET /api/{group_id}/summary', 'read', 1, get(lambda t: f'/api/{t.rng.choice(t.groups)}/summary')),
+		Route('GET /api/events', 'read', 3, get(lambda t: '/api/events')),
+		Route('GET /api/events/upcoming', 'read', 3, upcoming),
+		Route('GET /api/events/search', 'read', 4, searched),
+		Route('GET /api/events/export', 'read', 0.2, lambda t: ('GET', '/api/events/export', {'group_id': t.rng.choice(t.groups)}, None, None)),
+		Route('GET /api/events/{event_id}', 'read', 20, get(lambda t: f'/api/events/{t.event()}')),
+		Route('GET /api/events/{event_id}/summary', 'read', 1, get(lambda t: f'/api/events/{t.event()}/summary')),
+		Route('POST /api/{group_id}/events', 'write', 1, created_event),
+		Route('POST /api/{group_id}/events:batch', 'write', 0.2, created_events),
+		Route('PUT /api/events/{event_id}/update_name', 'write', 1, update('name', 'event_name', lambda rng: f'{rng.choice(WORDS)} Night')),
+		Route('PUT /api/events/{event_id}/update_duration', 'write', 0.5, update('duration', 'duration', lambda rng: rng.choice([30, 60, 90, 120]))),
+		Route('PUT /api/events/{event_id}/update_location', 'write', 0.5, update('location', 'location', lambda rng: rng.choice(PLACES))),
+		Route('PUT /api/events/{event_id}/update_time', 'write', 0.5, update('time', 'time', lambda rng: random_time(rng, now))),
+		Route('PUT /api/events/{event_id}/update_capacity', 'write', 0.5, update('capacity', 'capacity', lambda rng: rng.choice([50, 100, 500]))),
+		Route('PUT /api/events/{event_id}/update_status', 'write', 0.5, update('status', 'status', lambda rng: rng.choice(STATUSES))),
+		Route('PUT /api/events/{event_id}/update_description', 'write', 0.5, update('description', 'description', lambda rng: f'all about {rng.choice(WORDS).lower()}')),
+		Route('PUT /api/events/{event_id}/update_tag2', 'write', 0.5, update('tag2', 'tag_2', lambda rng: rng.choice(TAGS))),
+		Route('PATCH /api/events/{event_id}', 'write', 1, lambda t: ('PATCH', f'/api/events/{t.event()}', None, {'location': t.rng.choice(PLACES), 'capacity': t.rng.choice([50, 100, 500])}, None)),
+		Route('DELETE /api/events/{event_id}', 'write', 0.3, deleted_event),
+		Route('GET /api/users/{user_id}/events', 'read', 4, get(lambda t: f'/api/users/{t.rng.choice(t.users)}/events')),
+		Route('GET /api/users/{user_id}/conflicts', 'read', 1, get(lambda t: f'/api/users/{t.rng.choice(t.users)}/conflicts')),
+		Route('GET /api/events/{event_id}/members', 'read', 3, get(lambda t: f'/api/events/{t.event()}/members')),
+		Route('GET /api/events/{event_id}/members/count', 'read', 2, get(lambda t: f'/api/events/{t.event()}/members/count')),
+		Route('POST /api/events/{event_id}/members', 'write', 3, joined),
+		Route('POST /api/events/{event_id}/members:batch', 'write', 0.2, joined_many),
+		Route('DELETE /api/events/{event_id}/members', 'write', 1.5, left),
+		Route('GET /api/events/{event_id}/comments', 'read', 6, get(lambda t: f'/api/events/{t.event()}/comments')),
+		Route('POST /api/events/{event_id}/comments', 'write', 2, commented),
+		Route('POST /api/events/{event_id}/comments:batch', 'write', 0.2, commented_many),
+		Route('PUT /api/events/{event_id}/comments', 'write', 0.5, comment_edited),
+		Route('DELETE /api/events/{event_id}/comments', 'write', 0.3, comment_deleted),
+		Route('GET /api/events/logs', 'read', 2, get(lambda t: '/api/events/logs')),
+		Route('GET /api/events/logs/export', 'read', 0.2, lambda t: ('GET', '/api/events/logs/export', {'event_id': t.event()}, None, None)),
+		Route('GET /api/events/{event_id}/logs', 'read', 2, get(lambda t: f'/api/events/{t.event()}/logs')),
+	]
+
+
+def weights(selected: list, mix: str) -> list:
+	if mix == 'uniform':
+		return [1.0] * len(selected)
+	if mix == 'writes':
+		return [route.weight * (10 if route.kind == 'write' else 1) for route in selected]
+	return [route.weight for route in selected]
+
+
+async def client(app, call, traffic: Traffic, selected: list, cumulative: list, warm: float, deadline: float, samples: dict, statuses: dict):
+	while time.perf_counter() < deadline:
+		route = traffic.rng.choices(selected, cum_weights=cumulative)[0]
+		request = route.build(traffic)
+		if request is None:
+			continue
+		method, path, params, body, on_response = request
+		start = time.perf_counter()
+		status, payload = await call(app, method, path, params, body)
+		if start >= warm:
+			samples[route.name].append(time.perf_counter() - start)
+			statuses[route.name][status] += 1
+		if on_response:
+			on_response(status, payload)
+
+
+async def drive(args, data: dict, now: datetime) -> dict:
+	import main
+	from src import operations
+	from benchmarks.asgi import call
+
+	selected = [route for route in routes(now) if not args.route or any(part in route.name for part in args.route)]
+	if not selected:
+		raise SystemExit(f'No route matches {args.route}')
+	cumulative = list(itertools.accumulate(weights(selected, args.mix)))
+	samples = {route.name: [] for route in selected}
+	statuses = {route.name: Counter() for route in selected}
+
+	async with main.app.router.lifespan_context(main.app):
+		# the search index is built in the background at startup; searches would
+		# be measured against a partial index until it is done
+		while not operations.search_index.ready and main.build_search_index:
+			await asyncio.sleep(0.05)
+		clients = [Traffic(random.Random(f'{args.seed}-{number}'), data) for number in range(args.concurrency)]
+		started = time.perf_counter()
+		warm, deadline = started + args.warmup, started + args.warmup + args.duration
+		await asyncio.gather(*(client(main.app, call, traffic, selected, cumulative, warm, deadline, samples, statuses) for traffic in clients))
+		# writes still being flushed (audit log, outbox) are not counted
+		measured = time.perf_counter() - warm
+
+	total = sum(len(latencies) for latencies in samples.values())
+	every = [latency for latencies in samples.values() for latency in latencies]
+	return {
+		'requests': total,
+		'seconds': round(measured, 2),
+		'throughput_rps': round(total / measured, 1),
+		'latency': percentiles(every),
+		'routes': {
+			name: {
+				'requests': len(latencies),
+				'throughput_rps': round(len(latencies) / measured, 2),
+				**percentiles(latencies),
+				'statuses': {str(status): count for status, count in sorted(statuses[name].items())},
+			}
+			for name, latencies in samples.items()
+		},
+	}
+
+
+def main_cli():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--backend', default='memory', choices=['memory', 'sqlite'])
+	parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every storage call')
+	parser.add_argument('--events', type=int, default=2000)
+	parser.add_argument('--groups', type=int, default=20)
+	parser.add_argument('--users', type=int, default=500)
+	parser.add_argument('--members', type=int, default=10, help='most members seeded per event')
+	parser.add_argument('--comments', type=int, default=3, help='most comments seeded per event')
+	parser.add_argument('--mix', default='browse', choices=['browse', 'writes', 'uniform'])
+	parser.add_argument('--route', action='append', default=[], help='only routes whose name contains this (repeatable)')
+	parser.add_argument('--concurrency', type=int, default=20)
+	parser.add_argument('--duration', type=float, default=20.0, help='seconds measured')
+	parser.add_argument('--warmup', type=float, default=2.0, help='seconds sent before measuring')
+	parser.add_argument('--seed', type=int, default=7)
+	parser.add_argument('--output', help='also write the report to this file')
+	args = parser.parse_args()
+
+	# the storage stand-in is picked when src.operations is first imported
+	os.environ['STORAGE_BACKEND'] = args.backend
+	os.environ.setdefault('SNS_TOPIC_ARN', '')
+	from src import operations
+
+	now = datetime.now(timezone.utc)
+	start = time.perf_counter()
+	data = seed(args, now)
+	seed_seconds = time.perf_counter() - start
+	seeded = {name: len(data[name]) for name in ('groups', 'users', 'events', 'members', 'comments')}
+	# seeding runs without the delay, only the measured requests get it
+	operations.storage.latency = args.latency
+
+	results = asyncio.run(drive(args, data, now))
+	config = {name: value for name, value in vars(args).items() if name != 'output'}
+	write_report('routes', config, {'seeded': seeded, 'seed_seconds': round(seed_seconds, 1), **results}, args.output)
+
+
+if __name__ == '__main__':
+	main_cli()
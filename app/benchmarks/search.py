@@ -0,0 +1,102 @@
+# Search index build time, memory and query latency on events scaled up from
+# src/mock_data.csv: names, descriptions and tags of the mock rows are mixed and
+# every name gets one of --series generated words, every description one of
+# --places, so terms range from very common (a mock name word, 10% of events)
+# to rare. Each query kind is run --queries times with different words;
+# latency is the in-process search (index lookup and top-k), not the item reads.
+# Build time includes generating the events.
+#
+#   cd app && python -m benchmarks.search --events 1000000
+import argparse
+import csv
+import itertools
+import json
+import random
+import resource
+import sys
+import time
+
+from src.search import SearchIndex, build_gc_thresholds
+from benchmarks.report import percentiles
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ten', 'vo', 'shu', 'bel', 'dor', 'ix', 'ne', 'qua', 'sol', 'tri', 'um', 'zer']
+
+
+def words(count: int, rng: random.Random) -> list:
+	found = set()
+	while len(found) < count:
+		found.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+	return sorted(found)
+
+
+def generate(count: int, rows: list, series: list, places: list, rng: random.Random):
+	for i in range(count):
+		yield {
+			'event_id': f'event-{i:07}',
+			'event_name': f"{rng.choice(rows)['event_name']} {rng.choice(series)}",
+			'description': f"{rng.choice(rows)['description']} in {rng.choice(places)}",
+			'tag_1': rng.choice(rows)['tag_1'],
+			'tag_2': rng.choice(rows)['tag_2'],
+		}
+
+
+def main_cli():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--events', type=int, default=1000000)
+	parser.add_argument('--series', type=int, default=5000)
+	parser.add_argument('--places', type=int, default=200)
+	parser.add_argument('--queries', type=int, default=200)
+	parser.add_argument('--limit', type=int, default=10)
+	parser.add_argument('--seed', type=int, default=7)
+	args = parser.parse_args()
+
+	rng = random.Random(args.seed)
+	with open('src/mock_data.csv', newline='', encoding='utf-8') as source:
+		rows = list(csv.DictReader(source))
+	series, places = words(args.series, rng), words(args.places, rng)
+
+	index = SearchIndex()
+	rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	start = time.perf_counter()
+	# with the collector thresholds the app uses for its startup build
+	with build_gc_thresholds():
+		index.rebuild(generate(args.events, rows, series, places, rng))
+	build_seconds = time.perf_counter() - start
+	rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+	name_words = sorted({row['event_name'].split()[0] for row in rows})
+	tags = [(row['tag_1'], row['tag_2']) for row in rows]
+	kinds = {
+		'common_term': lambda: (rng.choice(name_words), []),
+		'rare_term': lambda: (rng.choice(series), []),
+		'prefix': lambda: (rng.choice(series)[:3], []),
+		'two_terms': lambda: (f'{rng.choice(name_words)} {rng.choice(places)}', []),
+		'tags_only': lambda: ('', list(rng.choice(tags))),
+		'term_and_tag': lambda: (rng.choice(name_words), [rng.choice(tags)[0]]),
+		# worst case: two common words that (almost) never meet, so the walk
+		# goes through the whole smaller posting set
+		'disjoint_common_terms': lambda: (' '.join(rng.sample(name_words, 2)), []),
+	}
+	results = {}
+	for kind, make in kinds.items():
+		samples, hits = [], 0
+		for query, query_tags in (make() for _ in range(args.queries)):
+			start = time.perf_counter()
+			hits += len(index.search(query, query_tags, args.limit))
+			samples.append(time.perf_counter() - start)
+		results[kind] = {**percentiles(samples), 'mean_hits': round(hits / args.queries, 1)}
+
+	stats = index.stats()
+	json.dump({
+		'events': args.events,
+		'tokens': stats['tokens'],
+		'build_seconds': round(build_seconds, 1),
+		# ru_maxrss is in KiB on Linux
+		'index_memory_mb': round((rss_after - rss_before) / 1024),
+		'queries': results,
+	}, sys.stdout, indent=2)
+	print()
+
+
+if __name__ == '__main__':
+	main_cli()
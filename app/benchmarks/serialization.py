@@ -0,0 +1,82 @@
+# Per-item cost of turning a page of DynamoDB event items (numbers as Decimal)
+# into a response body:
+#   jsonable_encoder - what FastAPI does with a returned dict: jsonable_encoder, then JSONResponse
+#   response_model   - a precompiled pydantic response model: validate, dump to JSON types, orjson
+#   fast_json        - FastJSONResponse: orjson over the items as they are
+#
+#   cd app && python -m benchmarks.serialization --sizes 1000 5000 10000
+import argparse
+import json
+import sys
+import time
+from decimal import Decimal
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from starlette.responses import JSONResponse
+
+from src.models import Event, EventPage
+from src.serialization import FastJSONResponse
+
+
+def make_page(size: int) -> dict:
+	# items shaped like stored events (every Event field, defaults included),
+	# with numbers as Decimal the way DynamoDB returns them, so that all three
+	# paths produce the same body
+	items = []
+	for i in range(size):
+		item = Event(
+			event_id=f'event-{i:07}',
+			status='open',
+			capacity=50 + i % 100,
+			event_name=f'Event {i}',
+			description='Weekly meetup with talks and demos',
+			location='Room 101',
+			time=f'2024-{i % 12 + 1:02}-{i % 28 + 1:02}T{i % 24:02}:00:00',
+			group_id='group-1',
+			organizer_id='user-1',
+			tag_1='tech',
+			tag_2=None,
+			duration=60,
+		).model_dump()
+		items.append({name: Decimal(value) if isinstance(value, int) else value for name, value in item.items()})
+	return {'items': items, 'next_cursor': None}
+
+
+def measure(render, page: dict, repeat: int) -> dict:
+	body = render(page)
+	start = time.perf_counter()
+	for _ in range(repeat):
+		render(page)
+	elapsed = (time.perf_counter() - start) / repeat
+	return {
+		'us_per_item': round(elapsed / len(page['items']) * 1e6, 3),
+		'ms_per_page': round(elapsed * 1000, 3),
+		'bytes': len(body),
+	}
+
+
+def main_cli():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 5000, 10000])
+	parser.add_argument('--repeat', type=int, default=5)
+	args = parser.parse_args()
+
+	adapter = TypeAdapter(EventPage)
+	paths = {
+		'jsonable_encoder': lambda page: JSONResponse(jsonable_encoder(page)).body,
+		'response_model': lambda page: FastJSONResponse(adapter.dump_python(adapter.validate_python(page), mode='json')).body,
+		'fast_json': lambda page: FastJSONResponse(page).body,
+	}
+	results = []
+	for size in args.sizes:
+		page = make_page(size)
+		bodies = {name: json.loads(render(page)) for name, render in paths.items()}
+		assert all(body == bodies['fast_json'] for body in bodies.values()), 'paths disagree'
+		results.append({'items': size, **{name: measure(render, page, args.repeat) for name, render in paths.items()}})
+	json.dump({'results': results}, sys.stdout, indent=2)
+	print()
+
+
+if __name__ == '__main__':
+	main_cli()
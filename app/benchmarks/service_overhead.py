@@ -0,0 +1,83 @@
+# Splits request latency into storage time and service time: for one backend,
+# times the raw storage call, the operations.py function wrapping it, and the
+# full HTTP request through main:app (middleware, routing, validation, JSON).
+# All three run the same storage call (a get, or the group index query), so the
+# differences are what each layer adds.
+#
+#   cd app && python -m benchmarks.service_overhead --backend sqlite --events 5000
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+
+def parse_args():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--backend', default='memory', choices=['memory', 'sqlite'])
+	parser.add_argument('--events', type=int, default=5000)
+	parser.add_argument('--groups', type=int, default=50)
+	parser.add_argument('--iterations', type=int, default=2000)
+	return parser.parse_args()
+
+
+def mean_us(func, iterations: int) -> float:
+	# one untimed call first, so the layer timed first does not pay for warming up
+	func(0)
+	start = time.perf_counter()
+	for i in range(iterations):
+		func(i)
+	return round((time.perf_counter() - start) / iterations * 1e6, 1)
+
+
+async def mean_request_us(app, call, paths, iterations: int) -> float:
+	start = time.perf_counter()
+	for i in range(iterations):
+		status, _ = await call(app, 'GET', paths(i))
+		assert status == 200
+	return round((time.perf_counter() - start) / iterations * 1e6, 1)
+
+
+def main_cli():
+	args = parse_args()
+	os.environ['STORAGE_BACKEND'] = args.backend
+	os.environ.setdefault('SNS_TOPIC_ARN', '')
+	# the operation and the request read storage like the raw call does, not the event cache
+	os.environ['EVENT_CACHE_TTL'] = '0'
+	os.environ['EVENT_CACHE_NEGATIVE_TTL'] = '0'
+
+	import main
+	from src import operations
+	from src.timekeys import to_utc_key
+	from benchmarks.asgi import call
+
+	for i in range(args.events):
+		operations.events_table.put_item({
+			'event_id': f'event-{i}', 'group_id': f'group-{i % args.groups}', 'time': f'2024-01-01T{i % 24:02}:00:00',
+			'time_key': to_utc_key(f'2024-01-01T{i % 24:02}:00:00'), 'event_name': f'Event {i}', 'status': 'Upcoming', 'capacity': 50, 'duration': 60,
+		})
+	event_id = lambda i: f'event-{(i * 7919) % args.events}'
+	group_id = lambda i: f'group-{i % args.groups}'
+	n = args.iterations
+
+	results = {
+		'backend': args.backend,
+		'events': args.events,
+		'get_event_us': {
+			'storage': mean_us(lambda i: operations.events_table.get_item({'event_id': event_id(i)}), n),
+			'operation': mean_us(lambda i: operations.get_event(event_id(i)), n),
+			'request': asyncio.run(mean_request_us(main.app, call, lambda i: f'/api/events/{event_id(i)}', n)),
+		},
+		'list_events_by_group_id_us': {
+			'storage': mean_us(lambda i: operations.events_table.query(group_id(i), index='group_id-time_key-index', limit=operations.page_size(10)), n // 10),
+			'operation': mean_us(lambda i: operations.list_events_by_group_id(group_id(i)), n // 10),
+			'request': asyncio.run(mean_request_us(main.app, call, lambda i: f'/api/{group_id(i)}/events', n // 10)),
+		},
+	}
+	json.dump(results, sys.stdout, indent=2)
+	print()
+
+
+if __name__ == '__main__':
+	main_cli()
@@ -0,0 +1,94 @@
+# Cold start cost of the service, each run in a fresh interpreter:
+#   import   - time to `import main`, and which heavy packages it loaded
+#   serve    - time from spawning uvicorn to the first 200 from GET /
+#
+#   cd app && python -m benchmarks.startup --runs 5
+# The import is measured with the default (DynamoDB) backend, which must not
+# touch AWS at import time; the server runs on --backend (memory by default,
+# so the background writers need no AWS credentials).
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+HEAVY_MODULES = ['boto3', 'botocore', 'pandas', 'uvicorn']
+
+IMPORT_PROBE = (
+	'import json, sys, time\n'
+	'start = time.perf_counter()\n'
+	'import main\n'
+	'elapsed = time.perf_counter() - start\n'
+	'print(json.dumps({"seconds": elapsed, "loaded": [m for m in %r if m in sys.modules]}))\n'
+) % HEAVY_MODULES
+
+
+def parse_args():
+	parser = argparse.ArgumentParser()
+	parser.add_argument('--runs', type=int, default=5)
+	parser.add_argument('--backend', default='memory', choices=['memory', 'sqlite', 'dynamodb'])
+	parser.add_argument('--timeout', type=float, default=30.0)
+	return parser.parse_args()
+
+
+def free_port() -> int:
+	with socket.socket() as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+
+def measure_import(env: dict) -> dict:
+	output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], env=env, check=True, capture_output=True, text=True).stdout
+	return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_first_response(env: dict, timeout: float) -> float:
+	port = free_port()
+	start = time.perf_counter()
+	server = subprocess.Popen(
+		[sys.executable, '-m', 'uvicorn', 'main:app', '--port', str(port), '--log-level', 'warning'],
+		env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+	)
+	try:
+		while time.perf_counter() - start < timeout:
+			try:
+				with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout=1) as response:
+					if response.status == 200:
+						return time.perf_counter() - start
+			except OSError:
+				time.sleep(0.01)
+		raise RuntimeError(f'no response within {timeout} seconds')
+	finally:
+		server.terminate()
+		server.wait()
+
+
+def summary(values: list) -> dict:
+	return {'median_ms': round(statistics.median(values) * 1000, 1), 'max_ms': round(max(values) * 1000, 1)}
+
+
+def main_cli():
+	args = parse_args()
+	base_env = dict(os.environ, SNS_TOPIC_ARN=os.environ.get('SNS_TOPIC_ARN', ''))
+
+	import_env = dict(base_env, STORAGE_BACKEND='dynamodb')
+	imports = [measure_import(import_env) for _ in range(args.runs)]
+
+	serve_env = dict(base_env, STORAGE_BACKEND=args.backend)
+	first_responses = [measure_first_response(serve_env, args.timeout) for _ in range(args.runs)]
+
+	results = {
+		'runs': args.runs,
+		'import': dict(summary([run['seconds'] for run in imports]), heavy_modules_loaded=imports[-1]['loaded']),
+		'first_response': dict(summary(first_responses), backend=args.backend),
+	}
+	json.dump(results, sys.stdout, indent=2)
+	print()
+
+
+if __name__ == '__main__':
+	main_cli()
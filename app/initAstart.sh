@@ -1,4 +1,5 @@
 source export.sh
 
+# development only: drops every table, recreates and seeds them, then starts the server
 python3 ./src/initialize.py
-python3 main.py
+exec python3 main.py
@@ -1,17 +1,64 @@
-from fastapi import FastAPI, HTTPException, Request, Response
-from typing import List
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
 from time import time
-from src.models import Event
+from src.models import CommentPage, Event, EventPage, EventsLog, EventsLogPage, EventUpdate, NewComment
 import json
+import os
 from src.operations import *
-import uvicorn
-import re
+from src import aws, repository
+from src.batch import BATCH_WORKERS
+from src import operations
+from src.audit import AuditLogWriter, AuditMiddleware, record_audit
+from src.outbox import OutboxDispatcher
+from src.changes import ChangeProcessor
+from src.sns import create_publisher
+from src.pagination import InvalidCursor
+from src.export import ExportError, encode, media_type
+from src.serialization import FastJSONResponse
+from src.search import SearchError, build_gc_thresholds
 from datetime import datetime
-from starlette.concurrency import iterate_in_threadpool
-
-app = FastAPI()
-log_table = dynamodb.Table('EventsLog')
 
+# audit log entries are written in the background, in batches
+audit_writer = AuditLogWriter(lambda: operations.log_table)
+# SNS notifications are published in the background from the Outbox table
+outbox_dispatcher = OutboxDispatcher(lambda: operations.storage.table('Outbox'), create_publisher())
+# event and group summaries are kept from the storage change streams; run it on one instance
+change_processor = ChangeProcessor(lambda: operations.storage)
+run_change_processor = os.getenv('CHANGE_PROCESSOR', '1') == '1'
+# the search index is built from a full scan in the background at startup
+build_search_index = os.getenv('SEARCH_INDEX', '1') == '1'
+
+async def rebuild_search_index_at_startup():
+	# garbage is collected less often while the index is built (trading memory
+	# for build time), and as usual once it is done
+	with build_gc_thresholds():
+		await repository.rebuild_search_index()
+
+# Nothing talks to AWS at import time: clients are created on first use, and the
+# background writers start here, once the server is up
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+	# size the AWS connection pool so every storage and batch thread keeps its own connection
+	aws.configure(max_pool_connections=max(aws.settings['max_pool_connections'], repository.STORAGE_WORKERS + BATCH_WORKERS))
+	await audit_writer.start()
+	await outbox_dispatcher.start()
+	if run_change_processor:
+		await change_processor.start()
+	# kept referenced, so the task is not collected while it runs
+	search_build = asyncio.get_running_loop().create_task(rebuild_search_index_at_startup()) if build_search_index else None
+	yield
+	operations.search_index.close()
+	await audit_writer.stop()
+	await outbox_dispatcher.stop()
+	await change_processor.stop()
+	repository.shutdown()
+
+# Routes that return storage items send a FastJSONResponse themselves: orjson
+# encodes the items as they are, without FastAPI's per-item jsonable_encoder walk
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 
 from fastapi.middleware.cors import CORSMiddleware
@@ -24,108 +71,140 @@ app.add_middleware(
 	allow_headers=["*"],
 )
 
-@app.middleware("http")
-async def log_updates_middleware(request: Request, call_next):
-	response = await call_next(request)
- 
-	create_path_pattern = re.compile(r"^/api/\w+/events$")
-	update_operations_paths = [
-		"/update_name",
-		"/update_duration",
-		"/update_location",
-		"/update_time",
-		"/update_capacity",
-		"/update_status",
-		"/update_description",
-		"/update_tag2"
-	]
- 
-	if request.method == "POST" and create_path_pattern.match(request.url.path):
-		response_body = [chunk async for chunk in response.body_iterator]
-		response.body_iterator = iterate_in_threadpool(iter(response_body))
-		body_data = json.loads(response_body[0].decode())
-		event_id = body_data.get('event_id')
-
-		# try:
-		details = generate_create_log_details(body_data)
-		# except json.JSONDecodeError:
-		# 	details = body_data.get('message')
-
-		# Log data to DynamoDB
-		log_item = {
-			'log_id': str(uuid.uuid4()),
-			'timestamp': datetime.now().isoformat(),
-			'event_id': event_id,
-			'action': f"{request.method} {request.url}",
-			'details': details,
-			'user_id': 'test_user_id'
-		}
-		log_table.put_item(Item=log_item)
-  
-	
-	elif request.method in ["PUT", "POST"] and any(path in request.url.path for path in update_operations_paths):
-		response_body = [chunk async for chunk in response.body_iterator]
-		response.body_iterator = iterate_in_threadpool(iter(response_body))
-		body_data = json.loads(response_body[0].decode())
-		event_id = body_data.get('event_id')
-
-		# try:
-		details = generate_log_details(body_data)
-		# except json.JSONDecodeError:
-		# 	details = body_data.get('message')
-
-		# Log data to DynamoDB
-		log_item = {
-			'log_id': str(uuid.uuid4()),
-			'timestamp': datetime.now().isoformat(),
-			'event_id': event_id,
-			'action': f"{request.method} {request.url}",
-			'details': details,
-			'user_id': 'test_user_id'
-		}
-		log_table.put_item(Item=log_item)
-
-	# print(dict(response.headers))
-		
-	return response
+# handlers record their change on request.state; the middleware queues it once the response starts
+app.add_middleware(AuditMiddleware, writer=audit_writer)
+
+@app.exception_handler(InvalidCursor)
+async def invalid_cursor_handler(request: Request, exc: InvalidCursor):
+	return JSONResponse(status_code=400, content={'detail': str(exc)})
+
+@app.exception_handler(SearchError)
+async def search_error_handler(request: Request, exc: SearchError):
+	return JSONResponse(status_code=400, content={'detail': str(exc)})
+
+@app.exception_handler(ExportError)
+async def export_error_handler(request: Request, exc: ExportError):
+	return JSONResponse(status_code=400, content={'detail': str(exc)})
+
+def export_response(items, export_format: str, fields: list, name: str) -> StreamingResponse:
+	# storage is read and rows are encoded a batch at a time on the storage pool while the response streams
+	return StreamingResponse(
+		repository.iterate_storage(encode(items, export_format, fields)),
+		media_type=media_type(export_format),
+		headers={'Content-Disposition': f'attachment; filename="{name}.{export_format}"'}
+	)
+
+def checked_page(page: dict) -> FastJSONResponse:
+	# list operations report bad arguments as {'message': ...} instead of a page;
+	# those are a 400, so a 200 always has the shape of the route's page model
+	if 'message' in page:
+		raise HTTPException(status_code=400, detail=page['message'])
+	return FastJSONResponse(page)
 
 @app.get("/")
 async def root():
 	return {'event_service_status': 'ONLINE'}
 
-# ===== For Logs =====
-
-# show all logs
-@app.get("/api/events/logs")
-async def list_all_logs(limit: int = 10, skip: int = 0):
-	return list_logs(limit, skip)
+# internal metrics of the background components
+@app.get("/api/metrics")
+async def read_metrics():
+	return {
+		'audit_log': audit_writer.stats(),
+		'event_cache': operations.event_cache.stats(),
+		'outbox': outbox_dispatcher.stats(),
+		'aggregates': change_processor.stats(),
+		'search': operations.search_index.stats(),
+		'schedule_cache': operations.schedule_cache.stats(),
+	}
 
-# show logs of a specific event
-@app.get("/api/events/{event_id}/logs")
-async def list_event_logs(event_id: str, limit: int = 10, skip: int = 0):
-	return get_event_log_by_event_id(event_id, limit, skip)
+# ===== For Logs =====
 
-# list events under a group
-@app.get("/api/{group_id}/events")
-async def list_events(group_id: str):
-	return list_events_by_group_id(group_id)
+# show all logs, newest first, one page at a time (pass next_cursor back as cursor)
+@app.get("/api/events/logs", response_model=EventsLogPage)
+async def list_all_logs(limit: int = 10, cursor: Optional[str] = None, since: Optional[str] = None):
+	return checked_page(await repository.list_logs(limit, cursor, since))
+
+# stream logs, oldest first, as NDJSON or CSV (format=ndjson|csv), optionally of one event and between since and until
+@app.get("/api/events/logs/export")
+async def export_logs_route(format: str = 'ndjson', event_id: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None):
+	media_type(format)
+	return export_response(operations.export_logs(event_id, since, until), format, list(EventsLog.model_fields), 'logs')
+
+# show logs of a specific event, newest first
+@app.get("/api/events/{event_id}/logs", response_model=EventsLogPage)
+async def list_event_logs(event_id: str, limit: int = 10, cursor: Optional[str] = None, since: Optional[str] = None):
+	return checked_page(await repository.get_event_log_by_event_id(event_id, limit, cursor, since))
+
+# list events under a group, in time order, optionally between start and end (ISO times)
+@app.get("/api/{group_id}/events", response_model=EventPage)
+async def list_events(group_id: str, limit: int = 10, cursor: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None):
+	return checked_page(await repository.list_events_by_group_id(group_id, limit, cursor, start, end))
+
+# event, attendee and comment counts and last activity of a group, from one read
+@app.get("/api/{group_id}/summary")
+async def read_group_summary(group_id: str):
+	summary = await repository.get_group_summary(group_id)
+	if summary:
+		return summary
+	raise HTTPException(status_code=404, detail="Summary not found")
 
 # create an event (under a group?)
 @app.post("/api/{group_id}/events")
-async def create_event(user_id: str, group_id: str, event: Event):
-	return add_event(user_id, group_id, event)
+async def create_event(request: Request, user_id: str, group_id: str, event: Event):
+	created = await repository.add_event(user_id, group_id, event)
+	if 'event_id' not in created:
+		return created
+	outbox_dispatcher.wake()
+	record_audit(request, created.get('event_id'), generate_create_log_details(created))
+	return created
+
+# create many events under a group with batched writes, one result per event
+@app.post("/api/{group_id}/events:batch")
+async def create_events(request: Request, user_id: str, group_id: str, events: List[Event]):
+	result = await repository.add_events(user_id, group_id, events)
+	outbox_dispatcher.wake()
+	for created in result.pop('events', []):
+		record_audit(request, created['event_id'], generate_create_log_details(created))
+	return result
 
 # list some events
-@app.get("/api/events")
-async def read_events(limit: int = 10, skip: int = 0):
-	return get_events(limit, skip)
+@app.get("/api/events", response_model=EventPage)
+async def read_events(limit: int = 10, cursor: Optional[str] = None):
+	return checked_page(await repository.get_events(limit, cursor))
+
+# events of a status (default Scheduled) in time order between from (default now) and to
+# (default 30 days later), from the status/month index (pass next_cursor back as cursor)
+@app.get("/api/events/upcoming", response_model=EventPage)
+async def read_upcoming_events(start: Optional[str] = Query(None, alias='from'), end: Optional[str] = Query(None, alias='to'),
+		status: str = 'Scheduled', limit: int = 10, cursor: Optional[str] = None):
+	return checked_page(await repository.list_upcoming_events(start, end, status, limit, cursor))
+
+# search names, descriptions and tags (words match as prefixes) and filter by exact tags,
+# best matches first; complete is false while the index is still being built
+@app.get("/api/events/search")
+async def search_events_route(q: str = '', tag: List[str] = Query([]), limit: int = 10):
+	return FastJSONResponse(await repository.search_events(q, tag, limit))
+
+# stream events as NDJSON or CSV (format=ndjson|csv), optionally of one group, one event or between start and end
+@app.get("/api/events/export")
+async def export_events_route(format: str = 'ndjson', group_id: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None, event_id: Optional[str] = None):
+	media_type(format)
+	return export_response(operations.export_events(group_id, start, end, event_id), format, list(Event.model_fields), 'events')
+
+# attendee and comment counts and last activity of an event, from one read
+@app.get("/api/events/{event_id}/summary")
+async def read_event_summary(event_id: str):
+	summary = await repository.get_event_summary(event_id)
+	if summary:
+		return summary
+	raise HTTPException(status_code=404, detail="Summary not found")
 
 # get an event info
-@app.get("/api/events/{event_id}")
+@app.get("/api/events/{event_id}", response_model=Event)
 async def read_event(event_id: str):
-	event = get_event(event_id)
+	event = await repository.get_event(event_id)
 	if event:
-		return event
+		return FastJSONResponse(event)
 	raise HTTPException(status_code=404, detail="Event not found")
 
 
@@ -153,38 +232,61 @@ def generate_create_log_details(body_data: dict):
 
 # update event attributes
 @app.put("/api/events/{event_id}/update_name")
-async def event_name_update(event_id: str, event_name: str):
-	return update_event_name(event_id, event_name)
+async def event_name_update(request: Request, event_id: str, event_name: str):
+	result = await repository.update_event_name(event_id, event_name)
+	record_audit(request, result.get('event_id'), generate_log_details(result))
+	return result
 
 @app.put("/api/events/{event_id}/update_duration")
-async def event_duration_update(event_id: str, duration: int):
-	return update_event_duration(event_id, duration)
+async def event_duration_update(request: Request, event_id: str, duration: int):
+	result = await repository.update_event_duration(event_id, duration)
+	record_audit(request, result.get('event_id'), generate_log_details(result))
+	return result
 
 # update event location, time, capacity, description
 @app.put("/api/events/{event_id}/update_location")
-async def event_location_update(event_id: str, location: str):
-	return update_event_location(event_id, location)
+async def event_location_update(request: Request, event_id: str, location: str):
+	result = await repository.update_event_location(event_id, location)
+	record_audit(request, result.get('event_id'), generate_log_details(result))
+	return result
 
 @app.put("/api/events/{event_id}/update_time")
-async def event_time_update(event_id: str, time: str):
-	return update_event_time(event_id, time)
+async def event_time_update(request: Request, event_id: str, time: str):
+	result = await repository.update_event_time(event_id, time)
+	record_audit(request, result.get('event_id'), generate_log_details(result))
+	return result
 
 @app.put("/api/events/{event_id}/update_capacity")
-async def event_capacity_update(event_id: str, capacity: int):
-	return update_event_capacity(event_id, capacity)
+async def event_capacity_update(request: Request, event_id: str, capacity: int):
+	result = await repository.update_event_capacity(event_id, capacity)
+	record_audit(request, result.get('event_id'), generate_log_details(result))
+	return result
 
 
 @app.put("/api/events/{event_id}/update_status")
-async def event_status_update(event_id: str, status: str):
-	return update_event_status(event_id, status)
+async def event_status_update(request: Request, event_id: str, status: str):
+	result = await repository.update_event_status(event_id, status)
+	record_audit(request, result.get('event_id'), generate_log_details(result))
+	return result
 
 @app.put("/api/events/{event_id}/update_description")
-async def event_description_update(event_id: str, description: str):
-	return update_event_description(event_id, description)
+async def event_description_update(request: Request, event_id: str, description: str):
+	result = await repository.update_event_description(event_id, description)
+	record_audit(request, result.get('event_id'), generate_log_details(result))
+	return result
 
 @app.put("/api/events/{event_id}/update_tag2")
-async def event_tag2_update(event_id: str, tag_2: str):
-	return update_event_tag2(event_id, tag_2)
+async def event_tag2_update(request: Request, event_id: str, tag_2: str):
+	result = await repository.update_event_tag2(event_id, tag_2)
+	record_audit(request, result.get('event_id'), generate_log_details(result))
+	return result
+
+# update several event attributes in one conditional write
+@app.patch("/api/events/{event_id}")
+async def event_patch(request: Request, event_id: str, changes: EventUpdate):
+	result = await repository.patch_event(event_id, changes.model_dump(exclude_none=True))
+	record_audit(request, result.get('event_id'), generate_log_details(result))
+	return result
 
 # @app.put("/api/events/{event_id}")
 # def event_update(event_id: str, event: Event):
@@ -193,7 +295,7 @@ async def event_tag2_update(event_id: str, tag_2: str):
 # delete an event
 @app.delete("/api/events/{event_id}")
 async def delete_event_route(event_id: str):
-	return delete_event(event_id)
+	return await repository.delete_event(event_id)
 
 # Route for getting a group associated with an event (not for eventservice)
 # @app.get("/api/events/{event_id}/group")
@@ -206,53 +308,78 @@ async def delete_event_route(event_id: str):
 # ===== For Attendee =====
 
 # list events that a user is attending
-@app.get("/api/users/{user_id}/events")
+@app.get("/api/users/{user_id}/events", response_model=List[Event])
 async def list_events(user_id: str):
-	return list_events_by_user_id(user_id)
+	return FastJSONResponse(await repository.list_events_by_user_id(user_id))
+
+# pairs of the user's events that overlap in time
+@app.get("/api/users/{user_id}/conflicts")
+async def list_user_conflicts(user_id: str):
+	return FastJSONResponse(await repository.list_schedule_conflicts(user_id))
 
 # list attendees of an event
-@app.get("/api/events/{event_id}/members")
+@app.get("/api/events/{event_id}/members", response_model=List[str])
 async def read_event_members(event_id: str):
-	members = list_attendees(event_id)
+	members = await repository.list_attendees(event_id)
 	if members:
-		return members
+		return FastJSONResponse(members)
 	raise HTTPException(status_code=404, detail="Members not found")
 
-# add an attendee to an event
+# number of attendees of an event and its capacity, without listing them
+@app.get("/api/events/{event_id}/members/count")
+async def read_event_member_count(event_id: str):
+	count = await repository.get_attendee_count(event_id)
+	if count:
+		return count
+	raise HTTPException(status_code=404, detail="Event not found")
+
+# add an attendee to an event, unless it is full; on_conflict (allow, flag or
+# reject) says what to do when they attend another event at the same time
 @app.post("/api/events/{event_id}/members")
-async def add_an_event_member(event_id: str, user_id: str):
-	return add_event_member(event_id, user_id)
+async def add_an_event_member(event_id: str, user_id: str, on_conflict: Optional[str] = None):
+	return await repository.add_event_member(event_id, user_id, on_conflict)
+
+# add many attendees to an event with batched writes
+@app.post("/api/events/{event_id}/members:batch")
+async def add_event_members_batch(event_id: str, user_ids: List[str]):
+	return await repository.add_event_members(event_id, user_ids)
 
 # delete an attendee of an event
 @app.delete("/api/events/{event_id}/members")
 async def delete_an_event_member(event_id: str, user_id: str):
-	return delete_event_member(event_id, user_id)
+	return await repository.delete_event_member(event_id, user_id)
 
 # ===== For Comment =====
 
 # list all comments of an event
-@app.get("/api/events/{event_id}/comments")
-async def read_event_comments(event_id: str):
-	comments = list_comments_by_event_id(event_id)
-	if comments:
-		return comments
+@app.get("/api/events/{event_id}/comments", response_model=CommentPage)
+async def read_event_comments(event_id: str, limit: int = 10, cursor: Optional[str] = None):
+	comments = await repository.list_comments_by_event_id(event_id, limit, cursor)
+	if comments['items'] or cursor:
+		return FastJSONResponse(comments)
 	raise HTTPException(status_code=404, detail="Comments not found")
 
 # add a comment to an event
 @app.post("/api/events/{event_id}/comments")
 async def add_event_comment(event_id: str, user_id: str, comment: str):
-	return add_comment(event_id, user_id, comment)
+	return await repository.add_comment(event_id, user_id, comment)
+
+# add comments from many users to an event with batched writes
+@app.post("/api/events/{event_id}/comments:batch")
+async def add_event_comments_batch(event_id: str, comments: List[NewComment]):
+	return await repository.add_comments(event_id, [comment.model_dump() for comment in comments])
 
 # update a comment to an event
 @app.put("/api/events/{event_id}/comments")
 async def update_event_comment(comment_id: str, comment: str):
-	return update_comment(comment_id, comment)
+	return await repository.update_comment(comment_id, comment)
 
 # delete a comment to an event
 @app.delete("/api/events/{event_id}/comments")
 async def delete_event_comment(comment_id: str):
-	return delete_comment(comment_id)
+	return await repository.delete_comment(comment_id)
 
 
 if __name__ == "__main__":
+	import uvicorn
 	uvicorn.run(app, host="0.0.0.0", port=8011)
@@ -0,0 +1,162 @@
+from datetime import datetime, timezone
+
+from .batch import batch_get, batch_write
+from .scan import parallel_scan
+from .timekeys import KEY_FORMAT, to_utc_key
+
+# Per-event and per-group summaries (attendee count, comment count, events per
+# group, last activity) in the Aggregate table, kept up to date from the item
+# changes of Event, EventMemberRelation and Comment by the change processor
+# (src/changes.py). Each batch of changes reads the aggregates it touches once
+# and writes them back once.
+COUNTED = {'EventMemberRelation': 'attendee_count', 'Comment': 'comment_count'}
+
+
+def event_key(event_id: str) -> dict:
+	return {'aggregate_id': f'event#{event_id}'}
+
+
+def group_key(group_id: str) -> dict:
+	return {'aggregate_id': f'group#{group_id}'}
+
+
+def checkpoint_key(table_name: str) -> dict:
+	return {'aggregate_id': f'checkpoint#{table_name}'}
+
+
+def new_event_aggregate(event_id: str, group_id: str) -> dict:
+	return dict(event_key(event_id), event_id=event_id, group_id=group_id, attendee_count=0, comment_count=0, last_activity=None)
+
+
+def new_group_aggregate(group_id: str) -> dict:
+	return dict(group_key(group_id), group_id=group_id, event_count=0, attendee_count=0, comment_count=0, last_activity=None)
+
+
+def summary(item: dict) -> dict:
+	return {name: value for name, value in item.items() if name != 'aggregate_id'}
+
+
+def _time_key(at: float) -> str:
+	return datetime.fromtimestamp(at, timezone.utc).strftime(KEY_FORMAT)
+
+
+def _touch(aggregate: dict, at: str):
+	if aggregate is not None and (aggregate.get('last_activity') or '') < at:
+		aggregate['last_activity'] = at
+
+
+class Aggregator:
+	def __init__(self, storage):
+		self.storage = storage
+		self.table = storage.table('Aggregate')
+
+	def _load(self, changes: list):
+		# the aggregates of every event and group the changes touch; events with
+		# no aggregate yet get one from their Event image or item
+		event_ids, group_ids, seeds = set(), set(), {}
+		for change in changes:
+			for image in (change.old, change.new):
+				if image is not None:
+					event_ids.add(image['event_id'])
+					if change.table == 'Event':
+						group_ids.add(image['group_id'])
+						seeds.setdefault(image['event_id'], image['group_id'])
+		events = {item['event_id']: item for item in batch_get(self.table, [event_key(event_id) for event_id in event_ids])}
+		unknown = [event_id for event_id in event_ids if event_id not in events and event_id not in seeds]
+		for item in batch_get(self.storage.table('Event'), [{'event_id': event_id} for event_id in unknown]):
+			seeds[item['event_id']] = item['group_id']
+		for event_id, group_id in seeds.items():
+			if event_id not in events:
+				events[event_id] = new_event_aggregate(event_id, group_id)
+		group_ids.update(aggregate['group_id'] for aggregate in events.values())
+		groups = {item['group_id']: item for item in batch_get(self.table, [group_key(group_id) for group_id in group_ids])}
+		for group_id in group_ids:
+			groups.setdefault(group_id, new_group_aggregate(group_id))
+		return events, groups
+
+	def _apply_event(self, change, events: dict, groups: dict, at: str):
+		event_id = (change.new or change.old)['event_id']
+		aggregate = events.get(event_id)
+		if change.kind == 'REMOVE':
+			if aggregate is not None:
+				group = groups[aggregate['group_id']]
+				group['event_count'] -= 1
+				for name in COUNTED.values():
+					group[name] -= aggregate[name]
+				_touch(group, at)
+			events[event_id] = None
+			return
+		if aggregate is None:
+			aggregate = events[event_id] = new_event_aggregate(event_id, change.new['group_id'])
+		if change.kind == 'INSERT':
+			groups[aggregate['group_id']]['event_count'] += 1
+		elif aggregate['group_id'] != change.new['group_id']:
+			# moved to another group: its counts go along
+			old_group, new_group = groups[aggregate['group_id']], groups[change.new['group_id']]
+			for name in ('event_count',) + tuple(COUNTED.values()):
+				amount = 1 if name == 'event_count' else aggregate[name]
+				old_group[name] -= amount
+				new_group[name] += amount
+			_touch(old_group, at)
+			aggregate['group_id'] = change.new['group_id']
+		_touch(aggregate, at)
+		_touch(groups[aggregate['group_id']], at)
+
+	def apply(self, changes: list) -> int:
+		events, groups = self._load(changes)
+		for change in changes:
+			at = _time_key(change.at)
+			if change.table == 'Event':
+				self._apply_event(change, events, groups, at)
+				continue
+			aggregate = events.get((change.new or change.old)['event_id'])
+			if aggregate is None:
+				# the event is gone; its counts went with it
+				continue
+			group = groups[aggregate['group_id']]
+			amount = {'INSERT': 1, 'REMOVE': -1}.get(change.kind, 0)
+			name = COUNTED[change.table]
+			aggregate[name] += amount
+			group[name] += amount
+			_touch(aggregate, at)
+			_touch(group, at)
+
+		puts = [aggregate for aggregate in events.values() if aggregate is not None] + list(groups.values())
+		deletes = [event_key(event_id) for event_id, aggregate in events.items() if aggregate is None]
+		failed_puts, failed_deletes = batch_write(self.table, puts, deletes)
+		if failed_puts or failed_deletes:
+			raise RuntimeError(f"{len(failed_puts) + len(failed_deletes)} aggregates could not be written")
+		return len(puts) + len(deletes)
+
+
+def rebuild_aggregates(storage) -> int:
+	# recomputes every aggregate from full-table scans, e.g. after enabling the
+	# processor on existing data; run it while the processor is stopped
+	events, groups = {}, {}
+	for event in parallel_scan(storage.table('Event')):
+		events[event['event_id']] = new_event_aggregate(event['event_id'], event['group_id'])
+		group = groups.setdefault(event['group_id'], new_group_aggregate(event['group_id']))
+		group['event_count'] += 1
+	for table_name, name in COUNTED.items():
+		for item in parallel_scan(storage.table(table_name)):
+			aggregate = events.get(item['event_id'])
+			if aggregate is None:
+				continue
+			aggregate[name] += 1
+			groups[aggregate['group_id']][name] += 1
+			if item.get('created_at'):
+				try:
+					at = to_utc_key(item['created_at'])
+				except ValueError:
+					continue
+				_touch(aggregate, at)
+				_touch(groups[aggregate['group_id']], at)
+	# aggregates of events that no longer exist go, and so do the stream
+	# positions: the processor starts again from the newest changes
+	table = storage.table('Aggregate')
+	rebuilt = list(events.values()) + list(groups.values())
+	kept = {aggregate['aggregate_id'] for aggregate in rebuilt}
+	stale = [{'aggregate_id': item['aggregate_id']} for item in parallel_scan(table) if item['aggregate_id'] not in kept]
+	batch_write(table, deletes=stale)
+	failed, _ = batch_write(table, puts=rebuilt)
+	return len(events) + len(groups) - len(failed)
@@ -0,0 +1,163 @@
+import asyncio
+import os
+import time
+
+from . import repository
+from .batch import batch_write
+from .operations import build_log_item
+from .storage import BATCH_WRITE_SIZE
+
+# In-process audit log pipeline: requests only enqueue their log entry, and a
+# background flusher writes entries in BatchWriteItem calls of up to 25 items,
+# as soon as a batch is full or AUDIT_FLUSH_INTERVAL seconds after its first
+# entry arrived. When the queue is full, AUDIT_QUEUE_POLICY decides whether the
+# request waits for room ("block") or the entry is dropped and counted ("drop").
+AUDIT_QUEUE_SIZE = int(os.getenv('AUDIT_QUEUE_SIZE', '10000'))
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', '0.25'))
+AUDIT_QUEUE_POLICY = os.getenv('AUDIT_QUEUE_POLICY', 'drop')
+
+
+class AuditLogWriter:
+	def __init__(self, get_table, batch_size: int = BATCH_WRITE_SIZE, flush_interval: float = AUDIT_FLUSH_INTERVAL,
+			max_queue: int = AUDIT_QUEUE_SIZE, policy: str = AUDIT_QUEUE_POLICY):
+		self.get_table = get_table
+		self.batch_size = batch_size
+		self.flush_interval = flush_interval
+		self.max_queue = max_queue
+		self.policy = policy
+		self._loop = None
+		self._queue = None
+		self._task = None
+		self._counters = {
+			'enqueued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'flushes': 0,
+		}
+		self._flush_total = 0.0
+		self._flush_last = 0.0
+		self._flush_max = 0.0
+
+	def _ensure_started(self):
+		# the queue and flusher belong to the loop that is serving requests
+		loop = asyncio.get_running_loop()
+		if self._loop is not loop:
+			self._loop = loop
+			self._queue = asyncio.Queue(maxsize=self.max_queue)
+			self._task = loop.create_task(self._run())
+
+	async def start(self):
+		self._ensure_started()
+
+	async def enqueue(self, item: dict) -> bool:
+		self._ensure_started()
+		if self.policy == 'block':
+			await self._queue.put(item)
+		else:
+			try:
+				self._queue.put_nowait(item)
+			except asyncio.QueueFull:
+				self._counters['dropped'] += 1
+				return False
+		self._counters['enqueued'] += 1
+		return True
+
+	async def _next_batch(self) -> list:
+		batch = [await self._queue.get()]
+		deadline = self._loop.time() + self.flush_interval
+		while len(batch) < self.batch_size:
+			if not self._queue.empty():
+				batch.append(self._queue.get_nowait())
+				continue
+			remaining = deadline - self._loop.time()
+			if remaining <= 0:
+				break
+			try:
+				batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+			except asyncio.TimeoutError:
+				break
+		return batch
+
+	async def _flush(self, batch: list):
+		start = time.perf_counter()
+		try:
+			failed, _ = await repository.run_storage(batch_write, self.get_table(), batch)
+		except Exception as e:
+			print(f"Audit log flush failed: {e}")
+			failed = batch
+		elapsed = time.perf_counter() - start
+		self._counters['flushes'] += 1
+		self._counters['written'] += len(batch) - len(failed)
+		self._counters['failed'] += len(failed)
+		self._flush_last = elapsed
+		self._flush_max = max(self._flush_max, elapsed)
+		self._flush_total += elapsed
+
+	async def _run(self):
+		while True:
+			batch = await self._next_batch()
+			try:
+				await self._flush(batch)
+			finally:
+				for _ in batch:
+					self._queue.task_done()
+
+	async def stop(self, timeout: float = 10.0):
+		# drain what is queued, then stop the flusher
+		if self._task is None:
+			return
+		try:
+			await asyncio.wait_for(self._queue.join(), timeout)
+		except asyncio.TimeoutError:
+			print(f"Audit log shutdown timed out with {self._queue.qsize()} entries queued")
+		self._task.cancel()
+		try:
+			await self._task
+		except asyncio.CancelledError:
+			pass
+		self._task = None
+		self._loop = None
+
+	def stats(self) -> dict:
+		flushes = self._counters['flushes']
+		return {
+			'queue_depth': self._queue.qsize() if self._queue else 0,
+			'queue_capacity': self.max_queue,
+			'policy': self.policy,
+			**self._counters,
+			'flush_last_ms': round(self._flush_last * 1000, 3),
+			'flush_avg_ms': round(self._flush_total / flushes * 1000, 3) if flushes else 0.0,
+			'flush_max_ms': round(self._flush_max * 1000, 3),
+		}
+
+
+def record_audit(request, event_id: str, details: str):
+	# called by route handlers that changed data; AuditMiddleware picks the entries up
+	entry = build_log_item(event_id, f"{request.method} {request.url}", details)
+	logs = getattr(request.state, 'audit_logs', None)
+	if logs is None:
+		request.state.audit_logs = logs = []
+	logs.append(entry)
+
+
+class AuditMiddleware:
+	# Pure ASGI middleware: once a response starts, the entries its handler put on
+	# request.state.audit_logs are handed to the writer. The response body is
+	# passed through untouched, and read-only requests skip the middleware.
+	AUDITED_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+	def __init__(self, app, writer: AuditLogWriter):
+		self.app = app
+		self.writer = writer
+
+	async def __call__(self, scope, receive, send):
+		if scope['type'] != 'http' or scope['method'] not in self.AUDITED_METHODS:
+			await self.app(scope, receive, send)
+			return
+
+		state = scope.setdefault('state', {})
+
+		async def send_with_audit(message):
+			if message['type'] == 'http.response.start':
+				for entry in state.pop('audit_logs', ()):
+					await self.writer.enqueue(entry)
+			await send(message)
+
+		await self.app(scope, receive, send_with_audit)
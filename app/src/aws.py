@@ -0,0 +1,83 @@
+import os
+import threading
+
+# One place that creates boto3 clients and resources, all with the same tuned
+# botocore settings and created on first use. Clients are thread-safe and shared
+# by every caller; resources are not, so each thread gets its own:
+#   AWS_REGION                 default region (us-east-2)
+#   AWS_MAX_POOL_CONNECTIONS   HTTP connections kept per client (botocore default: 10)
+#   AWS_CONNECT_TIMEOUT        seconds to open a connection
+#   AWS_READ_TIMEOUT           seconds to wait for a response
+#   AWS_MAX_ATTEMPTS           attempts per call, including the first
+#   AWS_RETRY_MODE             legacy, standard or adaptive (client-side rate limiting)
+#   AWS_TCP_KEEPALIVE          1 to keep idle pooled connections alive
+# The pool should be at least as large as the number of threads calling AWS at
+# once, or connections beyond it are closed after each burst and reopened.
+settings = {
+	'region_name': os.getenv('AWS_REGION', 'us-east-2'),
+	'max_pool_connections': int(os.getenv('AWS_MAX_POOL_CONNECTIONS', '100')),
+	'connect_timeout': float(os.getenv('AWS_CONNECT_TIMEOUT', '2')),
+	'read_timeout': float(os.getenv('AWS_READ_TIMEOUT', '5')),
+	'max_attempts': int(os.getenv('AWS_MAX_ATTEMPTS', '5')),
+	'retry_mode': os.getenv('AWS_RETRY_MODE', 'adaptive'),
+	'tcp_keepalive': os.getenv('AWS_TCP_KEEPALIVE', '1') == '1',
+}
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+# per thread: (service, region) -> resource
+_resources = threading.local()
+
+
+def configure(**overrides):
+	# changes settings; clients created before are dropped and rebuilt on next use
+	global _session, _resources
+	with _lock:
+		settings.update(overrides)
+		_session = None
+		_clients.clear()
+		_resources = threading.local()
+
+
+def client_config():
+	from botocore.config import Config
+	return Config(
+		max_pool_connections=settings['max_pool_connections'],
+		connect_timeout=settings['connect_timeout'],
+		read_timeout=settings['read_timeout'],
+		retries={'total_max_attempts': settings['max_attempts'], 'mode': settings['retry_mode']},
+		tcp_keepalive=settings['tcp_keepalive'],
+	)
+
+
+def _get_session():
+	# boto3 sessions are not thread-safe; callers hold _lock
+	global _session
+	if _session is None:
+		import boto3
+		_session = boto3.session.Session()
+	return _session
+
+
+def get_client(service: str, region_name: str = None):
+	key = (service, region_name or settings['region_name'])
+	client = _clients.get(key)
+	if client is None:
+		with _lock:
+			client = _clients.get(key)
+			if client is None:
+				client = _clients[key] = _get_session().client(service, region_name=key[1], config=client_config())
+	return client
+
+
+def get_resource(service: str, region_name: str = None):
+	key = (service, region_name or settings['region_name'])
+	resources = getattr(_resources, 'by_key', None)
+	if resources is None:
+		resources = _resources.by_key = {}
+	resource = resources.get(key)
+	if resource is None:
+		with _lock:
+			resource = resources[key] = _get_session().resource(service, region_name=key[1], config=client_config())
+	return resource
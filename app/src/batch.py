@@ -0,0 +1,138 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from .storage import BATCH_GET_SIZE, BATCH_WRITE_SIZE, Storage, Table
+
+# Batched storage reads and writes: requests are split into BatchGetItem /
+# BatchWriteItem sized chunks that run in parallel, and anything DynamoDB leaves
+# unprocessed (throttling, response size caps) is retried with exponential backoff.
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', '8'))
+BATCH_MAX_ATTEMPTS = int(os.getenv('BATCH_MAX_ATTEMPTS', '6'))
+BATCH_BASE_DELAY = 0.05
+
+_executor = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+	# separate from the request storage pool so fan-out never waits on its own caller
+	global _executor
+	if _executor is None:
+		_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+	return _executor
+
+
+def chunked(items: list, size: int) -> List[list]:
+	return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _backoff(attempt: int):
+	if attempt:
+		time.sleep(BATCH_BASE_DELAY * (2 ** (attempt - 1)))
+
+
+def _get_chunk(table: Table, keys: List[dict]) -> List[dict]:
+	found = []
+	for attempt in range(BATCH_MAX_ATTEMPTS):
+		_backoff(attempt)
+		items, keys = table.batch_get_items(keys)
+		found.extend(items)
+		if not keys:
+			return found
+	raise RuntimeError(f"{len(keys)} keys still unprocessed after {BATCH_MAX_ATTEMPTS} attempts")
+
+
+def _key_of(table: Table, item: dict) -> tuple:
+	return tuple(item.get(name) for name in table.schema.key_attributes())
+
+
+def _unique(table: Table, requests: list, key=lambda request: request) -> list:
+	# BatchGetItem and BatchWriteItem reject a request naming one key twice; of
+	# repeated keys the last request is kept, as if they were made one by one
+	by_key = {}
+	for request in requests:
+		item_key = _key_of(table, key(request))
+		by_key.pop(item_key, None)
+		by_key[item_key] = request
+	return list(by_key.values())
+
+
+def batch_get(table: Table, keys: List[dict]) -> List[dict]:
+	# returns the items that exist, in no particular order
+	chunks = chunked(_unique(table, keys), BATCH_GET_SIZE)
+	if len(chunks) <= 1:
+		return _get_chunk(table, chunks[0]) if chunks else []
+	results = _get_executor().map(lambda chunk: _get_chunk(table, chunk), chunks)
+	return [item for items in results for item in items]
+
+
+def _write_chunk(table: Table, puts: List[dict], deletes: List[dict]) -> Tuple[List[dict], List[dict]]:
+	try:
+		for attempt in range(BATCH_MAX_ATTEMPTS):
+			_backoff(attempt)
+			puts, deletes = table.batch_write_items(puts, deletes)
+			if not puts and not deletes:
+				break
+	except Exception as e:
+		print(f"Batch write to {table.name} failed: {e}")
+	return puts, deletes
+
+
+def batch_write(table: Table, puts: List[dict] = (), deletes: List[dict] = ()) -> Tuple[List[dict], List[dict]]:
+	# returns the puts and delete keys that could not be written
+	requests = _unique(table, [('put', item) for item in puts] + [('delete', key) for key in deletes], key=lambda request: request[1])
+	chunks = [
+		([item for kind, item in chunk if kind == 'put'], [key for kind, key in chunk if kind == 'delete'])
+		for chunk in chunked(requests, BATCH_WRITE_SIZE)
+	]
+	if len(chunks) <= 1:
+		results = [_write_chunk(table, *chunks[0])] if chunks else []
+	else:
+		results = _get_executor().map(lambda chunk: _write_chunk(table, *chunk), chunks)
+	failed_puts, failed_deletes = [], []
+	for left_puts, left_deletes in results:
+		failed_puts += left_puts
+		failed_deletes += left_deletes
+	return failed_puts, failed_deletes
+
+
+def _transact_group(storage: Storage, puts: List[tuple]) -> bool:
+	error = None
+	for attempt in range(BATCH_MAX_ATTEMPTS):
+		_backoff(attempt)
+		try:
+			storage.transact_write(puts)
+			return True
+		except Exception as e:
+			error = e
+	print(f"Transaction of {len(puts)} items failed: {error}")
+	return False
+
+
+def transact_groups(storage: Storage, groups: List[List[tuple]]) -> List[bool]:
+	# each group of (table name, item) puts is one all-or-nothing transaction;
+	# groups run in parallel and the result says which of them were written
+	if len(groups) <= 1:
+		return [_transact_group(storage, group) for group in groups]
+	return list(_get_executor().map(lambda group: _transact_group(storage, group), groups))
+
+
+class CapacityLimiter:
+	# keeps the capacity units counted by `consumed` (e.g. a storage's
+	# write_capacity) at or below `rate` per second from the limiter's creation
+	def __init__(self, consumed: Callable[[], float], rate: Optional[float]):
+		self.consumed = consumed
+		self.rate = rate
+		self.start = time.monotonic()
+		self.baseline = consumed()
+
+	def used(self) -> float:
+		return self.consumed() - self.baseline
+
+	def wait(self):
+		if not self.rate:
+			return
+		delay = self.start + self.used() / self.rate - time.monotonic()
+		if delay > 0:
+			time.sleep(delay)
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+# marks a cached "does not exist" answer
+_MISSING = object()
+
+
+class TTLCache:
+	# Thread-safe LRU cache with per-entry expiry. Misses can be cached too
+	# (negative caching) with their own, usually shorter, TTL. A load that races
+	# with an invalidation is not stored, so a write is never hidden by the
+	# stale read that was in flight when it happened.
+
+	def __init__(self, max_size: int = 10000, ttl: float = 30.0, negative_ttl: float = 5.0):
+		self.max_size = max_size
+		self.ttl = ttl
+		self.negative_ttl = negative_ttl
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		self._generation = 0
+		self._counters = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+	def _lookup(self, key):
+		entry = self._entries.get(key)
+		if entry is None:
+			return None
+		value, expires = entry
+		if expires < time.monotonic():
+			del self._entries[key]
+			return None
+		self._entries.move_to_end(key)
+		return entry
+
+	def _store(self, key, value):
+		ttl = self.negative_ttl if value is _MISSING else self.ttl
+		if ttl <= 0:
+			return
+		self._entries[key] = (value, time.monotonic() + ttl)
+		self._entries.move_to_end(key)
+		while len(self._entries) > self.max_size:
+			self._entries.popitem(last=False)
+			self._counters['evictions'] += 1
+
+	def get_or_load(self, key, load):
+		# returns the cached value, or calls load() (None meaning "missing") and caches its result
+		with self._lock:
+			entry = self._lookup(key)
+			if entry is not None:
+				if entry[0] is _MISSING:
+					self._counters['negative_hits'] += 1
+					return None
+				self._counters['hits'] += 1
+				return entry[0]
+			self._counters['misses'] += 1
+			generation = self._generation
+
+		value = load()
+		with self._lock:
+			if generation == self._generation:
+				self._store(key, _MISSING if value is None else value)
+		return value
+
+	def get(self, key):
+		# the cached value, or None; never loads
+		with self._lock:
+			entry = self._lookup(key)
+			return None if entry is None or entry[0] is _MISSING else entry[0]
+
+	def put(self, key, value):
+		with self._lock:
+			self._generation += 1
+			self._store(key, value)
+
+	def invalidate(self, key):
+		with self._lock:
+			self._generation += 1
+			self._counters['invalidations'] += 1
+			self._entries.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._generation += 1
+			self._entries.clear()
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {'size': len(self._entries), 'max_size': self.max_size, **self._counters}
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+
+from . import repository
+from .aggregates import Aggregator, checkpoint_key
+from .batch import batch_get, batch_write
+
+# Background consumer of item changes: DynamoDB Streams in production, the local
+# engines' change feeds otherwise. Changes of CHANGE_TABLES are read in batches
+# of up to CHANGE_BATCH_SIZE per table and folded into the Aggregate table.
+#
+# The processor is the only writer of that table and should run on one instance
+# (CHANGE_PROCESSOR=0 turns it off elsewhere). Stream positions are saved after
+# each batch, so a restart continues where it stopped. A batch is applied once:
+# if saving the positions fails, only the save is retried before reading on.
+# A crash (or restart) between writing a batch and saving the positions applies
+# that batch twice, which rebuild_aggregates repairs.
+CHANGE_TABLES = ['Event', 'EventMemberRelation', 'Comment']
+CHANGE_POLL_INTERVAL = float(os.getenv('CHANGE_POLL_INTERVAL', '1.0'))
+CHANGE_BATCH_SIZE = int(os.getenv('CHANGE_BATCH_SIZE', '500'))
+
+
+class ChangeProcessor:
+	def __init__(self, get_storage, tables: list = CHANGE_TABLES, poll_interval: float = CHANGE_POLL_INTERVAL,
+			batch_size: int = CHANGE_BATCH_SIZE):
+		self.get_storage = get_storage
+		self.tables = tables
+		self.poll_interval = poll_interval
+		self.batch_size = batch_size
+		self._readers = None
+		self._aggregator = None
+		self._pending = None
+		# positions read past a batch that was applied but not saved yet
+		self._unsaved = False
+		self._task = None
+		self._counters = {'changes': 0, 'batches': 0, 'aggregates_written': 0, 'errors': 0}
+		self._lag = 0.0
+		self._apply_last = 0.0
+
+	async def start(self):
+		if self._task is None:
+			storage = self.get_storage()
+			for table_name in self.tables:
+				storage.enable_stream(table_name)
+			self._task = asyncio.get_running_loop().create_task(self._run())
+
+	def _open(self):
+		storage = self.get_storage()
+		self._aggregator = Aggregator(storage)
+		positions = {
+			item['aggregate_id'].split('#', 1)[1]: item['position']
+			for item in batch_get(self._aggregator.table, [checkpoint_key(table_name) for table_name in self.tables])
+		}
+		return [storage.change_reader(table_name, positions.get(table_name)) for table_name in self.tables]
+
+	def _read(self):
+		# in table order, so an event's insert is applied before changes to its members and comments
+		changes, more = [], False
+		for reader in self._readers:
+			batch = reader.read(self.batch_size)
+			changes += batch
+			more = more or len(batch) >= self.batch_size
+		return changes, more
+
+	def _save_positions(self):
+		checkpoints = [dict(checkpoint_key(table_name), position=reader.position) for table_name, reader in zip(self.tables, self._readers)]
+		failed, _ = batch_write(self._aggregator.table, puts=checkpoints)
+		if failed:
+			raise RuntimeError(f"{len(failed)} stream positions could not be saved")
+
+	async def process_once(self) -> bool:
+		# applies one batch of changes from every table; returns True when more are waiting
+		if self._readers is None:
+			self._readers = await repository.run_storage(self._open)
+		if self._unsaved:
+			await repository.run_storage(self._save_positions)
+			self._unsaved = False
+		if self._pending is None:
+			# a batch that failed to apply is tried again before reading on
+			self._pending = await repository.run_storage(self._read)
+		changes, more = self._pending
+		if changes:
+			start = time.perf_counter()
+			written = await repository.run_storage(self._aggregator.apply, changes)
+			# applied: from here on only the positions are retried, never the counts
+			self._pending = None
+			self._unsaved = True
+			self._apply_last = time.perf_counter() - start
+			self._lag = max(time.time() - min(change.at for change in changes), 0.0)
+			self._counters['changes'] += len(changes)
+			self._counters['batches'] += 1
+			self._counters['aggregates_written'] += written
+			await repository.run_storage(self._save_positions)
+			self._unsaved = False
+		else:
+			self._lag = 0.0
+			self._pending = None
+		return more
+
+	async def _run(self):
+		while True:
+			try:
+				more = await self.process_once()
+			except Exception as e:
+				print(f"Change processing failed: {e}")
+				self._counters['errors'] += 1
+				more = False
+			if not more:
+				await asyncio.sleep(self.poll_interval)
+
+	async def stop(self, timeout: float = 10.0):
+		# apply the changes already made, then stop
+		if self._task is None:
+			return
+		self._task.cancel()
+		try:
+			await self._task
+		except asyncio.CancelledError:
+			pass
+		self._task = None
+		try:
+			deadline = time.monotonic() + timeout
+			while await self.process_once() and time.monotonic() < deadline:
+				pass
+		except Exception as e:
+			print(f"Change processing at shutdown failed: {e}")
+
+	def stats(self) -> dict:
+		return {
+			**self._counters,
+			'lag_seconds': round(self._lag, 3),
+			'apply_last_ms': round(self._apply_last * 1000, 3),
+		}
@@ -0,0 +1,60 @@
+import csv
+import io
+import itertools
+import os
+from decimal import Decimal
+from typing import Iterable, Iterator, List
+
+from .pagination import json_default
+from .serialization import dumps
+
+# Bulk exports are written out as the storage pages arrive: rows are encoded
+# EXPORT_BATCH at a time, so memory use does not grow with the export size.
+EXPORT_BATCH = int(os.getenv('EXPORT_BATCH', '500'))
+
+FORMATS = {
+	'ndjson': 'application/x-ndjson',
+	'csv': 'text/csv',
+}
+
+
+class ExportError(ValueError):
+	pass
+
+
+def media_type(export_format: str) -> str:
+	if export_format not in FORMATS:
+		raise ExportError(f"Unknown format: {export_format}, use one of {', '.join(FORMATS)}")
+	return FORMATS[export_format]
+
+
+def _cell(value):
+	if isinstance(value, (dict, list)):
+		return dumps(value).decode()
+	if isinstance(value, Decimal):
+		return json_default(value)
+	return value
+
+
+def encode(items: Iterable[dict], export_format: str, fields: List[str]) -> Iterator[str]:
+	# NDJSON: one JSON object per line. CSV: a header row of `fields`, then one
+	# row per item (other attributes are left out, missing ones are empty)
+	items = iter(items)
+	buffer = io.StringIO()
+	writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore') if export_format == 'csv' else None
+	if writer:
+		writer.writeheader()
+	while True:
+		batch = list(itertools.islice(items, EXPORT_BATCH))
+		if not batch:
+			break
+		if writer:
+			writer.writerows({name: _cell(value) for name, value in item.items()} for item in batch)
+		else:
+			buffer.write(b'\n'.join(dumps(item) for item in batch).decode())
+			buffer.write('\n')
+		yield buffer.getvalue()
+		buffer.seek(0)
+		buffer.truncate()
+	if buffer.tell():
+		yield buffer.getvalue()
@@ -1,12 +1,27 @@
 # Import necessary libraries and models
-import boto3
-from models import Event, Group, Comment, EventMemberRelation, EventsLog
-import pandas as pd
+import os, sys, time
+
+# the app directory, so everything is imported from the src package: importing
+# a module both as `aws` and as `src.aws` would load two copies of it, each with
+# its own settings and clients
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.aws import get_resource, settings
+from src.models import Event, Group, Comment, EventMemberRelation, EventsLog, comment_id_for
+from src.timekeys import event_time_attributes, to_utc_key
+from src.aggregates import rebuild_aggregates
+from src.scan import parallel_scan, scan_all
+from src.schedules import event_interval
+from src.storage import TABLES, TableSchema, create_storage
 
 # Initialize DynamoDB Client
-dynamodb = boto3.resource('dynamodb', region_name='us-east-2')
+dynamodb = get_resource('dynamodb')
 
-tables_to_delete = ["Event", "Group", "Comment", "EventMemberRelation", "EventsLog"]
+tables_to_delete = ["Event", "Group", "Comment", "EventMemberRelation", "EventsLog", "EventsLogV2", "Outbox", "Aggregate"]
+# tables created by create_tables
+service_tables = ["Event", "Group", "Comment", "EventMemberRelation", "EventsLogV2", "Outbox", "Aggregate"]
+# tables whose item changes feed the Aggregate table
+streamed_tables = ["Event", "Comment", "EventMemberRelation"]
+stream_specification = {'StreamEnabled': True, 'StreamViewType': 'NEW_AND_OLD_IMAGES'}
 
 # Function to delete a table
 def delete_table(table_name):
@@ -20,91 +35,229 @@ def delete_table(table_name):
 		# Handle exceptions
 		print(f"Error deleting table {table_name}: {e}")
 
-# Delete each table in the list
-for table_name in tables_to_delete:
-	delete_table(table_name)
-
 # Function to create a DynamoDB table
-def create_table(name, key_schema, attribute_definitions, read_capacity_units=1, write_capacity_units=1):
+def create_table(name, key_schema, attribute_definitions, read_capacity_units=1, write_capacity_units=1, global_secondary_indexes=None, wait=True, stream=False):
+	throughput = {
+		'ReadCapacityUnits': read_capacity_units,
+		'WriteCapacityUnits': write_capacity_units
+	}
+	options = {}
+	if global_secondary_indexes:
+		options['GlobalSecondaryIndexes'] = [
+			{
+				'IndexName': index_name,
+				'KeySchema': index_key_schema,
+				'Projection': {'ProjectionType': 'ALL'},
+				'ProvisionedThroughput': throughput
+			}
+			for index_name, index_key_schema in global_secondary_indexes
+		]
+	if stream:
+		options['StreamSpecification'] = stream_specification
 	try:
 		table = dynamodb.create_table(
 			TableName=name,
 			KeySchema=key_schema,
 			AttributeDefinitions=attribute_definitions,
-			ProvisionedThroughput={
-				'ReadCapacityUnits': read_capacity_units,
-				'WriteCapacityUnits': write_capacity_units
-			}
+			ProvisionedThroughput=throughput,
+			**options
 		)
-		table.meta.client.get_waiter('table_exists').wait(TableName=name)
+		if wait:
+			table.meta.client.get_waiter('table_exists').wait(TableName=name)
 		print(f"Table {name} created successfully.")
+	except dynamodb.meta.client.exceptions.ResourceInUseException:
+		print(f"Table {name} already exists.")
 	except Exception as e:
 		print(f"Error creating table {name}: {e}")
 
-# Event Table
-create_table(
-	name="Event",
-	key_schema=[{'AttributeName': 'event_id', 'KeyType': 'HASH'}],  
-	attribute_definitions=[{'AttributeName': 'event_id', 'AttributeType': 'S'}]
-)
-
-# Group Table
-create_table(
-	name="Group",
-	key_schema=[{'AttributeName': 'group_id', 'KeyType': 'HASH'}], 
-	attribute_definitions=[{'AttributeName': 'group_id', 'AttributeType': 'S'}]
-)
-
-# Comment Table
-create_table(
-	name="Comment",
-	key_schema=[{'AttributeName': 'comment_id', 'KeyType': 'HASH'}],  
-	attribute_definitions=[{'AttributeName': 'comment_id', 'AttributeType': 'S'}]
-)
-
-# EventMemberRelation Table 
-create_table(
-	name="EventMemberRelation",
-	key_schema=[{'AttributeName': 'event_id', 'KeyType': 'HASH'}, {'AttributeName': 'user_id', 'KeyType': 'RANGE'}], 
-	attribute_definitions=[{'AttributeName': 'event_id', 'AttributeType': 'S'},  {'AttributeName': 'user_id', 'AttributeType': 'S'}]
-)
-
-# EventsLog Table
-create_table(
-	name="EventsLog",
-	key_schema=[{'AttributeName': 'log_id', 'KeyType': 'HASH'}],
-	attribute_definitions=[{'AttributeName': 'log_id', 'AttributeType': 'S'}]
-)
+def create_events_log_table(wait=True):
+	# EventsLogV2 Table: one partition per event, sorted by "<UTC timestamp>#<log_id>",
+	# plus a feed index holding every entry in time order
+	create_table(
+		name="EventsLogV2",
+		wait=wait,
+		key_schema=[{'AttributeName': 'event_id', 'KeyType': 'HASH'}, {'AttributeName': 'log_key', 'KeyType': 'RANGE'}],
+		attribute_definitions=[
+			{'AttributeName': 'event_id', 'AttributeType': 'S'},
+			{'AttributeName': 'log_key', 'AttributeType': 'S'},
+			{'AttributeName': 'feed', 'AttributeType': 'S'}
+		],
+		global_secondary_indexes=[
+			('feed-log_key-index', [{'AttributeName': 'feed', 'KeyType': 'HASH'}, {'AttributeName': 'log_key', 'KeyType': 'RANGE'}])
+		]
+	)
+
+def create_outbox_table(wait=True):
+	# Outbox Table: notifications waiting to be published, indexed by status and due time
+	create_table(
+		name="Outbox",
+		wait=wait,
+		key_schema=[{'AttributeName': 'message_id', 'KeyType': 'HASH'}],
+		attribute_definitions=[
+			{'AttributeName': 'message_id', 'AttributeType': 'S'},
+			{'AttributeName': 'status', 'AttributeType': 'S'},
+			{'AttributeName': 'available_at', 'AttributeType': 'S'}
+		],
+		global_secondary_indexes=[
+			('status-available_at-index', [{'AttributeName': 'status', 'KeyType': 'HASH'}, {'AttributeName': 'available_at', 'KeyType': 'RANGE'}])
+		]
+	)
+
+def create_aggregate_table(wait=True):
+	# Aggregate Table: per-event and per-group summaries kept by the change processor
+	create_table(
+		name="Aggregate",
+		wait=wait,
+		key_schema=[{'AttributeName': 'aggregate_id', 'KeyType': 'HASH'}],
+		attribute_definitions=[{'AttributeName': 'aggregate_id', 'AttributeType': 'S'}]
+	)
+
+def enable_streams():
+	# turn on NEW_AND_OLD_IMAGES streams on existing tables
+	client = dynamodb.meta.client
+	for table_name in streamed_tables:
+		description = client.describe_table(TableName=table_name)['Table']
+		if description.get('StreamSpecification', {}).get('StreamEnabled'):
+			print(f"Stream on {table_name} already enabled.")
+			continue
+		try:
+			client.update_table(TableName=table_name, StreamSpecification=stream_specification)
+			client.get_waiter('table_exists').wait(TableName=table_name)
+			print(f"Stream on {table_name} enabled.")
+		except Exception as e:
+			print(f"Error enabling stream on {table_name}: {e}")
+
+# a group's events by UTC time key
+group_index = ('group_id-time_key-index', [{'AttributeName': 'group_id', 'KeyType': 'HASH'}, {'AttributeName': 'time_key', 'KeyType': 'RANGE'}])
+# upcoming events of a status, one partition per "<status>#<YYYY-MM>", by UTC time key
+upcoming_index = ('status_month-time_key-index', [{'AttributeName': 'status_month', 'KeyType': 'HASH'}, {'AttributeName': 'time_key', 'KeyType': 'RANGE'}])
+
+# an event's comments by creation time
+comment_index = ('event_id-created_at-index', [{'AttributeName': 'event_id', 'KeyType': 'HASH'}, {'AttributeName': 'created_at', 'KeyType': 'RANGE'}])
+
+def wait_for_index(table_name, index_name):
+	# DynamoDB builds one new index of a table at a time
+	client = dynamodb.meta.client
+	while True:
+		indexes = client.describe_table(TableName=table_name)['Table'].get('GlobalSecondaryIndexes', [])
+		if all(index.get('IndexStatus') == 'ACTIVE' for index in indexes if index['IndexName'] == index_name):
+			return
+		time.sleep(10)
+
+def create_index(table_name, index):
+	# add an index to an existing table and wait until DynamoDB has filled it
+	index_name, key_schema = index
+	client = dynamodb.meta.client
+	indexes = client.describe_table(TableName=table_name)['Table'].get('GlobalSecondaryIndexes', [])
+	if any(index['IndexName'] == index_name for index in indexes):
+		print(f"Index {index_name} already exists.")
+		wait_for_index(table_name, index_name)
+		return
+	try:
+		client.update_table(
+			TableName=table_name,
+			AttributeDefinitions=[{'AttributeName': key['AttributeName'], 'AttributeType': 'S'} for key in key_schema],
+			GlobalSecondaryIndexUpdates=[{'Create': {
+				'IndexName': index_name,
+				'KeySchema': key_schema,
+				'Projection': {'ProjectionType': 'ALL'},
+				'ProvisionedThroughput': {'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+			}}]
+		)
+		print(f"Index {index_name} is being created.")
+		wait_for_index(table_name, index_name)
+		print(f"Index {index_name} is ready.")
+	except Exception as e:
+		print(f"Error creating index {index_name}: {e}")
+
+def create_tables(wait=True):
+	# Event Table
+	create_table(
+		name="Event",
+		wait=wait,
+		stream=True,
+		key_schema=[{'AttributeName': 'event_id', 'KeyType': 'HASH'}],  
+		attribute_definitions=[
+			{'AttributeName': 'event_id', 'AttributeType': 'S'},
+			{'AttributeName': 'group_id', 'AttributeType': 'S'},
+			{'AttributeName': 'status_month', 'AttributeType': 'S'},
+			{'AttributeName': 'time_key', 'AttributeType': 'S'}
+		],
+		global_secondary_indexes=[
+			group_index,
+			upcoming_index
+		]
+	)
+
+	# Group Table
+	create_table(
+		name="Group",
+		wait=wait,
+		key_schema=[{'AttributeName': 'group_id', 'KeyType': 'HASH'}], 
+		attribute_definitions=[{'AttributeName': 'group_id', 'AttributeType': 'S'}]
+	)
+
+	# Comment Table
+	create_table(
+		name="Comment",
+		wait=wait,
+		stream=True,
+		key_schema=[{'AttributeName': 'comment_id', 'KeyType': 'HASH'}],  
+		attribute_definitions=[
+			{'AttributeName': 'comment_id', 'AttributeType': 'S'},
+			{'AttributeName': 'event_id', 'AttributeType': 'S'},
+			{'AttributeName': 'created_at', 'AttributeType': 'S'}
+		],
+		global_secondary_indexes=[
+			comment_index
+		]
+	)
+
+	# EventMemberRelation Table 
+	create_table(
+		name="EventMemberRelation",
+		wait=wait,
+		stream=True,
+		key_schema=[{'AttributeName': 'event_id', 'KeyType': 'HASH'}, {'AttributeName': 'user_id', 'KeyType': 'RANGE'}], 
+		attribute_definitions=[{'AttributeName': 'event_id', 'AttributeType': 'S'},  {'AttributeName': 'user_id', 'AttributeType': 'S'}],
+		global_secondary_indexes=[
+			('user_id-event_id-index', [{'AttributeName': 'user_id', 'KeyType': 'HASH'}, {'AttributeName': 'event_id', 'KeyType': 'RANGE'}])
+		]
+	)
+	create_events_log_table(wait=wait)
+	create_outbox_table(wait=wait)
+	create_aggregate_table(wait=wait)
+
+
+def ensure_tables():
+	# Create the tables that are missing and leave existing ones and their data
+	# alone. Safe to run on every deploy, as its own step before servers start;
+	# all tables are created at once and waited for together.
+	create_tables(wait=False)
+	waiter = dynamodb.meta.client.get_waiter('table_exists')
+	for table_name in service_tables:
+		waiter.wait(TableName=table_name)
+
+
+def reset_tables():
+	# Delete each table in the list, then create them again
+	for table_name in tables_to_delete:
+		delete_table(table_name)
+	create_tables()
 
 
 # Function to Load Data into DynamoDB
 def load_data_to_dynamodb(table_name, data):
-	table = dynamodb.Table(table_name)
-	for item in data:
-		table.put_item(Item=item.model_dump())
+	with dynamodb.Table(table_name).batch_writer() as batch:
+		for item in data:
+			batch.put_item(Item=item.model_dump())
 
 def load_event_to_dynamodb(csv_file):
-    table = dynamodb.Table("Event")
-    event_data = pd.read_csv(csv_file)
-    event_data = event_data.fillna('')
-    for _, row in event_data.iterrows():
-        event = Event(
-            event_id=row['event_id'],
-            status=row['status'],
-            capacity=row['capacity'],
-            event_name=row['event_name'],
-            description=row['description'],
-            location=row['location'],
-            time=row['time'],
-            # group_id=row.get('group_id', ''),
-            group_id='101',
-            organizer_id=row.get('organizer_id', ''),
-            tag_1=row['tag_1'],
-            tag_2=row.get('tag_2', ''),
-            duration=row['duration']
-        )
-        table.put_item(Item=event.model_dump())
-		
+	# streamed, validated and written in parallel batches by the bulk loader
+	from src.loader import load_file
+	result = load_file(csv_file, "Event", overrides={'group_id': '101'})
+	print(f"Loaded {result['written']} events ({result['rejected']} rejected, {result['failed']} failed).")
+
 
 groups = [
 	Group(group_id="101", name="Group 1", description="Description for Group 1"),
@@ -116,11 +269,11 @@ groups = [
 
 
 comments = [
-	Comment(comment_id="1", event_id="fcf5e56d-ebe5-4e5d-8cfb-7c9d271bcfa3", text="Great event!", user_id="1"),
-	Comment(comment_id="2", event_id="fcf5e56d-ebe5-4e5d-8cfb-7c9d271bcfa3", text="Really enjoyed it.", user_id="2"),
-	Comment(comment_id="3", event_id="6abcc4ed-96e2-4aa3-9dca-92e0e0844b42", text="Looking forward to the next one.", user_id="3"),
-	Comment(comment_id="4", event_id="6abcc4ed-96e2-4aa3-9dca-92e0e0844b42", text="Had a great time.", user_id="4"),
-	Comment(comment_id="5", event_id="6527fac9-46e9-4abd-bcc3-2bdef0e8cea4", text="Wonderful experience.", user_id="5"),
+	Comment(comment_id=comment_id_for("fcf5e56d-ebe5-4e5d-8cfb-7c9d271bcfa3", "1"), event_id="fcf5e56d-ebe5-4e5d-8cfb-7c9d271bcfa3", text="Great event!", user_id="1", created_at="2023-11-10T09:00:00"),
+	Comment(comment_id=comment_id_for("fcf5e56d-ebe5-4e5d-8cfb-7c9d271bcfa3", "2"), event_id="fcf5e56d-ebe5-4e5d-8cfb-7c9d271bcfa3", text="Really enjoyed it.", user_id="2", created_at="2023-11-10T09:05:00"),
+	Comment(comment_id=comment_id_for("6abcc4ed-96e2-4aa3-9dca-92e0e0844b42", "3"), event_id="6abcc4ed-96e2-4aa3-9dca-92e0e0844b42", text="Looking forward to the next one.", user_id="3", created_at="2023-11-11T10:00:00"),
+	Comment(comment_id=comment_id_for("6abcc4ed-96e2-4aa3-9dca-92e0e0844b42", "4"), event_id="6abcc4ed-96e2-4aa3-9dca-92e0e0844b42", text="Had a great time.", user_id="4", created_at="2023-11-11T10:30:00"),
+	Comment(comment_id=comment_id_for("6527fac9-46e9-4abd-bcc3-2bdef0e8cea4", "5"), event_id="6527fac9-46e9-4abd-bcc3-2bdef0e8cea4", text="Wonderful experience.", user_id="5", created_at="2023-11-12T12:00:00"),
 ]
 
 event_member_relations = [
@@ -132,12 +285,18 @@ event_member_relations = [
 ]
 
 
-def scan_all_events():
-	table = dynamodb.Table('Event')
+# Storage view of the tables for full-table reads, which go through the parallel
+# scan; it includes the old EventsLog table so it can be migrated
+storage = create_storage('dynamodb', region_name=settings['region_name'], schemas={
+	**TABLES,
+	'EventsLog': TableSchema(name='EventsLog', hash_key='log_id'),
+})
 
+
+def scan_all_events():
 	try:
-		response = table.scan()
-		items = response.get('Items', [])
+		# every page of every segment, not just the first 1 MB
+		items = scan_all(storage.table('Event'))
 		if items:
 			return items
 		else:
@@ -146,13 +305,163 @@ def scan_all_events():
 		return f"Error scanning table: {e}"
 
 
+# Copy the old EventsLog table (keyed by log_id) into EventsLogV2. The old table
+# is left in place; delete it once the service runs on EventsLogV2.
+def migrate_events_log(source_name="EventsLog"):
+	target = dynamodb.Table("EventsLogV2")
+	copied, skipped = 0, 0
+	with target.batch_writer() as batch:
+		for item in parallel_scan(storage.table(source_name)):
+			if not item.get('event_id') or not item.get('timestamp'):
+				skipped += 1
+				continue
+			item['timestamp'] = to_utc_key(item['timestamp'])
+			item['log_key'] = f"{item['timestamp']}#{item['log_id']}"
+			item['feed'] = 'events'
+			batch.put_item(Item=item)
+			copied += 1
+	print(f"Migrated {copied} log entries from {source_name} to EventsLogV2 ({skipped} skipped).")
+
+
+# Set attendee_count on every event from its EventMemberRelation rows, for
+# events created before the count was kept. Run it while no members join or leave.
+def backfill_attendee_counts():
+	counts = {}
+	for relation in parallel_scan(storage.table("EventMemberRelation")):
+		counts[relation['event_id']] = counts.get(relation['event_id'], 0) + 1
+	events = storage.table("Event")
+	updated = 0
+	for event in parallel_scan(events):
+		events.update_item({'event_id': event['event_id']}, {'attendee_count': counts.get(event['event_id'], 0)})
+		updated += 1
+	print(f"Set attendee_count on {updated} events.")
+
+
+# Set time_key and status_month on events written before they were kept, so
+# they show up in status_month-time_key-index. Events whose time is not ISO
+# 8601 are left out and listed.
+def backfill_event_times():
+	events = storage.table("Event")
+	updated, invalid = 0, []
+	for event in parallel_scan(events):
+		try:
+			values = event_time_attributes(event['status'], event['time'])
+		except (KeyError, ValueError):
+			invalid.append(event['event_id'])
+			continue
+		if any(event.get(name) != value for name, value in values.items()):
+			events.update_item({'event_id': event['event_id']}, values)
+			updated += 1
+	print(f"Set time keys on {updated} events ({len(invalid)} with an invalid time: {', '.join(invalid[:10])}).")
+
+
+# Copy each event's interval (start_key, end_key) onto its EventMemberRelation
+# rows, for relations written before schedules were kept or loaded in bulk.
+def backfill_member_intervals():
+	intervals = {}
+	for event in parallel_scan(storage.table("Event")):
+		interval = event_interval(event)
+		intervals[event['event_id']] = dict(zip(('start_key', 'end_key'), interval or (None, None)))
+	relations = storage.table("EventMemberRelation")
+	updated = 0
+	for relation in parallel_scan(relations):
+		values = intervals.get(relation['event_id'], {'start_key': None, 'end_key': None})
+		if any(relation.get(name) != value for name, value in values.items()):
+			relations.update_item({'event_id': relation['event_id'], 'user_id': relation['user_id']}, values)
+			updated += 1
+	print(f"Set schedule intervals on {updated} event members.")
+
+
+# Bring comments written before one comment per user per event up to date:
+# give each the created_at the event_id-created_at-index sorts on and store it
+# under comment_id_for(event_id, user_id) instead of its random id. Comments
+# without a creation time are dated LEGACY_COMMENT_TIME, so they list before
+# every dated one. Of several comments by one user on one event, the one
+# already under the derived id, else the earliest, is kept and the others are
+# deleted and listed. Run it while no comments are added or deleted.
+LEGACY_COMMENT_TIME = "1970-01-01T00:00:00"
+
+def migrate_comments():
+	comments_table = storage.table("Comment")
+	by_author, skipped = {}, 0
+	for comment in parallel_scan(comments_table):
+		if not comment.get('event_id') or not comment.get('user_id'):
+			skipped += 1
+			continue
+		by_author.setdefault((comment['event_id'], comment['user_id']), []).append(comment)
+	moved, dated, dropped = 0, 0, []
+	for (event_id, user_id), found in by_author.items():
+		comment_id = comment_id_for(event_id, user_id)
+		found.sort(key=lambda comment: (comment['comment_id'] != comment_id, comment.get('created_at') or LEGACY_COMMENT_TIME))
+		kept = found[0]
+		if not kept.get('created_at'):
+			dated += 1
+		item = dict(kept, comment_id=comment_id, created_at=kept.get('created_at') or LEGACY_COMMENT_TIME)
+		if item != kept:
+			comments_table.put_item(item)
+		if kept['comment_id'] != comment_id:
+			comments_table.delete_item({'comment_id': kept['comment_id']})
+			moved += 1
+		for duplicate in found[1:]:
+			comments_table.delete_item({'comment_id': duplicate['comment_id']})
+			dropped.append(duplicate['comment_id'])
+	print(f"Migrated comments: {moved} re-keyed, {dated} dated, {len(dropped)} duplicates deleted, {skipped} without an event or user skipped.")
+	if dropped:
+		print(f"Deleted duplicates: {', '.join(dropped)}")
+
+
 # Load Data into DynamoDB
 if __name__ == "__main__":
+	if "--migrate-logs" in sys.argv:
+		# keep existing data, only add EventsLogV2 and copy the old logs into it
+		create_events_log_table()
+		migrate_events_log()
+		sys.exit(0)
+	if "--migrate-comments" in sys.argv:
+		# keep existing data: add the comments index and move comments to derived ids
+		create_index("Comment", comment_index)
+		migrate_comments()
+		sys.exit(0)
+	if "--ensure-schema" in sys.argv:
+		# create missing tables only; no data is deleted or loaded
+		ensure_tables()
+		sys.exit(0)
+	if "--backfill-attendee-counts" in sys.argv:
+		backfill_attendee_counts()
+		sys.exit(0)
+	if "--enable-streams" in sys.argv:
+		# keep existing data: stream the source tables, add the Aggregate table and fill it
+		enable_streams()
+		create_aggregate_table()
+		rebuild_aggregates(storage)
+		sys.exit(0)
+	if "--rebuild-aggregates" in sys.argv:
+		print(f"Rebuilt {rebuild_aggregates(storage)} aggregates.")
+		sys.exit(0)
+	if "--index-event-times" in sys.argv:
+		# keep existing data: add the group and upcoming events indexes and fill in
+		# their attributes; the old group_id-time-index can be deleted afterwards
+		create_index("Event", group_index)
+		create_index("Event", upcoming_index)
+		backfill_event_times()
+		sys.exit(0)
+	if "--backfill-member-intervals" in sys.argv:
+		backfill_member_intervals()
+		sys.exit(0)
+	if "--create-outbox" in sys.argv:
+		# keep existing data, only add the Outbox table
+		create_outbox_table()
+		sys.exit(0)
+
+	reset_tables()
 	# load_data_to_dynamodb('Event', events)
 	load_event_to_dynamodb("./src/mock_data.csv")
 	load_data_to_dynamodb('EventMemberRelation', event_member_relations)
 	load_data_to_dynamodb('Group', groups)
 	load_data_to_dynamodb('Comment', comments)
+	backfill_attendee_counts()
+	backfill_member_intervals()
+	rebuild_aggregates(storage)
 	all_events = scan_all_events()
 	print(len(all_events))
 	if len(all_events) > 0:
@@ -0,0 +1,223 @@
+# Streaming bulk loader: reads CSV or JSONL in chunks, validates each chunk in
+# one pydantic call, and writes it with several parallel writers through
+# BatchWriteItem (src/batch.py, which retries unprocessed items). Writes are
+# paced by the write capacity the storage reports as consumed, and progress is
+# checkpointed so an interrupted load resumes where it stopped.
+#
+#   cd app && python -m src.loader events.csv --table Event --set group_id=101 --max-wcu 500
+import argparse
+import csv
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterator, List, Optional
+
+from pydantic import TypeAdapter, ValidationError
+
+from .batch import CapacityLimiter, batch_write, chunked
+from .models import Comment, Event, EventMemberRelation, Group
+from .storage import BATCH_WRITE_SIZE, Storage, get_storage
+from .timekeys import event_time_attributes
+
+TABLE_MODELS = {
+	'Event': Event,
+	'Group': Group,
+	'Comment': Comment,
+	'EventMemberRelation': EventMemberRelation,
+}
+
+# attributes derived from a validated item before it is written, as the
+# service's own writes derive them; a ValueError rejects the row
+DERIVED_ATTRIBUTES = {
+	'Event': lambda item: event_time_attributes(item['status'], item['time']),
+}
+
+LOADER_CHUNK_SIZE = 1000
+LOADER_WORKERS = 4
+
+
+def read_rows(path: str, skip: int = 0) -> Iterator[dict]:
+	# CSV (header row) or JSON Lines, by file extension; `skip` data rows are passed over
+	with open(path, newline='', encoding='utf-8') as source:
+		if path.endswith('.jsonl') or path.endswith('.ndjson'):
+			rows = (json.loads(line) for line in source if line.strip())
+		else:
+			rows = csv.DictReader(source)
+		yield from itertools.islice(rows, skip, None)
+
+
+def validate_rows(adapter: TypeAdapter, rows: List[dict]):
+	# one validation call for the whole chunk; rows that fail are taken out and
+	# the rest validated again. Returns (items, [(row, error)])
+	try:
+		return [model.model_dump() for model in adapter.validate_python(rows)], []
+	except ValidationError as e:
+		errors = {}
+		for error in e.errors():
+			errors.setdefault(error['loc'][0], f"{'.'.join(str(part) for part in error['loc'][1:])}: {error['msg']}")
+	good = [row for i, row in enumerate(rows) if i not in errors]
+	rejected = [(rows[i], message) for i, message in sorted(errors.items())]
+	return [model.model_dump() for model in adapter.validate_python(good)], rejected
+
+
+def derive_attributes(table_name: str, items: List[dict]):
+	# returns (items, [(item, error)])
+	derive = DERIVED_ATTRIBUTES.get(table_name)
+	if derive is None:
+		return items, []
+	good, rejected = [], []
+	for item in items:
+		try:
+			item.update(derive(item))
+		except ValueError as e:
+			rejected.append((item, str(e)))
+			continue
+		good.append(item)
+	return good, rejected
+
+
+class Checkpoint:
+	# rows of the source known to be written, saved after every chunk that
+	# extends the contiguous run of finished chunks
+	def __init__(self, path: Optional[str], source: str):
+		self.path = path
+		self.source = source
+		self.rows_done = 0
+		self._finished = {}
+		self._next = 0
+		if path and os.path.exists(path):
+			with open(path) as f:
+				state = json.load(f)
+			if state.get('source') == os.path.abspath(source):
+				self.rows_done = state['rows_done']
+
+	def finish(self, chunk_index: int, rows: int):
+		self._finished[chunk_index] = rows
+		advanced = False
+		while self._next in self._finished:
+			self.rows_done += self._finished.pop(self._next)
+			self._next += 1
+			advanced = True
+		if advanced and self.path:
+			temp = f"{self.path}.tmp"
+			with open(temp, 'w') as f:
+				json.dump({'source': os.path.abspath(self.source), 'rows_done': self.rows_done}, f)
+			os.replace(temp, self.path)
+
+
+def load_file(path: str, table_name: str, overrides: dict = None, storage: Storage = None,
+		chunk_size: int = LOADER_CHUNK_SIZE, workers: int = LOADER_WORKERS, max_wcu: float = None,
+		checkpoint: str = None, rejects: str = None, progress_every: float = 5.0) -> dict:
+	storage = storage or get_storage()
+	table = storage.table(table_name)
+	adapter = TypeAdapter(List[TABLE_MODELS[table_name]])
+	limiter = CapacityLimiter(lambda: storage.write_capacity, max_wcu)
+	state = Checkpoint(checkpoint, path)
+	counts = {'read': 0, 'written': 0, 'rejected': 0, 'failed': 0}
+	counts_lock = threading.Lock()
+	reject_file = open(rejects, 'a', encoding='utf-8') if rejects else None
+
+	def reject(row: dict, reason: str):
+		if reject_file:
+			with counts_lock:
+				reject_file.write(json.dumps({'row': row, 'error': reason}, default=str) + '\n')
+
+	def write(items: List[dict]) -> int:
+		failed = 0
+		for batch in chunked(items, BATCH_WRITE_SIZE):
+			limiter.wait()
+			left, _ = batch_write(table, puts=batch)
+			for item in left:
+				reject(item, 'write failed')
+			failed += len(left)
+		return failed
+
+	start = time.monotonic()
+	last_report = start
+	pending = {}
+	skipped = state.rows_done
+	try:
+		with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='loader') as executor:
+			rows = read_rows(path, skip=skipped)
+			for chunk_index in itertools.count():
+				chunk = list(itertools.islice(rows, chunk_size))
+				if not chunk:
+					break
+				if overrides:
+					for row in chunk:
+						row.update(overrides)
+				items, rejected = validate_rows(adapter, chunk)
+				items, unusable = derive_attributes(table_name, items)
+				rejected += unusable
+				for row, reason in rejected:
+					reject(row, reason)
+				counts['read'] += len(chunk)
+				counts['rejected'] += len(rejected)
+				pending[executor.submit(write, items)] = (chunk_index, len(chunk), len(items))
+
+				# bounded read-ahead: at most two chunks per writer in memory
+				while len(pending) >= workers * 2:
+					finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+					for future in finished:
+						_settle(future, pending.pop(future), state, counts)
+				if progress_every and time.monotonic() - last_report >= progress_every:
+					last_report = time.monotonic()
+					_report(counts, skipped, last_report - start)
+			for future in list(pending):
+				_settle(future, pending.pop(future), state, counts)
+	finally:
+		if reject_file:
+			reject_file.close()
+
+	elapsed = time.monotonic() - start
+	return {
+		'table': table_name,
+		'resumed_after_rows': skipped,
+		**counts,
+		'seconds': round(elapsed, 3),
+		'rows_per_second': round(counts['written'] / elapsed, 1) if elapsed else 0.0,
+		'write_capacity_units': round(limiter.used(), 1),
+	}
+
+
+def _settle(future, chunk: tuple, state: Checkpoint, counts: dict):
+	chunk_index, rows, items = chunk
+	failed = future.result()
+	counts['written'] += items - failed
+	counts['failed'] += failed
+	state.finish(chunk_index, rows)
+
+
+def _report(counts: dict, skipped: int, elapsed: float):
+	rate = counts['written'] / elapsed if elapsed else 0.0
+	print(f"{skipped + counts['read']} rows read, {counts['written']} written, {counts['rejected']} rejected, {counts['failed']} failed ({rate:.0f} rows/s)", flush=True)
+
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description='Stream a CSV or JSONL file into a table.')
+	parser.add_argument('path')
+	parser.add_argument('--table', default='Event', choices=sorted(TABLE_MODELS))
+	parser.add_argument('--set', action='append', default=[], metavar='FIELD=VALUE', help='value to use for a field in every row')
+	parser.add_argument('--chunk-size', type=int, default=LOADER_CHUNK_SIZE)
+	parser.add_argument('--workers', type=int, default=LOADER_WORKERS)
+	parser.add_argument('--max-wcu', type=float, default=None, help='write capacity units per second to stay under')
+	parser.add_argument('--checkpoint', default=None, help='file recording progress; an existing one resumes the load')
+	parser.add_argument('--rejects', default=None, help='JSONL file for rows that failed validation or could not be written')
+	return parser.parse_args(argv)
+
+
+def main(argv=None):
+	args = parse_args(argv)
+	overrides = dict(assignment.split('=', 1) for assignment in args.set)
+	result = load_file(
+		args.path, args.table, overrides=overrides, chunk_size=args.chunk_size, workers=args.workers,
+		max_wcu=args.max_wcu, checkpoint=args.checkpoint, rejects=args.rejects
+	)
+	print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+	main()
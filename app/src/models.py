@@ -1,3 +1,4 @@
+import uuid
 from pydantic import BaseModel
 from typing import List, Optional
 
@@ -19,13 +20,31 @@ class Event(BaseModel):
 	tag_1: str
 	tag_2: Optional[str]
 	duration: int
+	# members who joined, kept by joins and leaves; new events start at 0
+	attendee_count: int = 0
+	# set from time and status on every write (timekeys.event_time_attributes)
+	time_key: Optional[str] = None
+	status_month: Optional[str] = None
+
+class EventUpdate(BaseModel):
+	# fields left out are not changed
+	event_name: Optional[str] = None
+	duration: Optional[int] = None
+	location: Optional[str] = None
+	time: Optional[str] = None
+	capacity: Optional[int] = None
+	status: Optional[str] = None
+	description: Optional[str] = None
+	tag_2: Optional[str] = None
 	
 class EventsLog(BaseModel):
-	log_id: str
 	event_id: str
+	log_key: str
+	log_id: str
+	timestamp: str
+	feed: str
 	action: str
 	details: str
-	time: str 
 	user_id: Optional[str]
 
 # class Event(BaseModel):
@@ -40,8 +59,33 @@ class Group(BaseModel):
 	name: str
 	description: Optional[str] = None
 
+class NewComment(BaseModel):
+	user_id: str
+	text: str
+
 class Comment(BaseModel):
 	comment_id: str
 	event_id: str
 	text: str
 	user_id: str
+	created_at: Optional[str] = None
+
+# a user has at most one comment per event, stored under this id
+COMMENT_ID_NAMESPACE = uuid.UUID('6f1c1d52-5d43-4c1e-9a3f-3c0f3b7a2e11')
+
+def comment_id_for(event_id: str, user_id: str) -> str:
+	return str(uuid.uuid5(COMMENT_ID_NAMESPACE, f"{event_id}#{user_id}"))
+
+
+# Response shapes, for the API schema; list routes send items as stored
+class EventPage(BaseModel):
+	items: List[Event]
+	next_cursor: Optional[str] = None
+
+class EventsLogPage(BaseModel):
+	items: List[EventsLog]
+	next_cursor: Optional[str] = None
+
+class CommentPage(BaseModel):
+	items: List[Comment]
+	next_cursor: Optional[str] = None
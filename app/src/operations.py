@@ -1,285 +1,317 @@
-import boto3
-from boto3.dynamodb.conditions import Key, Attr
-from .models import Event, Group, Comment, EventMemberRelation, EventsLog
+from .models import Event, Group, Comment, EventMemberRelation, EventsLog, comment_id_for
 from .sns import sns_add_event
+from .storage import TRANSACT_SIZE, ConditionFailed, Delete, Increment, Put, TransactionCanceled, get_storage
+from .pagination import InvalidCursor, decode_cursor, encode_cursor, page_response, page_size
+from .batch import BATCH_MAX_ATTEMPTS, batch_get, batch_write, chunked, transact_groups
+from .timekeys import KEY_FORMAT, event_time_attributes, month_buckets, to_utc_key, utc_now_key
+from .cache import TTLCache
+from .aggregates import event_key, group_key, summary
+from .export import ExportError
+from .scan import parallel_scan
+from .search import SearchIndex
+from .schedules import CONFLICT_MODES, FREE_STATUSES, SCHEDULE_CONFLICTS, Schedule, event_interval, relation_interval
+import os
+import threading
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 
 
-# Initialize a DynamoDB resource
-dynamodb = boto3.resource('dynamodb', region_name="us-east-2")
+# Storage backend (DynamoDB, memory or SQLite, see src/storage)
+storage = get_storage()
 
 
 def load_data_to_dynamodb(table_name, data):
-	table = dynamodb.Table(table_name)
-	for item in data:
-		table.put_item(Item=item.dict())  # Convert Pydantic model to dict
+	# BatchWriteItem in parallel chunks; returns the items that could not be written
+	failed, _ = batch_write(storage.table(table_name), [item.model_dump() for item in data])  # Convert Pydantic models to dicts
+	return failed
 
 
 # Replace with your table names
-events_table = dynamodb.Table('Event')
-groups_table = dynamodb.Table('Group')
-comments_table = dynamodb.Table('Comment')
-relations_table = dynamodb.Table('EventMemberRelation')
-log_table = dynamodb.Table('EventsLog')
+events_table = storage.table('Event')
+groups_table = storage.table('Group')
+comments_table = storage.table('Comment')
+relations_table = storage.table('EventMemberRelation')
+log_table = storage.table('EventsLogV2')
+aggregates_table = storage.table('Aggregate')
+
+# every log entry is also in the single feed partition of feed-log_key-index
+LOG_FEED = 'events'
+
+# Read-through cache of event items, per process. Writes made here invalidate it;
+# writes from other processes become visible after EVENT_CACHE_TTL seconds.
+event_cache = TTLCache(
+	max_size=int(os.getenv('EVENT_CACHE_SIZE', '10000')),
+	ttl=float(os.getenv('EVENT_CACHE_TTL', '30')),
+	negative_ttl=float(os.getenv('EVENT_CACHE_NEGATIVE_TTL', '5'))
+)
+
+# Search index over names, tags and descriptions, per process (src/search.py):
+# filled by rebuild_search_index at startup, then kept by the event writes below
+search_index = SearchIndex()
+
+# Schedules of users for conflict checks on joins, per process (src/schedules.py).
+# Joins and leaves made here keep them current; others show after SCHEDULE_CACHE_TTL.
+schedule_cache = TTLCache(
+	max_size=int(os.getenv('SCHEDULE_CACHE_SIZE', '10000')),
+	ttl=float(os.getenv('SCHEDULE_CACHE_TTL', '30'))
+)
+# a user's schedule is loaded, checked and changed under one of these locks
+_schedule_locks = [threading.Lock() for _ in range(64)]
+
+def schedule_lock(user_id: str) -> threading.Lock:
+	return _schedule_locks[hash(user_id) % len(_schedule_locks)]
 
 def add_event(user_id : str, group_id : str, event_data: Event) -> dict:
 	event_dict = event_data.model_dump()
 	event_dict['group_id'] = group_id
 	event_dict['organizer_id'] = user_id
 	event_dict['event_id'] = str(uuid.uuid4())
-	events_table.put_item(Item=event_dict)
-	sns_add_event(event_dict)
+	event_dict['attendee_count'] = 0
+	try:
+		event_dict.update(event_time_attributes(event_dict['status'], event_dict['time']))
+	except ValueError:
+		return {'message': 'Invalid time format'}
+	# the event and its notification are written together; OutboxDispatcher publishes it
+	storage.transact_write([('Event', event_dict), ('Outbox', sns_add_event(event_dict))])
+	event_cache.put(event_dict['event_id'], dict(event_dict))
+	search_index.put(event_dict)
 
 	return event_dict
 
+# Bulk operations write in chunks (BatchWriteItem, or transactions where an
+# outbox entry goes with each item), retry what was not written and report a
+# result for every item; BULK_MAX_ITEMS caps the items accepted per request
+BULK_MAX_ITEMS = int(os.getenv('BULK_MAX_ITEMS', '1000'))
+
+def _too_many(items: list) -> dict:
+	if len(items) > BULK_MAX_ITEMS:
+		return {'message': f'Too many items, at most {BULK_MAX_ITEMS} per request'}
+	return None
+
+def _bulk_response(results: list, ok_status: str) -> dict:
+	succeeded = sum(1 for result in results if result['status'] == ok_status)
+	return {'succeeded': succeeded, 'failed': sum(1 for result in results if result['status'] == 'failed'), 'results': results}
+
+def add_events(user_id: str, group_id: str, events: list) -> dict:
+	error = _too_many(events)
+	if error:
+		return error
+	event_dicts, positions, results = [], {}, []
+	for index, event_data in enumerate(events):
+		event_dict = event_data.model_dump()
+		event_dict['group_id'] = group_id
+		event_dict['organizer_id'] = user_id
+		event_dict['event_id'] = str(uuid.uuid4())
+		event_dict['attendee_count'] = 0
+		try:
+			event_dict.update(event_time_attributes(event_dict['status'], event_dict['time']))
+		except ValueError:
+			results.append({'index': index, 'status': 'invalid', 'message': 'Invalid time format'})
+			continue
+		positions[event_dict['event_id']] = index
+		event_dicts.append(event_dict)
+
+	# each chunk of events is one transaction together with its outbox entries
+	chunks = chunked(event_dicts, TRANSACT_SIZE // 2)
+	written = transact_groups(storage, [
+		[('Event', event_dict) for event_dict in chunk] + [('Outbox', sns_add_event(event_dict)) for event_dict in chunk]
+		for chunk in chunks
+	])
+	created = []
+	for chunk, ok in zip(chunks, written):
+		for event_dict in chunk:
+			results.append({'index': positions[event_dict['event_id']], 'event_id': event_dict['event_id'], 'status': 'created' if ok else 'failed'})
+			if ok:
+				created.append(event_dict)
+				event_cache.put(event_dict['event_id'], dict(event_dict))
+				search_index.put(event_dict)
+	results.sort(key=lambda result: result['index'])
+
+	response = _bulk_response(results, 'created')
+	response['events'] = created
+	return response
+
 def get_event(event_id: str) -> dict:
-	response = events_table.get_item(Key={'event_id': event_id})
-	return response.get('Item')
+	item = event_cache.get_or_load(event_id, lambda: events_table.get_item({'event_id': event_id}))
+	# callers get their own copy so they cannot change the cached item
+	return dict(item) if item is not None else None
 
 
 def list_attendees(event_id: str) -> list:
-	response = relations_table.query(
-		KeyConditionExpression=Key('event_id').eq(event_id)
-	)
-	items = response.get('Items', [])
+	items = relations_table.query(event_id).items
 	user_ids = [item['user_id'] for item in items]
 	return user_ids
 
 def event_exists(event_id: str) -> bool:
 	try:
-		response = events_table.get_item(
-			Key={'event_id': event_id}
-		)
-		return 'Item' in response
+		return get_event(event_id) is not None
 	except Exception as e:
 		print(f"An error occurred: {e}")
 		return False
 
-def list_logs(limit: int = 10, skip: int = 0) -> list:
-	response = log_table.scan()
-	items = response.get('Items', [])
-	return items[skip: skip + limit]
-
-def get_event_log_by_event_id(event_id: str, limit: int = 10, skip: int = 10) -> list:
-	response = log_table.scan(
-		FilterExpression=boto3.dynamodb.conditions.Attr('event_id').eq(event_id)
-	)
-	items = response.get('Items', [])
-	return items[skip: skip + limit]
-
-def update_event_name(event_id: str, event_name: str) -> dict:
-	current_event = get_event(event_id)
-	if not current_event:
-		return {'message': 'Event not found', 'event_id': event_id}
-	current_name = current_event.get('event_name', 'Unknown')
-	if current_name == event_name:
-		return {'message': 'Event name is the same, no need to update', 'event_id': event_id}
-
-	response = events_table.update_item(
-		Key={'event_id': event_id},
-		UpdateExpression="set #en = :en",
-		ExpressionAttributeNames={'#en': 'event_name'},
-		ExpressionAttributeValues={':en': event_name},
-		ReturnValues="UPDATED_NEW"
-	)
-
+def build_log_item(event_id: str, action: str, details: str, user_id: str = 'test_user_id') -> dict:
+	log_id = str(uuid.uuid4())
+	timestamp = utc_now_key()
 	return {
-		'event_id': event_id,
-		'previous_event_name': current_name,
-		'updated_event_name': event_name
+		'event_id': event_id or 'unknown',
+		'log_key': f"{timestamp}#{log_id}",
+		'log_id': log_id,
+		'timestamp': timestamp,
+		'feed': LOG_FEED,
+		'action': action,
+		'details': details,
+		'user_id': user_id
 	}
 
+def add_log(event_id: str, action: str, details: str, user_id: str = 'test_user_id') -> dict:
+	log_item = build_log_item(event_id, action, details, user_id)
+	log_table.put_item(log_item)
+	return log_item
 
-def update_event_location(event_id: str, location: str) -> dict:
-	current_event = get_event(event_id)
-	if not current_event:
-		return {'message': 'Event not found', 'event_id': event_id}
-	current_location = current_event.get('location', 'Unknown')
-	if current_location == location:
-		return {'message': 'Event location is the same, no need to update', 'event_id': event_id}
-
-	response = events_table.update_item(
-		Key={'event_id': event_id},
-		UpdateExpression="set #loc = :l",
-		ExpressionAttributeNames={'#loc': 'location'},
-		ExpressionAttributeValues={':l': location},
-		ReturnValues="UPDATED_NEW"
-	)
-
-	return {
-		'event_id': event_id,
-		'previous_location': current_location,
-		'updated_location': location
-	}
-
-
-def update_event_time(event_id: str, time: str) -> dict:
-	current_event = get_event(event_id)
-	if not current_event:
-		return {'message': 'Event not found', 'event_id': event_id}
-	current_time = current_event.get('time', 'Unknown')
-	if current_time == time:
-		return {'message': 'Event start time is the same, no need to update', 'event_id': event_id}
-
+def _query_logs(partition: str, index: str, limit: int, cursor: str, since: str) -> dict:
+	# newest first, optionally only entries at or after `since`
 	try:
-		datetime.fromisoformat(time)
+		since_key = to_utc_key(since) if since else None
 	except ValueError:
-		return {'message': 'Invalid time format', 'event_id': event_id}
-
-	response = events_table.update_item(
-		Key={'event_id': event_id},
-		UpdateExpression="set #t = :t",
-		ExpressionAttributeNames={'#t': 'time'},
-		ExpressionAttributeValues={':t': time},
-		ReturnValues="UPDATED_NEW"
+		return {'message': 'Invalid time format'}
+	page = log_table.query(
+		partition,
+		index=index,
+		limit=page_size(limit),
+		start_key=decode_cursor(cursor),
+		range_from=since_key,
+		descending=True
 	)
+	return page_response(page)
+
+def list_logs(limit: int = 10, cursor: str = None, since: str = None) -> dict:
+	return _query_logs(LOG_FEED, 'feed-log_key-index', limit, cursor, since)
+
+def get_event_log_by_event_id(event_id: str, limit: int = 10, cursor: str = None, since: str = None) -> dict:
+	# only this event's partition is read
+	return _query_logs(event_id, None, limit, cursor, since)
+
+# attributes that can be changed one at a time or together with patch_event,
+# with the name used for them in responses and in "no change" messages
+EVENT_UPDATE_FIELDS = {
+	'event_name': ('event_name', 'name'),
+	'duration': ('duration', 'duration'),
+	'location': ('location', 'location'),
+	'time': ('time', 'start time'),
+	'capacity': ('capacity', 'capacity'),
+	'status': ('status', 'status'),
+	'description': ('description', 'description'),
+	'tag_2': ('tag2', 'tag2'),
+}
+
+def validate_event_changes(changes: dict) -> str:
+	unknown = [name for name in changes if name not in EVENT_UPDATE_FIELDS]
+	if unknown:
+		return f"Unknown fields: {', '.join(unknown)}"
+	if 'time' in changes:
+		try:
+			to_utc_key(changes['time'])
+		except ValueError:
+			return 'Invalid time format'
+	if 'duration' in changes and (changes['duration'] < 10 or changes['duration'] > 300):
+		return 'Invalid duration minutes'
+	return None
+
+def patch_event(event_id: str, changes: dict) -> dict:
+	# One conditional update_item: "not found", "no change" and the previous
+	# values for the response all come back from the write itself
+	if not changes:
+		return {'message': 'No fields to update', 'event_id': event_id}
+	error = validate_event_changes(changes)
+	if error:
+		return {'message': error, 'event_id': event_id}
+
+	for _ in range(BATCH_MAX_ATTEMPTS):
+		values, expected = dict(changes), None
+		if 'status' in changes or 'time' in changes:
+			# time_key and status_month follow status and time: they are worked out
+			# from the item as read, and the write expects it unchanged since
+			current = events_table.get_item({'event_id': event_id})
+			if current is None:
+				event_cache.invalidate(event_id)
+				return {'message': 'Event not found', 'event_id': event_id}
+			expected = {'status': current.get('status'), 'time': current.get('time')}
+			try:
+				values.update(event_time_attributes(changes.get('status', current.get('status')), changes.get('time', current.get('time'))))
+			except (TypeError, ValueError):
+				# an event stored before times were checked stays out of the index
+				pass
+		try:
+			previous = events_table.update_changed({'event_id': event_id}, values, expected)
+			break
+		except ConditionFailed as e:
+			if e.item is None:
+				event_cache.invalidate(event_id)
+				return {'message': 'Event not found', 'event_id': event_id}
+			if expected and any(e.item.get(name) != value for name, value in expected.items()):
+				# status or time changed in between: read it again
+				continue
+			event_cache.put(event_id, e.item)
+			label = EVENT_UPDATE_FIELDS[next(iter(changes))][1] + ' ' if len(changes) == 1 else ''
+			return {'message': f'Event {label}is the same, no need to update', 'event_id': event_id}
+	else:
+		return {'message': 'Event is being changed, try again', 'event_id': event_id}
+	event_cache.invalidate(event_id)
+	search_index.update(event_id, changes)
+	cancelled = 'status' in changes and (previous.get('status') in FREE_STATUSES) != (changes['status'] in FREE_STATUSES)
+	if 'time' in changes or 'duration' in changes or cancelled:
+		_refresh_member_intervals(event_id)
+
+	result = {'event_id': event_id}
+	for name, value in changes.items():
+		current = previous.get(name, 'Unknown')
+		if current == value:
+			continue
+		field = EVENT_UPDATE_FIELDS[name][0]
+		result[f'previous_{field}'] = current
+		result[f'updated_{field}'] = value
+	return result
 
-	return {
-		'event_id': event_id,
-		'previous_time': current_time,
-		'updated_time': time
-	}
 
+def update_event_name(event_id: str, event_name: str) -> dict:
+	return patch_event(event_id, {'event_name': event_name})
 
-def update_event_capacity(event_id: str, capacity: int) -> dict:
-	current_event = get_event(event_id)
-	if not current_event:
-		return {'message': 'Event not found', 'event_id': event_id}
-	current_capacity = current_event.get('capacity', 'Unknown')
-	if current_capacity == capacity:
-		return {'message': 'Event capacity is the same, no need to update', 'event_id': event_id}
-
-	response = events_table.update_item(
-		Key={'event_id': event_id},
-		UpdateExpression="set #c = :c",
-		ExpressionAttributeNames={'#c': 'capacity'},
-		ExpressionAttributeValues={':c': capacity},
-		ReturnValues="UPDATED_NEW"
-	)
+def update_event_location(event_id: str, location: str) -> dict:
+	return patch_event(event_id, {'location': location})
 
-	return {
-		'event_id': event_id,
-		'previous_capacity': current_capacity,
-		'updated_capacity': capacity
-	}
+def update_event_time(event_id: str, time: str) -> dict:
+	return patch_event(event_id, {'time': time})
 
+def update_event_capacity(event_id: str, capacity: int) -> dict:
+	return patch_event(event_id, {'capacity': capacity})
 
 def update_event_duration(event_id: str, duration: int) -> dict:
-	current_event = get_event(event_id)
-	if not current_event:
-		return {'message': 'Event not found', 'event_id': event_id}
-	current_duration = current_event.get('duration', 'Unknown')
-	if current_duration == duration:
-		return {'message': 'Event duration is the same, no need to update', 'event_id': event_id}
-
-	if duration < 10 or duration > 300:
-		return {'message': 'Invalid duration minutes', 'event_id': event_id}
-
-	response = events_table.update_item(
-		Key={'event_id': event_id},
-		UpdateExpression="set #d = :d",
-		ExpressionAttributeNames={'#d': 'duration'},
-		ExpressionAttributeValues={':d': duration},
-		ReturnValues="UPDATED_NEW"
-	)
-
-	return {
-		'event_id': event_id,
-		'previous_duration': current_duration,
-		'updated_duration': duration
-	}
-
+	return patch_event(event_id, {'duration': duration})
 
 def update_event_status(event_id: str, status: str) -> dict:
-	current_event = get_event(event_id)
-	if not current_event:
-		return {'message': 'Event not found', 'event_id': event_id}
-	current_status = current_event.get('status', 'Unknown')
-	if current_status == status:
-		return {'message': 'Event status is the same, no need to update', 'event_id': event_id}
-
-	response = events_table.update_item(
-		Key={'event_id': event_id},
-		UpdateExpression="set #s = :s",
-		ExpressionAttributeNames={'#s': 'status'},
-		ExpressionAttributeValues={':s': status},
-		ReturnValues="UPDATED_NEW"
-	)
-
-	return {
-		'event_id': event_id,
-		'previous_status': current_status,
-		'updated_status': status
-	}
+	return patch_event(event_id, {'status': status})
 
 def update_event_description(event_id: str, description: str) -> dict:
-	current_event = get_event(event_id)
-	if not current_event:
-		return {'message': 'Event not found', 'event_id': event_id}
-	current_description = current_event.get('description', 'Unknown')
-	if current_description == description:
-		return {'message': 'Event description is the same, no need to update', 'event_id': event_id}
-
-	response = events_table.update_item(
-		Key={'event_id': event_id},
-		UpdateExpression="set #desc = :d",
-		ExpressionAttributeNames={'#desc': 'description'},
-		ExpressionAttributeValues={':d': description},
-		ReturnValues="UPDATED_NEW"
-	)
-
-	return {
-		'event_id': event_id,
-		'previous_description': current_description,
-		'updated_description': description
-	}
-
+	return patch_event(event_id, {'description': description})
 
 def update_event_tag2(event_id: str, tag2: str) -> dict:
-	current_event = get_event(event_id)
-	if not current_event:
-		return {'message': 'Event not found', 'event_id': event_id}
-	current_tag2 = current_event.get('tag_2', 'Unknown')
-	if current_tag2 == tag2:
-		return {'message': 'Event tag2 is the same, no need to update', 'event_id': event_id}
-
-	response = events_table.update_item(
-		Key={'event_id': event_id},
-		UpdateExpression="set tag_2=:t2",
-		ExpressionAttributeValues={':t2': tag2},
-		ReturnValues="UPDATED_NEW"
-	)
-
-	return {
-		'event_id': event_id,
-		'previous_tag2': current_tag2,
-		'updated_tag2': tag2
-	}
-
+	return patch_event(event_id, {'tag_2': tag2})
 
 
 def update_event(event_id: str, event_data: Event) -> dict:
 	# Assuming 'event_id' is the primary key and cannot be updated
 	event_dict = event_data.model_dump()
-	response = events_table.update_item(
-		Key={'event_id': event_id},
-		UpdateExpression="set status=:s, capacity=:c, event_name=:en, description=:d, location=:l, time=:t, group_id=:g, organizer_id=:o, tag_1=:t1, tag_2=:t2",
-		ExpressionAttributeValues={
-			':s': event_dict['status'],
-			':c': event_dict['capacity'],
-			':en': event_dict['event_name'],
-			':d': event_dict['description'],
-			':l': event_dict['location'],
-			':t': event_dict['time'],
-			':g': event_dict['group_id'],
-			':o': event_dict['organizer_id'],
-			':t1': event_dict['tag_1'],
-			':t2': event_dict['tag_2']
-		},
-		ReturnValues="UPDATED_NEW"
-	)
-	return response.get('Attributes', {})
+	fields = ['status', 'capacity', 'event_name', 'description', 'location', 'time', 'group_id', 'organizer_id', 'tag_1', 'tag_2']
+	values = {name: event_dict[name] for name in fields}
+	try:
+		values.update(event_time_attributes(event_dict['status'], event_dict['time']))
+	except ValueError:
+		return {'message': 'Invalid time format'}
+	updated = events_table.update_item({'event_id': event_id}, values)
+	event_cache.invalidate(event_id)
+	search_index.put(dict(values, event_id=event_id))
+	_refresh_member_intervals(event_id)
+	return updated
 
 def delete_event(event_id: str) -> dict:
 	# Check if the event exists
@@ -287,51 +319,187 @@ def delete_event(event_id: str) -> dict:
 		return {'message': 'Event not found'}
 
 	try:
-		events_table.delete_item(Key={'event_id': event_id})
+		events_table.delete_item({'event_id': event_id})
+		event_cache.invalidate(event_id)
+		search_index.remove(event_id)
+		_refresh_member_intervals(event_id)
 		return {"message": "Event deleted"}
 	except Exception as e:
 		return {'error': str(e)}
 
 
-def list_events_by_group_id(group_id: str) -> list:
-	# Query the events table for items with the specified group_id
+def list_events_by_group_id(group_id: str, limit: int = 10, cursor: str = None, start: str = None, end: str = None) -> dict:
+	# Query the group_id index, in event time order, optionally within [start, end]
 	try:
-		response = events_table.scan(
-			FilterExpression=boto3.dynamodb.conditions.Attr('group_id').eq(group_id)
+		start_key, end_key = (to_utc_key(bound) if bound is not None else None for bound in (start, end))
+	except ValueError:
+		return {'message': 'Invalid time format', 'group_id': group_id}
+	if start_key and end_key and start_key > end_key:
+		return {'message': 'end is before start', 'group_id': group_id}
+
+	page = events_table.query(
+		group_id,
+		index='group_id-time_key-index',
+		limit=page_size(limit),
+		start_key=decode_cursor(cursor),
+		range_from=start_key,
+		range_to=end_key
+	)
+	return page_response(page)
+
+
+# Upcoming events come from status_month-time_key-index: one range query per
+# month bucket between `start` and `end`, in time order. A page may take several
+# buckets; its cursor is the index key of its last event.
+UPCOMING_DEFAULT_DAYS = int(os.getenv('UPCOMING_DEFAULT_DAYS', '30'))
+UPCOMING_MAX_DAYS = int(os.getenv('UPCOMING_MAX_DAYS', '366'))
+
+def list_upcoming_events(start: str = None, end: str = None, status: str = 'Scheduled', limit: int = 10, cursor: str = None) -> dict:
+	try:
+		start_key = to_utc_key(start) if start else utc_now_key()
+		end_key = to_utc_key(end) if end else None
+	except ValueError:
+		return {'message': 'Invalid time format'}
+	start_time = datetime.strptime(start_key, KEY_FORMAT)
+	if end_key is None:
+		end_key = (start_time + timedelta(days=UPCOMING_DEFAULT_DAYS)).strftime(KEY_FORMAT)
+	if end_key < start_key:
+		return {'message': 'to is before from'}
+	if datetime.strptime(end_key, KEY_FORMAT) - start_time > timedelta(days=UPCOMING_MAX_DAYS):
+		return {'message': f'Time range too long, at most {UPCOMING_MAX_DAYS} days'}
+
+	buckets = month_buckets(start_key, end_key)
+	start_from = decode_cursor(cursor)
+	if start_from:
+		bucket = str(start_from.get('status_month', ''))
+		if not bucket.startswith(f'{status}#') or bucket[len(status) + 1:] not in buckets:
+			raise InvalidCursor('Invalid cursor')
+		buckets = buckets[buckets.index(bucket[len(status) + 1:]):]
+
+	size = page_size(limit)
+	items, last_key = [], None
+	for position, bucket in enumerate(buckets):
+		page = events_table.query(
+			f'{status}#{bucket}',
+			index='status_month-time_key-index',
+			limit=size - len(items),
+			start_key=start_from,
+			range_from=start_key,
+			range_to=end_key
 		)
-		return response.get('Items', [])
+		items += page.items
+		start_from = None
+		if len(items) >= size:
+			# a full page goes on in this bucket, or in the next one if there is one
+			last_key = page.last_key
+			if last_key is None and position + 1 < len(buckets):
+				last_key = {name: items[-1][name] for name in events_table.schema.key_attributes('status_month-time_key-index')}
+			break
+	return {'items': items, 'next_cursor': encode_cursor(last_key)}
+
+
+def rebuild_search_index() -> int:
+	try:
+		return search_index.rebuild(parallel_scan(events_table))
 	except Exception as e:
-		print(f"Error querying table: {str(e)}")
-		return []
+		print(f"Building the search index failed: {e}")
+		return 0
+
+def search_events(query: str = '', tags: list = (), limit: int = 10) -> dict:
+	# best matches first, with their score; the events come in one batch read
+	hits = search_index.search(query, tags, page_size(limit))
+	found = {item['event_id']: item for item in batch_get(events_table, [{'event_id': event_id} for event_id, _ in hits])}
+	items = [dict(found[event_id], score=score) for event_id, score in hits if event_id in found]
+	return {'items': items, 'complete': search_index.ready}
 
 
-def get_events(limit: int = 10, skip: int = 0) -> list:
-	response = events_table.scan()
-	items = response.get('Items', [])
-	return items[skip: skip + limit]
+def get_events(limit: int = 10, cursor: str = None) -> dict:
+	page = events_table.scan(limit=page_size(limit), start_key=decode_cursor(cursor))
+	return page_response(page)
+
+# Exports read the whole result set page by page and hand items on as they
+# arrive. Arguments are checked before the first read (ExportError), so a bad
+# request fails before a response starts streaming.
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+
+def _check_times(start: str, end: str) -> tuple:
+	# the bounds as UTC time keys (None where not given)
+	try:
+		start_key, end_key = (to_utc_key(bound) if bound is not None else None for bound in (start, end))
+	except ValueError:
+		raise ExportError('Invalid time format')
+	if start_key and end_key and start_key > end_key:
+		raise ExportError('end is before start')
+	return start_key, end_key
+
+def _get_all(table, key: dict):
+	item = table.get_item(key)
+	if item is not None:
+		yield item
+
+def _query_all(table, partition, **options):
+	start_key = None
+	while True:
+		page = table.query(partition, limit=EXPORT_PAGE_SIZE, start_key=start_key, **options)
+		yield from page.items
+		start_key = page.last_key
+		if not start_key:
+			return
+
+def export_events(group_id: str = None, start: str = None, end: str = None, event_id: str = None):
+	# events of one group come from the group_id index in time order; without a
+	# group the table is read with the parallel scan, in no particular order
+	start_key, end_key = _check_times(start, end)
+	if event_id:
+		items = _get_all(events_table, {'event_id': event_id})
+		if group_id:
+			items = (item for item in items if item.get('group_id') == group_id)
+	elif group_id:
+		return _query_all(events_table, group_id, index='group_id-time_key-index', range_from=start_key, range_to=end_key)
+	else:
+		items = parallel_scan(events_table, page_size=EXPORT_PAGE_SIZE)
+	if start_key is None and end_key is None:
+		return items
+	# events without a time_key (stored before it was kept) have no place in a window
+	return (
+		item for item in items
+		if item.get('time_key') and (start_key is None or item['time_key'] >= start_key) and (end_key is None or item['time_key'] <= end_key)
+	)
+
+def export_logs(event_id: str = None, since: str = None, until: str = None):
+	# oldest first, from the event's partition or from the feed index
+	try:
+		since_key = to_utc_key(since) if since else None
+		until_key = to_utc_key(until) if until else None
+	except ValueError:
+		raise ExportError('Invalid time format')
+	# log keys go on past the timestamp ("<timestamp>#<log_id>"), so the upper bound is the next key
+	until_key = until_key and until_key + '~'
+	if event_id:
+		return _query_all(log_table, event_id, range_from=since_key, range_to=until_key)
+	return _query_all(log_table, LOG_FEED, index='feed-log_key-index', range_from=since_key, range_to=until_key)
 
 def get_events_by_ids(event_ids: list) -> list:
+	# ceil(N/100) parallel BatchGetItem calls instead of one get_item per event
 	events = []
 	try:
-		for event_id in event_ids:
-			response = events_table.get_item(
-				Key={'event_id': event_id}
-			)
-			event = response.get('Item')
-			if event:
-				events.append(event)
+		unique_ids = list(dict.fromkeys(event_ids))
+		found = {item['event_id']: item for item in batch_get(events_table, [{'event_id': event_id} for event_id in unique_ids])}
+		events = [found[event_id] for event_id in unique_ids if event_id in found]
 	except Exception as e:
 		print(f"An error occurred: {e}")
 	return events
 
 def list_events_by_user_id(user_id: str) -> list:
-	# Query the relations table for items with the specified user_id
+	# Query the user_id index of the relations table for the user's events
 	try:
-		response = relations_table.scan(
-			FilterExpression=boto3.dynamodb.conditions.Attr('user_id').eq(user_id)
-		)
-		items = response.get('Items', [])
-		event_ids = [item['event_id'] for item in items]
+		event_ids, start_key = [], None
+		while True:
+			page = relations_table.query(user_id, index='user_id-event_id-index', start_key=start_key)
+			event_ids += [item['event_id'] for item in page.items]
+			start_key = page.last_key
+			if not start_key:
+				break
 
 		return get_events_by_ids(event_ids)
 	except Exception as e:
@@ -339,40 +507,202 @@ def list_events_by_user_id(user_id: str) -> list:
 		return []
 
 
-def add_event_member(event_id: str, user_id: str) -> dict:
-	# Check if the member already exists
-	existing_member = relations_table.get_item(
-		Key={'event_id': event_id, 'user_id': user_id}
-	).get('Item')
-
-	if existing_member:
-		return {'message': 'Member already exists in the event'}
-
-	try:
-		response = relations_table.put_item(
-			Item={'event_id': event_id, 'user_id': user_id}
-		)
-		return {'message': 'Member added to event successfully', 'response': response}
-	except Exception as e:
-		return {'error': str(e)}
+def _load_schedule(user_id: str) -> Schedule:
+	# one query of the user's relations; the intervals are on them
+	entries = []
+	for relation in _query_all(relations_table, user_id, index='user_id-event_id-index'):
+		interval = relation_interval(relation)
+		if interval:
+			entries.append(interval + (relation['event_id'],))
+	return Schedule(entries)
+
+def user_schedule(user_id: str) -> Schedule:
+	# call with schedule_lock(user_id) held
+	return schedule_cache.get_or_load(user_id, lambda: _load_schedule(user_id))
+
+def _refresh_member_intervals(event_id: str):
+	# Copies the event's interval onto its relations after its time, duration
+	# or status changed (or clears it once the event is gone). One write per
+	# member, as rescheduling is rare; a member joining at the same moment may
+	# keep the old interval until the event is rescheduled again.
+	event = events_table.get_item({'event_id': event_id})
+	interval = event_interval(event) if event else None
+	values = dict(zip(('start_key', 'end_key'), interval or (None, None)))
+	for relation in list(_query_all(relations_table, event_id)):
+		try:
+			relations_table.update_changed({'event_id': event_id, 'user_id': relation['user_id']}, values)
+		except ConditionFailed:
+			# unchanged, or the member left meanwhile
+			pass
+		schedule_cache.invalidate(relation['user_id'])
+
+def list_schedule_conflicts(user_id: str) -> dict:
+	# every pair of the user's events that overlap, with the time they share
+	with schedule_lock(user_id):
+		pairs = user_schedule(user_id).conflicts()
+	events = {event['event_id']: event for event in get_events_by_ids([event_id for pair in pairs for event_id in pair[:2]])}
+	conflicts = [
+		{'events': [events[first], events[second]], 'overlap_start': start_key, 'overlap_end': end_key}
+		for first, second, start_key, end_key in pairs
+		if first in events and second in events
+	]
+	return {'user_id': user_id, 'conflicts': conflicts}
+
+
+# Joins and leaves write the relation and move the event's attendee_count in
+# one transaction. The count may not pass the event's capacity, so concurrent
+# joins can never oversubscribe it, and reading the count is one get_item.
+# A join also checks the user's schedule for events at the same time:
+# on_conflict 'allow' ignores them, 'flag' joins and lists them, 'reject' does
+# not join; SCHEDULE_CONFLICTS decides when it is not given.
+def add_event_member(event_id: str, user_id: str, on_conflict: str = None) -> dict:
+	on_conflict = on_conflict or SCHEDULE_CONFLICTS
+	if on_conflict not in CONFLICT_MODES:
+		return {'message': f"on_conflict must be one of {', '.join(CONFLICT_MODES)}"}
+	relation = {'event_id': event_id, 'user_id': user_id}
+	overlaps = []
+	with schedule_lock(user_id):
+		try:
+			event = events_table.get_item({'event_id': event_id})
+			if event is None:
+				return {'message': 'Event not found'}
+			interval = event_interval(event)
+			if interval:
+				relation.update(start_key=interval[0], end_key=interval[1])
+			schedule = user_schedule(user_id)
+			if interval and on_conflict != 'allow':
+				overlaps = schedule.overlapping(*interval, exclude=event_id)
+			if overlaps and on_conflict == 'reject':
+				return {'message': 'Member has other events at that time', 'conflicts': overlaps}
+			storage.transact_write([
+				Put('EventMemberRelation', relation, if_not_exists=True),
+				Increment('Event', {'event_id': event_id}, 'attendee_count', 1, at_most='capacity'),
+			])
+		except TransactionCanceled as e:
+			if 0 in e.items:
+				return {'message': 'Member already exists in the event'}
+			if e.items.get(1) is None:
+				return {'message': 'Event not found'}
+			return {'message': 'Event is full', 'capacity': e.items[1].get('capacity')}
+		except Exception as e:
+			return {'error': str(e)}
+		if interval:
+			schedule.add(event_id, *interval)
+	event_cache.invalidate(event_id)
+	response = {'message': 'Member added to event successfully'}
+	if overlaps:
+		response['conflicts'] = overlaps
+	return response
 
 
 def delete_event_member(event_id: str, user_id: str) -> dict:
-	# Check if the member exists
-	existing_member = relations_table.get_item(
-		Key={'event_id': event_id, 'user_id': user_id}
-	).get('Item')
-
-	if not existing_member:
-		return {'message': 'No such member exists in the event'}
-
+	key = {'event_id': event_id, 'user_id': user_id}
+	with schedule_lock(user_id):
+		try:
+			storage.transact_write([
+				Delete('EventMemberRelation', key, if_exists=True),
+				Increment('Event', {'event_id': event_id}, 'attendee_count', -1),
+			])
+		except TransactionCanceled as e:
+			if 0 in e.items:
+				return {'message': 'No such member exists in the event'}
+			# the event is gone (or has no count yet): the relation goes on its own
+			try:
+				relations_table.delete_item(key)
+			except Exception as e:
+				return {'error': str(e)}
+		except Exception as e:
+			return {'error': str(e)}
+		schedule = schedule_cache.get(user_id)
+		if schedule is not None:
+			schedule.remove(event_id)
+	event_cache.invalidate(event_id)
+	return {'message': 'Member removed from event successfully'}
+
+
+def get_attendee_count(event_id: str) -> dict:
+	event = events_table.get_item({'event_id': event_id})
+	if event is None:
+		return None
+	return {'event_id': event_id, 'attendee_count': event.get('attendee_count', 0), 'capacity': event.get('capacity')}
+
+
+# Summaries kept by the change processor (src/aggregates.py): one read each,
+# a moment behind the latest writes
+def get_event_summary(event_id: str) -> dict:
+	item = aggregates_table.get_item(event_key(event_id))
+	return summary(item) if item else None
+
+def get_group_summary(group_id: str) -> dict:
+	item = aggregates_table.get_item(group_key(group_id))
+	return summary(item) if item else None
+
+
+def _join_chunk(event_id: str, user_ids: list) -> dict:
+	# Adds up to TRANSACT_SIZE - 1 members in one transaction. DynamoDB cannot
+	# check count + n <= capacity, so the count is read and the transaction is
+	# conditional on it being unchanged; after a concurrent join it is read again.
+	statuses = {}
+	for attempt in range(BATCH_MAX_ATTEMPTS):
+		event = events_table.get_item({'event_id': event_id})
+		if event is None:
+			break
+		count = int(event.get('attendee_count', 0))
+		interval = dict(zip(('start_key', 'end_key'), event_interval(event) or ()))
+		admitted = user_ids[:max(0, int(event['capacity']) - count)]
+		for user_id in user_ids[len(admitted):]:
+			statuses[user_id] = 'full'
+		if not admitted:
+			return statuses
+		try:
+			storage.transact_write(
+				[Put('EventMemberRelation', {'event_id': event_id, 'user_id': user_id, **interval}, if_not_exists=True) for user_id in admitted]
+				+ [Increment('Event', {'event_id': event_id}, 'attendee_count', len(admitted), at_most='capacity', expected=count)]
+			)
+			statuses.update((user_id, 'added') for user_id in admitted)
+			return statuses
+		except TransactionCanceled as e:
+			# members that joined meanwhile drop out, the rest try again
+			joined = {admitted[position] for position in e.items if position < len(admitted)}
+			statuses.update((user_id, 'exists') for user_id in joined)
+			user_ids = [user_id for user_id in admitted if user_id not in joined]
+		except Exception as e:
+			print(f"Adding members to {event_id} failed: {e}")
+			user_ids = admitted
+	statuses.update((user_id, 'failed') for user_id in user_ids if user_id not in statuses)
+	return statuses
+
+
+def add_event_members(event_id: str, user_ids: list) -> dict:
+	# existing members are found with BatchGetItem instead of a get_item per user;
+	# the rest join in transactions that keep attendee_count within capacity
+	error = _too_many(user_ids)
+	if error:
+		return error
+	unique_ids = list(dict.fromkeys(user_ids))
 	try:
-		response = relations_table.delete_item(
-			Key={'event_id': event_id, 'user_id': user_id}
-		)
-		return {'message': 'Member removed from event successfully', 'response': response}
+		if events_table.get_item({'event_id': event_id}) is None:
+			return {'message': 'Event not found'}
+		existing = {item['user_id'] for item in batch_get(relations_table, [{'event_id': event_id, 'user_id': user_id} for user_id in unique_ids])}
 	except Exception as e:
 		return {'error': str(e)}
+	statuses = {user_id: 'exists' for user_id in existing}
+	for chunk in chunked([user_id for user_id in unique_ids if user_id not in existing], TRANSACT_SIZE - 1):
+		statuses.update(_join_chunk(event_id, chunk))
+	event_cache.invalidate(event_id)
+	# bulk joins are not checked for conflicts; the schedules load again when next used
+	for user_id, status in statuses.items():
+		if status == 'added':
+			schedule_cache.invalidate(user_id)
+
+	# a user listed again is written once; the repeats are reported as members already
+	results, seen = [], set()
+	for user_id in user_ids:
+		results.append({'user_id': user_id, 'status': 'exists' if user_id in seen else statuses[user_id]})
+		seen.add(user_id)
+	response = _bulk_response(results, 'added')
+	response['full'] = sum(1 for result in results if result['status'] == 'full')
+	return response
 
 
 # def get_group(event_id: int) -> dict:
@@ -397,79 +727,95 @@ def delete_event_member(event_id: str, user_id: str) -> dict:
 #         return []
 
 
-def list_comments_by_event_id(event_id: str) -> list:
-	try:
-		response = comments_table.scan(
-			FilterExpression=boto3.dynamodb.conditions.Attr('event_id').eq(event_id)
-		)
-		return response.get('Items', [])
-	except Exception as e:
-		print(f"Error querying table: {str(e)}")
-		return []
-
-
-def add_comment(event_id: str, user_id: str, comment_text: str) -> dict:
-	# Check if the user has already commented on the event
-	response = comments_table.scan(
-		FilterExpression=Attr('event_id').eq(event_id) & Attr('user_id').eq(user_id)
+def list_comments_by_event_id(event_id: str, limit: int = 10, cursor: str = None) -> dict:
+	# Query the event_id index, oldest comment first
+	page = comments_table.query(
+		event_id,
+		index='event_id-created_at-index',
+		limit=page_size(limit),
+		start_key=decode_cursor(cursor)
 	)
+	return page_response(page)
 
-	if response.get('Items'):
-		return {'message': 'User has already commented on this event'}
 
-	# If the user hasn't commented, add the new comment
+# One comment per user per event: the comment id is derived from (event_id, user_id)
+# (models.comment_id_for), so a conditional put both enforces uniqueness and
+# writes the comment in one round trip
+def add_comment(event_id: str, user_id: str, comment_text: str) -> dict:
 	try:
-		comment_id = str(uuid.uuid4())
+		comment_id = comment_id_for(event_id, user_id)
 		comment_dict = {
 			'comment_id': comment_id,
 			'event_id': event_id,
 			'user_id': user_id,
-			'text': comment_text
+			'text': comment_text,
+			'created_at': datetime.now().isoformat()
 		}
-		comments_table.put_item(Item=comment_dict)
+		comments_table.put_item(comment_dict, if_not_exists=True)
 		return {'message': 'Comment added successfully', 'comment_id': comment_id}
+	except ConditionFailed:
+		return {'message': 'User has already commented on this event'}
 	except Exception as e:
 		return {'error': str(e)}
 
+def add_comments(event_id: str, comments: list) -> dict:
+	# comments: list of {'user_id', 'text'}. BatchWriteItem has no conditions, so
+	# users who already commented are found up front; the derived comment id still
+	# keeps it to one comment per user if a single add races with the batch.
+	error = _too_many(comments)
+	if error:
+		return error
+	by_id = {}
+	for comment in comments:
+		by_id.setdefault(comment_id_for(event_id, comment['user_id']), comment)
+	try:
+		existing = {item['comment_id'] for item in batch_get(comments_table, [{'comment_id': comment_id} for comment_id in by_id])}
+	except Exception as e:
+		return {'error': str(e)}
+	created_at = datetime.now().isoformat()
+	puts = [
+		{'comment_id': comment_id, 'event_id': event_id, 'user_id': comment['user_id'], 'text': comment['text'], 'created_at': created_at}
+		for comment_id, comment in by_id.items() if comment_id not in existing
+	]
+	failed_puts, _ = batch_write(comments_table, puts=puts)
+	failed_ids = {item['comment_id'] for item in failed_puts}
+
+	# of several comments by one user, the first is written and the others are
+	# reported as existing
+	results, seen = [], set()
+	for comment in comments:
+		comment_id = comment_id_for(event_id, comment['user_id'])
+		if comment_id in seen or comment_id in existing:
+			status = 'exists'
+		else:
+			status = 'failed' if comment_id in failed_ids else 'added'
+		seen.add(comment_id)
+		results.append({'user_id': comment['user_id'], 'comment_id': comment_id, 'status': status})
+	return _bulk_response(results, 'added')
+
 def update_comment(comment_id: str, new_comment: str) -> dict:
 	# Check if the comment exists
-	existing_comment = comments_table.get_item(
-		Key={'comment_id': comment_id}
-	).get('Item')
+	existing_comment = comments_table.get_item({'comment_id': comment_id})
 
 	if not existing_comment:
 		return {'message': 'No such comment exists'}
 
 	try:
-		response = comments_table.update_item(
-			Key={'comment_id': comment_id},
-			UpdateExpression="set #t = :t",
-			ExpressionAttributeNames={
-				'#t': 'text'
-			},
-			ExpressionAttributeValues={
-				':t': new_comment
-			},
-			ReturnValues="UPDATED_NEW"
-		)
-		return {'message': 'Comment updated successfully', 'response': response}
+		comments_table.update_item({'comment_id': comment_id}, {'text': new_comment})
+		return {'message': 'Comment updated successfully'}
 	except Exception as e:
 		return {'error': str(e)}
 
 def delete_comment(comment_id: str) -> dict:
 	# Check if the comment exists
-	existing_comment = comments_table.get_item(
-		Key={'comment_id': comment_id}
-	).get('Item')
+	existing_comment = comments_table.get_item({'comment_id': comment_id})
 
 	if not existing_comment:
 		return {'message': 'No such comment exists'}
 
 	try:
-		response = comments_table.delete_item(
-			Key={'comment_id': comment_id}
-		)
-		return {'message': 'Comment deleted successfully', 'response': response}
+		comments_table.delete_item({'comment_id': comment_id})
+		return {'message': 'Comment deleted successfully'}
 	except Exception as e:
 		return {'error': str(e)}
 
@@ -0,0 +1,162 @@
+import asyncio
+import os
+import time
+
+from . import repository
+from .batch import batch_write, chunked
+from .storage import ConditionFailed
+from .sns import OUTBOX_DEAD, OUTBOX_PENDING, SNS_BATCH_SIZE
+from .timekeys import key_age, utc_key_after, utc_now_key
+
+# Background publisher for the Outbox table: due entries are read from the
+# status index, published SNS_BATCH_SIZE at a time, then deleted. A failed entry
+# is retried after OUTBOX_BASE_DELAY * 2^attempt seconds (capped at
+# OUTBOX_MAX_DELAY) and marked "dead" after OUTBOX_MAX_ATTEMPTS attempts, where it
+# stays for inspection. Delivery is at least once: a crash between publishing
+# and deleting an entry publishes it again.
+#
+# Every instance runs a dispatcher. Before publishing, an instance claims each
+# entry by moving its available_at to the end of a lease (OUTBOX_LEASE seconds)
+# with a conditional write that holds only if the entry is still pending and
+# still due at the time it read; an entry another instance claimed first is
+# skipped. If the claiming instance dies, the entry is due again when the lease
+# runs out.
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '1.0'))
+OUTBOX_PAGE_SIZE = int(os.getenv('OUTBOX_PAGE_SIZE', '100'))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BASE_DELAY = float(os.getenv('OUTBOX_BASE_DELAY', '1.0'))
+OUTBOX_MAX_DELAY = 300.0
+OUTBOX_LEASE = float(os.getenv('OUTBOX_LEASE', '60'))
+
+OUTBOX_INDEX = 'status-available_at-index'
+
+
+class OutboxDispatcher:
+	def __init__(self, get_table, publisher, poll_interval: float = OUTBOX_POLL_INTERVAL,
+			page_size: int = OUTBOX_PAGE_SIZE, max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+			base_delay: float = OUTBOX_BASE_DELAY, lease: float = OUTBOX_LEASE):
+		self.get_table = get_table
+		self.publisher = publisher
+		self.poll_interval = poll_interval
+		self.page_size = page_size
+		self.max_attempts = max_attempts
+		self.base_delay = base_delay
+		self.lease = lease
+		self._task = None
+		self._wake = None
+		self._counters = {
+			'published': 0, 'failed_attempts': 0, 'retried': 0, 'dead_lettered': 0, 'batches': 0, 'errors': 0, 'claims_lost': 0,
+		}
+		self._lag = 0.0
+		self._dispatch_last = 0.0
+
+	async def start(self):
+		if self._task is None:
+			self._wake = asyncio.Event()
+			self._task = asyncio.get_running_loop().create_task(self._run())
+
+	def wake(self):
+		# called after writing outbox entries, so they do not wait for the next poll
+		if self._wake is not None:
+			self._wake.set()
+
+	def _retry_delay(self, attempts: int) -> float:
+		return min(self.base_delay * (2 ** (attempts - 1)), OUTBOX_MAX_DELAY)
+
+	def _settle(self, messages: list, failures: dict):
+		deletes, puts = [], []
+		for message in messages:
+			error = failures.get(message['message_id'])
+			if error is None:
+				deletes.append({'message_id': message['message_id']})
+				continue
+			attempts = int(message.get('attempts', 0)) + 1
+			retry = dict(message, attempts=attempts, last_error=str(error))
+			if attempts >= self.max_attempts:
+				retry['status'] = OUTBOX_DEAD
+				self._counters['dead_lettered'] += 1
+			else:
+				retry['available_at'] = utc_key_after(self._retry_delay(attempts))
+				self._counters['retried'] += 1
+			puts.append(retry)
+		self._counters['published'] += len(deletes)
+		self._counters['failed_attempts'] += len(puts)
+		return puts, deletes
+
+	def _claim(self, table, message: dict) -> bool:
+		try:
+			table.update_changed(
+				{'message_id': message['message_id']},
+				{'available_at': utc_key_after(self.lease)},
+				expected={'status': OUTBOX_PENDING, 'available_at': message['available_at']}
+			)
+		except ConditionFailed:
+			return False
+		return True
+
+	async def dispatch_once(self) -> bool:
+		# publishes one page of due entries; returns True when more may be due
+		start = time.perf_counter()
+		table = self.get_table()
+		page = await repository.run_storage(
+			table.query, OUTBOX_PENDING, index=OUTBOX_INDEX, limit=self.page_size, range_to=utc_now_key()
+		)
+		self._lag = max((key_age(message['created_at']) for message in page.items), default=0.0)
+		claimed = await asyncio.gather(*(repository.run_storage(self._claim, table, message) for message in page.items))
+		messages = [message for message, won in zip(page.items, claimed) if won]
+		self._counters['claims_lost'] += len(page.items) - len(messages)
+
+		puts, deletes = [], []
+		for batch in chunked(messages, SNS_BATCH_SIZE):
+			try:
+				failures = await repository.run_storage(self.publisher.publish_batch, batch)
+			except Exception as e:
+				failures = {message['message_id']: e for message in batch}
+			self._counters['batches'] += 1
+			settled_puts, settled_deletes = self._settle(batch, failures)
+			puts += settled_puts
+			deletes += settled_deletes
+		if puts or deletes:
+			await repository.run_storage(batch_write, table, puts, deletes)
+		self._dispatch_last = time.perf_counter() - start
+		return page.last_key is not None
+
+	async def _run(self):
+		while True:
+			try:
+				more = await self.dispatch_once()
+			except Exception as e:
+				print(f"Outbox dispatch failed: {e}")
+				self._counters['errors'] += 1
+				more = False
+			if more:
+				continue
+			try:
+				await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+			except asyncio.TimeoutError:
+				pass
+			self._wake.clear()
+
+	async def stop(self, timeout: float = 10.0):
+		# publish what is already due, then stop the dispatcher
+		if self._task is None:
+			return
+		self._task.cancel()
+		try:
+			await self._task
+		except asyncio.CancelledError:
+			pass
+		self._task = None
+		try:
+			deadline = time.monotonic() + timeout
+			while await self.dispatch_once() and time.monotonic() < deadline:
+				pass
+		except Exception as e:
+			print(f"Outbox shutdown dispatch failed: {e}")
+
+	def stats(self) -> dict:
+		return {
+			**self._counters,
+			'lag_seconds': round(self._lag, 3),
+			'dispatch_last_ms': round(self._dispatch_last * 1000, 3),
+		}
@@ -0,0 +1,47 @@
+import base64
+import json
+from decimal import Decimal
+from typing import Optional
+
+# Largest page a client may ask for; each page costs one storage call of at most this many items
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+	pass
+
+
+def json_default(value):
+	# DynamoDB numbers come back as Decimal
+	if isinstance(value, Decimal):
+		return int(value) if value == value.to_integral_value() else float(value)
+	raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def encode_cursor(last_key: Optional[dict]) -> Optional[str]:
+	# opaque continuation token wrapping the storage LastEvaluatedKey
+	if not last_key:
+		return None
+	raw = json.dumps(last_key, separators=(',', ':'), sort_keys=True, default=json_default)
+	return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+	if not cursor:
+		return None
+	try:
+		raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+		key = json.loads(raw)
+	except (ValueError, TypeError):
+		raise InvalidCursor('Invalid cursor')
+	if not isinstance(key, dict):
+		raise InvalidCursor('Invalid cursor')
+	return key
+
+
+def page_size(limit: int) -> int:
+	return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def page_response(page) -> dict:
+	return {'items': page.items, 'next_cursor': encode_cursor(page.last_key)}
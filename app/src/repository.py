@@ -0,0 +1,118 @@
+import asyncio
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from . import operations
+
+# boto3 is blocking, so every storage call runs on a dedicated, bounded thread
+# pool instead of on the event loop. STORAGE_WORKERS caps the threads (and so the
+# number of concurrent storage round trips); STORAGE_MAX_PENDING caps how many
+# calls may be waiting on the pool so a burst applies backpressure to handlers
+# instead of growing the executor queue without bound.
+STORAGE_WORKERS = int(os.getenv('STORAGE_WORKERS', '64'))
+STORAGE_MAX_PENDING = int(os.getenv('STORAGE_MAX_PENDING', '512'))
+
+_executor = None
+_limiters = weakref.WeakKeyDictionary()
+
+
+def get_executor() -> ThreadPoolExecutor:
+	global _executor
+	if _executor is None:
+		_executor = ThreadPoolExecutor(max_workers=STORAGE_WORKERS, thread_name_prefix='storage')
+	return _executor
+
+
+def _get_limiter(loop) -> asyncio.Semaphore:
+	# semaphores are bound to the loop they are first used on
+	limiter = _limiters.get(loop)
+	if limiter is None:
+		limiter = asyncio.Semaphore(STORAGE_MAX_PENDING)
+		_limiters[loop] = limiter
+	return limiter
+
+
+async def run_storage(func, *args, **kwargs):
+	loop = asyncio.get_running_loop()
+	async with _get_limiter(loop):
+		return await loop.run_in_executor(get_executor(), partial(func, *args, **kwargs))
+
+
+async def iterate_storage(items):
+	# an async view of a blocking iterator that reads storage as it goes (e.g. an
+	# export): each step runs on the storage pool like any other storage call
+	items = iter(items)
+	done = object()
+	try:
+		while True:
+			item = await run_storage(next, items, done)
+			if item is done:
+				return
+			yield item
+	finally:
+		close = getattr(items, 'close', None)
+		if close:
+			try:
+				await run_storage(close)
+			except ValueError:
+				# a step cancelled mid-way is still running; the generator ends with it
+				pass
+
+
+def shutdown(wait: bool = True):
+	global _executor
+	if _executor is not None:
+		_executor.shutdown(wait=wait)
+		_executor = None
+
+
+def _async(func):
+	@wraps(func)
+	async def wrapper(*args, **kwargs):
+		return await run_storage(func, *args, **kwargs)
+	return wrapper
+
+
+# ===== Events =====
+add_event = _async(operations.add_event)
+add_events = _async(operations.add_events)
+get_event = _async(operations.get_event)
+get_events = _async(operations.get_events)
+delete_event = _async(operations.delete_event)
+list_events_by_group_id = _async(operations.list_events_by_group_id)
+list_upcoming_events = _async(operations.list_upcoming_events)
+search_events = _async(operations.search_events)
+rebuild_search_index = _async(operations.rebuild_search_index)
+patch_event = _async(operations.patch_event)
+update_event_name = _async(operations.update_event_name)
+update_event_duration = _async(operations.update_event_duration)
+update_event_location = _async(operations.update_event_location)
+update_event_time = _async(operations.update_event_time)
+update_event_capacity = _async(operations.update_event_capacity)
+update_event_status = _async(operations.update_event_status)
+update_event_description = _async(operations.update_event_description)
+update_event_tag2 = _async(operations.update_event_tag2)
+
+# ===== Attendees =====
+list_events_by_user_id = _async(operations.list_events_by_user_id)
+list_schedule_conflicts = _async(operations.list_schedule_conflicts)
+list_attendees = _async(operations.list_attendees)
+get_attendee_count = _async(operations.get_attendee_count)
+get_event_summary = _async(operations.get_event_summary)
+get_group_summary = _async(operations.get_group_summary)
+add_event_member = _async(operations.add_event_member)
+add_event_members = _async(operations.add_event_members)
+delete_event_member = _async(operations.delete_event_member)
+
+# ===== Comments =====
+list_comments_by_event_id = _async(operations.list_comments_by_event_id)
+add_comment = _async(operations.add_comment)
+add_comments = _async(operations.add_comments)
+update_comment = _async(operations.update_comment)
+delete_comment = _async(operations.delete_comment)
+
+# ===== Logs =====
+list_logs = _async(operations.list_logs)
+get_event_log_by_event_id = _async(operations.get_event_log_by_event_id)
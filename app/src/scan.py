@@ -0,0 +1,84 @@
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+from .batch import CapacityLimiter
+from .storage import Table
+
+# Full-table reads as DynamoDB parallel scans: the table is split into
+# Segment/TotalSegments parts, each followed through LastEvaluatedKey on its own
+# thread, and items are handed to the caller page by page as they arrive.
+#   SCAN_SEGMENTS      segments the table is split into
+#   SCAN_CONCURRENCY   segments read at once
+#   SCAN_PAGE_SIZE     items per Scan call (DynamoDB also stops a page at 1 MB)
+SCAN_SEGMENTS = int(os.getenv('SCAN_SEGMENTS', '8'))
+SCAN_CONCURRENCY = int(os.getenv('SCAN_CONCURRENCY', '4'))
+SCAN_PAGE_SIZE = int(os.getenv('SCAN_PAGE_SIZE', '1000'))
+# seconds a reader waits for room in the queue before checking whether the scan was closed
+_PUT_TIMEOUT = 0.1
+
+_DONE = object()
+
+
+class _Failed:
+	def __init__(self, error: Exception):
+		self.error = error
+
+
+def parallel_scan(table: Table, where: Optional[dict] = None, segments: int = SCAN_SEGMENTS,
+		concurrency: int = SCAN_CONCURRENCY, page_size: int = SCAN_PAGE_SIZE,
+		max_rcu: Optional[float] = None) -> Iterator[dict]:
+	# Yields every item of the table (matching `where`), in no particular order.
+	# At most `concurrency` pages are buffered ahead of the caller, and with
+	# max_rcu reads are paced to that many read capacity units per second.
+	# Closing the generator early stops the readers.
+	limiter = CapacityLimiter(lambda: table.storage.read_capacity, max_rcu)
+	pages = queue.Queue(maxsize=concurrency)
+	stopped = threading.Event()
+
+	def put(message) -> bool:
+		while not stopped.is_set():
+			try:
+				pages.put(message, timeout=_PUT_TIMEOUT)
+				return True
+			except queue.Full:
+				pass
+		return False
+
+	def read_segment(segment: int):
+		try:
+			start_key = None
+			while not stopped.is_set():
+				limiter.wait()
+				page = table.scan(where=where, limit=page_size, start_key=start_key, segment=segment, total_segments=segments)
+				if page.items and not put(page.items):
+					return
+				start_key = page.last_key
+				if not start_key:
+					break
+			put(_DONE)
+		except Exception as e:
+			put(_Failed(e))
+
+	executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix=f'scan-{table.name}')
+	try:
+		for segment in range(segments):
+			executor.submit(read_segment, segment)
+		remaining = segments
+		while remaining:
+			message = pages.get()
+			if message is _DONE:
+				remaining -= 1
+			elif isinstance(message, _Failed):
+				raise message.error
+			else:
+				yield from message
+	finally:
+		stopped.set()
+		executor.shutdown(wait=True, cancel_futures=True)
+
+
+def scan_all(table: Table, where: Optional[dict] = None, **options) -> list:
+	return list(parallel_scan(table, where=where, **options))
@@ -0,0 +1,90 @@
+import os
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from .timekeys import KEY_FORMAT, to_utc_key
+
+# Per-user schedules for conflict checks. A member's EventMemberRelation item
+# carries the interval of the event (start_key, end_key) from the moment they
+# join, so a user's schedule loads with one query of user_id-event_id-index and
+# no event reads. A schedule keeps the intervals sorted by start; an overlap
+# check bisects to the events starting before the new one ends and looks back
+# no further than the longest interval it holds, so it costs O(log n) plus the
+# overlaps it finds.
+CONFLICT_MODES = ('allow', 'flag', 'reject')
+# what a join does about overlaps unless the request says otherwise
+SCHEDULE_CONFLICTS = os.getenv('SCHEDULE_CONFLICTS', 'flag')
+# cancelled events take no time in anyone's schedule
+FREE_STATUSES = {'Cancelled'}
+
+
+def _parse(key: str) -> datetime:
+	return datetime.strptime(key, KEY_FORMAT)
+
+
+def event_interval(event: dict) -> Optional[tuple]:
+	# (start_key, end_key) of an event, or None when it takes no time: cancelled,
+	# or stored with a time that is not ISO 8601
+	if event.get('status') in FREE_STATUSES:
+		return None
+	try:
+		start_key = event.get('time_key') or to_utc_key(event['time'])
+		minutes = int(event.get('duration') or 0)
+	except (KeyError, TypeError, ValueError):
+		return None
+	return start_key, (_parse(start_key) + timedelta(minutes=minutes)).strftime(KEY_FORMAT)
+
+
+def relation_interval(relation: dict) -> Optional[tuple]:
+	if not relation.get('start_key') or not relation.get('end_key'):
+		return None
+	return relation['start_key'], relation['end_key']
+
+
+class Schedule:
+	# The intervals of one user's events as (start_key, end_key, event_id),
+	# sorted. Callers serialize changes to a schedule (see operations.schedule_lock).
+
+	def __init__(self, entries: Iterable[tuple] = ()):
+		self._entries = sorted(entries)
+		self._by_event = {entry[2]: entry for entry in self._entries}
+		# an upper bound: it is not lowered when the longest event leaves
+		self._longest = max((_parse(end) - _parse(start) for start, end, _ in self._entries), default=timedelta(0))
+
+	def __len__(self) -> int:
+		return len(self._entries)
+
+	def add(self, event_id: str, start_key: str, end_key: str):
+		self.remove(event_id)
+		entry = (start_key, end_key, event_id)
+		insort(self._entries, entry)
+		self._by_event[event_id] = entry
+		self._longest = max(self._longest, _parse(end_key) - _parse(start_key))
+
+	def remove(self, event_id: str):
+		entry = self._by_event.pop(event_id, None)
+		if entry is not None:
+			del self._entries[bisect_left(self._entries, entry)]
+
+	def overlapping(self, start_key: str, end_key: str, exclude: str = None) -> List[str]:
+		# ids of the events that overlap [start_key, end_key), by start; an event
+		# ending when the other starts does not overlap it
+		floor = (_parse(start_key) - self._longest).strftime(KEY_FORMAT)
+		low = bisect_left(self._entries, (floor,))
+		high = bisect_left(self._entries, (end_key,))
+		return [event_id for start, end, event_id in self._entries[low:high] if end > start_key and event_id != exclude]
+
+	def conflicts(self) -> List[tuple]:
+		# every overlapping pair as (earlier id, later id, overlap start, overlap
+		# end), in one sweep by start: each event is compared with the ones
+		# starting before it ends
+		pairs = []
+		for position, (start, end, event_id) in enumerate(self._entries):
+			later = position + 1
+			while later < len(self._entries) and self._entries[later][0] < end:
+				later_start, later_end, later_id = self._entries[later]
+				pairs.append((event_id, later_id, later_start, min(end, later_end)))
+				later += 1
+		return pairs
@@ -0,0 +1,308 @@
+import gc
+import itertools
+import os
+import re
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterable, List, Optional
+
+# In-process inverted index over event names, tags and descriptions. Every
+# token maps to the events holding it, per field weight; the weight is what a
+# query term scores when it matches there (the best field counts once per
+# term). Queries AND their terms, each term also matches tokens it is a prefix
+# of, and tag filters AND exact tag values. Results are collected best score
+# first and the query stops once it has `limit` of them, so a common word costs
+# no more than a rare one and matches are never counted or sorted in full.
+#
+# The index lives in each process: it is rebuilt from a parallel scan at
+# startup and kept current by this process's event writes.
+SEARCH_FIELDS = (('event_name', 3), ('tag_1', 2), ('tag_2', 2), ('description', 1))
+# terms shorter than this only match whole tokens
+SEARCH_MIN_PREFIX = int(os.getenv('SEARCH_MIN_PREFIX', '2'))
+SEARCH_MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', '5'))
+# new tokens wait in a small set before joining the sorted vocabulary
+_RECENT_TOKENS = 1024
+# candidates checked one by one before a query falls back to set intersection
+_WALK = 2000
+
+_TOKEN = re.compile(r'[^\W_]+')
+_WEIGHTS = sorted({weight for _, weight in SEARCH_FIELDS}, reverse=True)
+# position of each field's weight in _WEIGHTS
+_LEVEL = [_WEIGHTS.index(weight) for _, weight in SEARCH_FIELDS]
+
+# Garbage collector thresholds while an index is built (see build_gc_thresholds)
+BUILD_GC_THRESHOLDS = (50000, 20, 20)
+
+
+@contextmanager
+def build_gc_thresholds(thresholds: tuple = BUILD_GC_THRESHOLDS):
+	# A build makes millions of long-lived containers, and with the default
+	# thresholds cyclic collection walks them again and again (a 1M-event build
+	# takes twice as long). Collection stays on, only less often, until the
+	# block ends. The thresholds are process-wide: garbage cycles made by
+	# requests served meanwhile also wait longer, so memory runs higher.
+	previous = gc.get_threshold()
+	gc.set_threshold(*thresholds)
+	try:
+		yield
+	finally:
+		gc.set_threshold(*previous)
+
+
+def tokenize(text) -> List[str]:
+	if not text:
+		return []
+	return [sys.intern(token) for token in _TOKEN.findall(str(text).lower())]
+
+
+def tag_value(tag) -> Optional[str]:
+	if tag is None:
+		return None
+	return str(tag).strip().lower() or None
+
+
+class SearchError(ValueError):
+	pass
+
+
+class SearchIndex:
+	def __init__(self):
+		self._lock = threading.RLock()
+		# token -> [event ids holding it in a field of each weight in _WEIGHTS]
+		self._postings = {}
+		# event id -> (token tuples per field, (tag_1, tag_2) values), to take an event out again
+		self._docs = {}
+		# exact tag value -> event ids
+		self._tags = {}
+		self._sorted_tokens = []
+		self._recent_tokens = set()
+		# ids written while a rebuild runs; the scan's older copies of them are skipped
+		self._touched = None
+		self._closed = False
+		self.ready = False
+		self._counters = {'queries': 0, 'builds': 0}
+		self._build_seconds = 0.0
+		self._query_last = 0.0
+
+	# ===== writes =====
+
+	@staticmethod
+	def _entries(doc: tuple) -> set:
+		# (token, level) pairs of an event; a token in both tags counts once
+		return {(token, _LEVEL[field]) for field, tokens in enumerate(doc) for token in tokens}
+
+	def _add_token(self, token: str, level: int, event_id: str):
+		levels = self._postings.get(token)
+		if levels is None:
+			levels = self._postings[token] = [set() for _ in _WEIGHTS]
+			self._recent_tokens.add(token)
+			if len(self._recent_tokens) > _RECENT_TOKENS:
+				self._merge_tokens()
+		levels[level].add(event_id)
+
+	def _merge_tokens(self):
+		# tokens whose postings emptied are dropped here, not when they empty
+		self._sorted_tokens = sorted(token for token in itertools.chain(self._sorted_tokens, self._recent_tokens) if token in self._postings)
+		self._recent_tokens = set()
+
+	def _insert(self, event_id: str, doc: tuple, tags: tuple):
+		self._docs[event_id] = (doc, tags)
+		for token, level in self._entries(doc):
+			self._add_token(token, level, event_id)
+		for tag in set(tags) - {None}:
+			self._tags.setdefault(tag, set()).add(event_id)
+
+	def _delete(self, event_id: str):
+		entry = self._docs.pop(event_id, None)
+		if entry is None:
+			return None
+		doc, tags = entry
+		for token, level in self._entries(doc):
+			levels = self._postings.get(token)
+			if levels is None:
+				continue
+			levels[level].discard(event_id)
+			if not any(levels):
+				del self._postings[token]
+		for tag in set(tags) - {None}:
+			ids = self._tags.get(tag)
+			if ids is not None:
+				ids.discard(event_id)
+				if not ids:
+					del self._tags[tag]
+		return entry
+
+	@staticmethod
+	def _doc_of(item: dict) -> tuple:
+		return tuple(tuple(dict.fromkeys(tokenize(item.get(name)))) for name, _ in SEARCH_FIELDS)
+
+	@staticmethod
+	def _tags_of(item: dict) -> tuple:
+		return tag_value(item.get('tag_1')), tag_value(item.get('tag_2'))
+
+	def put(self, item: dict):
+		# adds an event, or replaces what is indexed for it
+		event_id = item['event_id']
+		doc, tags = self._doc_of(item), self._tags_of(item)
+		with self._lock:
+			self._delete(event_id)
+			self._insert(event_id, doc, tags)
+			if self._touched is not None:
+				self._touched.add(event_id)
+
+	def update(self, event_id: str, changes: dict):
+		# re-indexes the changed fields of an indexed event; other changes are ignored
+		names = [name for name, _ in SEARCH_FIELDS]
+		if not any(name in changes for name in names):
+			return
+		with self._lock:
+			entry = self._docs.get(event_id)
+			if entry is None:
+				return
+			doc = list(entry[0])
+			for field, name in enumerate(names):
+				if name in changes:
+					doc[field] = tuple(dict.fromkeys(tokenize(changes[name])))
+			tags = tuple(tag_value(changes[name]) if name in changes else tag for name, tag in zip(('tag_1', 'tag_2'), entry[1]))
+			self._delete(event_id)
+			self._insert(event_id, tuple(doc), tags)
+			if self._touched is not None:
+				self._touched.add(event_id)
+
+	def remove(self, event_id: str):
+		with self._lock:
+			self._delete(event_id)
+			if self._touched is not None:
+				self._touched.add(event_id)
+
+	def rebuild(self, items: Iterable[dict], batch_size: int = 1000) -> int:
+		# fills the index from a full read of the table while it keeps serving
+		# queries (with partial results until ready) and taking writes
+		start = time.perf_counter()
+		with self._lock:
+			self._touched = set()
+		count = 0
+		try:
+			items = iter(items)
+			while not self._closed:
+				batch = list(itertools.islice(items, batch_size))
+				if not batch:
+					break
+				prepared = [(item['event_id'], self._doc_of(item), self._tags_of(item)) for item in batch]
+				with self._lock:
+					for event_id, doc, tags in prepared:
+						if event_id not in self._touched:
+							self._delete(event_id)
+							self._insert(event_id, doc, tags)
+				count += len(batch)
+		finally:
+			close = getattr(items, 'close', None)
+			if close:
+				close()
+			with self._lock:
+				self._touched = None
+				self._merge_tokens()
+				if not self._closed:
+					self.ready = True
+					self._counters['builds'] += 1
+					self._build_seconds = time.perf_counter() - start
+		return count
+
+	def close(self):
+		# stops a running rebuild
+		self._closed = True
+
+	# ===== queries =====
+
+	def _expand(self, term: str) -> List[str]:
+		# the term itself and, from SEARCH_MIN_PREFIX characters on, every token it starts
+		if len(term) < SEARCH_MIN_PREFIX:
+			return [term] if term in self._postings else []
+		tokens = [token for token in self._recent_tokens if token.startswith(term)]
+		position = bisect_left(self._sorted_tokens, term)
+		while position < len(self._sorted_tokens) and self._sorted_tokens[position].startswith(term):
+			tokens.append(self._sorted_tokens[position])
+			position += 1
+		return [token for token in dict.fromkeys(tokens) if token in self._postings]
+
+	def _levels(self, term: str) -> list:
+		# [(weight, [ids, ...])] for a term, best weight first: the events holding
+		# a token it matches (one set per token) in a field of that weight. An
+		# event can be at several levels.
+		tokens = self._expand(term)
+		levels = []
+		for level, weight in enumerate(_WEIGHTS):
+			sets = [self._postings[token][level] for token in tokens if self._postings[token][level]]
+			if sets:
+				levels.append((weight, sets))
+		return levels
+
+	def search(self, query: str = '', tags: List[str] = (), limit: int = 10) -> List[tuple]:
+		# [(event_id, score)], best first; ties come in no particular order
+		terms = list(dict.fromkeys(tokenize(query)))
+		if len(terms) > SEARCH_MAX_TERMS:
+			raise SearchError(f'Too many search terms, at most {SEARCH_MAX_TERMS}')
+		tags = [tag for tag in (tag_value(tag) for tag in tags) if tag]
+		if not terms and not tags:
+			raise SearchError('Give a query or at least one tag')
+		start = time.perf_counter()
+		with self._lock:
+			hits = self._search(terms, tags, limit)
+			self._counters['queries'] += 1
+			self._query_last = time.perf_counter() - start
+		return hits
+
+	def _search(self, terms: List[str], tags: List[str], limit: int) -> List[tuple]:
+		tag_sets = [[self._tags.get(tag, set())] for tag in tags]
+		levels = [self._levels(term) for term in terms]
+		if not all(levels):
+			return []
+		# every way of matching each term at one of its levels, best total first.
+		# Each is walked from its smallest part, checking the others, and an
+		# event is taken at the first (best) combination it turns up in, so the
+		# sweep stops as soon as the page is full.
+		score_of = lambda combination: sum(weight for weight, _ in combination)
+		combinations = sorted(itertools.product(*levels), key=score_of, reverse=True) if levels else [()]
+		unions = {}
+		hits, taken = [], set()
+		for combination in combinations:
+			parts = sorted([sets for _, sets in combination] + tag_sets, key=lambda sets: sum(map(len, sets)))
+			checks = []
+			for sets in parts[1:]:
+				if len(sets) > 1 and id(sets) not in unions:
+					unions[id(sets)] = set().union(*sets)
+				checks.append(unions[id(sets)] if len(sets) > 1 else sets[0])
+			score = score_of(combination)
+			for walked, event_id in enumerate(itertools.chain.from_iterable(parts[0])):
+				if walked == _WALK and checks:
+					break
+				if event_id not in taken and all(event_id in ids for ids in checks):
+					taken.add(event_id)
+					hits.append((event_id, score))
+					if len(hits) >= limit:
+						return hits
+			else:
+				continue
+			# few of the candidates match: intersect the rest in one go instead of walking it
+			rest = parts[0][0] if len(parts[0]) == 1 else set().union(*parts[0])
+			for event_id in rest.intersection(*checks):
+				if event_id not in taken:
+					taken.add(event_id)
+					hits.append((event_id, score))
+					if len(hits) >= limit:
+						return hits
+		return hits
+
+	def stats(self) -> dict:
+		with self._lock:
+			return {
+				**self._counters,
+				'ready': self.ready,
+				'events': len(self._docs),
+				'tokens': len(self._postings),
+				'build_seconds': round(self._build_seconds, 3),
+				'query_last_ms': round(self._query_last * 1000, 3),
+			}
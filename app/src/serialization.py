@@ -0,0 +1,19 @@
+import orjson
+from starlette.responses import JSONResponse
+
+from .pagination import json_default
+
+# Responses are encoded by orjson in one pass over the storage items; the only
+# Python call is for DynamoDB's Decimal numbers, which become int (or float).
+# Returning FastJSONResponse from a route also skips FastAPI's jsonable_encoder
+# walk, which costs far more than the encoding itself on long lists.
+_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def dumps(content) -> bytes:
+	return orjson.dumps(content, default=json_default, option=_OPTIONS)
+
+
+class FastJSONResponse(JSONResponse):
+	def render(self, content) -> bytes:
+		return dumps(content)
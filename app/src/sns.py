@@ -1,14 +1,33 @@
-import boto3
+import os
+import threading
+import uuid
+from collections import deque
 
-# Initialize the SNS client
-sns_client = boto3.client('sns', region_name='us-east-2')
+from .aws import get_client
+from .timekeys import utc_now_key
 
-# Your SNS topic ARN (replace with your actual ARN)
-topic_arn = 'arn:aws:sns:us-east-2:856186703608:event'
+# PublishBatch takes at most 10 messages per call
+SNS_BATCH_SIZE = 10
+
+# Your SNS topic ARN (replace with your actual ARN); set SNS_TOPIC_ARN to an
+# empty string to publish to the in-process LocalPublisher instead (local
+# storage backends, tests and benchmarks)
+topic_arn = os.getenv('SNS_TOPIC_ARN', 'arn:aws:sns:us-east-2:856186703608:event')
+
+
+def get_sns_client():
+    # shared SNS client from src/aws.py, created on first use in the topic's region
+    return get_client('sns', topic_arn.split(':')[3] if topic_arn else None)
+
+
+OUTBOX_PENDING = 'pending'
+OUTBOX_DEAD = 'dead'
 
 
 def publish_to_sns(message, subject):
-    response = sns_client.publish(
+    if not topic_arn:
+        return None
+    response = get_sns_client().publish(
         TopicArn=topic_arn,
         Message=message,
         Subject=subject
@@ -16,10 +35,67 @@ def publish_to_sns(message, subject):
     return response
 
 
+# Notifications are not published by the request that causes them. They are
+# written to the Outbox table in the same transaction as the change, and the
+# OutboxDispatcher (src/outbox.py) publishes them in the background.
+def outbox_message(message, subject):
+    now = utc_now_key()
+    return {
+        'message_id': str(uuid.uuid4()),
+        'message': message,
+        'subject': subject,
+        'status': OUTBOX_PENDING,
+        'created_at': now,
+        'available_at': now,
+        'attempts': 0
+    }
+
+
 def sns_add_event(event_data):
-    # Publish a message to the SNS topic
-    sns_message = f"Event Created: {event_data['event_id']}"
-    sns_subject = "Event Creation Notification"
-    publish_to_sns(sns_message, sns_subject)
+    # the outbox entry announcing a new event
+    return outbox_message(f"Event Created: {event_data['event_id']}", "Event Creation Notification")
+
+
+class SNSPublisher:
+    def __init__(self, client=None, topic=None):
+        self._client = client
+        self.topic = topic or topic_arn
+
+    @property
+    def client(self):
+        return self._client or get_sns_client()
+
+    def publish_batch(self, messages):
+        # one PublishBatch call for up to SNS_BATCH_SIZE outbox entries;
+        # returns {message_id: error} for the entries that were not published
+        entries = [
+            {'Id': message['message_id'], 'Message': message['message'], 'Subject': message['subject']}
+            for message in messages
+        ]
+        response = self.client.publish_batch(TopicArn=self.topic, PublishBatchRequestEntries=entries)
+        return {failure['Id']: failure.get('Message') or failure.get('Code', 'failed') for failure in response.get('Failed', [])}
+
+
+class LocalPublisher:
+    # In-process stand-in for SNS: keeps the last `keep` published messages.
+    # fail_ids makes chosen messages fail, to exercise retries and dead-lettering.
+    def __init__(self, keep=10000):
+        self.published = deque(maxlen=keep)
+        self.fail_ids = set()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def publish_batch(self, messages):
+        with self._lock:
+            self.calls += 1
+            failed = {}
+            for message in messages:
+                if message['message_id'] in self.fail_ids:
+                    failed[message['message_id']] = 'failure requested'
+                else:
+                    self.published.append(message)
+            return failed
+
 
-    return event_data
+def create_publisher():
+    return SNSPublisher() if topic_arn else LocalPublisher()
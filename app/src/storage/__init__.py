@@ -0,0 +1,44 @@
+import os
+
+from .base import (
+	BATCH_GET_SIZE, BATCH_WRITE_SIZE, TRANSACT_SIZE, Change, ChangeReader, ConditionFailed, Delete, Increment, IndexSchema, Page, Put, Storage,
+	StorageError, Table, TableSchema, TABLES, TransactionCanceled,
+)
+
+# Backend is picked with STORAGE_BACKEND:
+#   dynamodb (default) - AWS DynamoDB in STORAGE_REGION
+#   memory             - in-process dicts with sorted indexes
+#   sqlite             - SQLite file at STORAGE_SQLITE_PATH (default: in memory)
+# STORAGE_LATENCY adds an artificial delay in seconds to every call of the local engines.
+
+_storage = None
+
+
+def create_storage(backend: str = None, **options) -> Storage:
+	backend = backend or os.getenv('STORAGE_BACKEND', 'dynamodb')
+	if backend == 'dynamodb':
+		from .dynamodb import DynamoStorage
+		options.setdefault('region_name', os.getenv('STORAGE_REGION', 'us-east-2'))
+		return DynamoStorage(**options)
+
+	options.setdefault('latency', float(os.getenv('STORAGE_LATENCY', '0')))
+	if backend == 'memory':
+		from .memory import MemoryStorage
+		return MemoryStorage(**options)
+	if backend == 'sqlite':
+		from .sqlite import SQLiteStorage
+		options.setdefault('path', os.getenv('STORAGE_SQLITE_PATH', ':memory:'))
+		return SQLiteStorage(**options)
+	raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def get_storage() -> Storage:
+	global _storage
+	if _storage is None:
+		_storage = create_storage()
+	return _storage
+
+
+def set_storage(storage: Storage):
+	global _storage
+	_storage = storage
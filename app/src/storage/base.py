@@ -0,0 +1,304 @@
+import threading
+import zlib
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# DynamoDB limits on keys per BatchGetItem call and requests per BatchWriteItem call
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+# and on actions per TransactWriteItems call
+TRANSACT_SIZE = 100
+
+
+class IndexSchema(NamedTuple):
+	hash_key: str
+	range_key: Optional[str] = None
+
+
+class TableSchema(NamedTuple):
+	name: str
+	hash_key: str
+	range_key: Optional[str] = None
+	indexes: Dict[str, IndexSchema] = {}
+
+	def key_of(self, item: dict) -> dict:
+		key = {self.hash_key: item[self.hash_key]}
+		if self.range_key:
+			key[self.range_key] = item[self.range_key]
+		return key
+
+	def key_attributes(self, index: Optional[str] = None) -> List[str]:
+		# attributes that make up a pagination key (LastEvaluatedKey) for the table or an index
+		names = [self.hash_key] + ([self.range_key] if self.range_key else [])
+		if index:
+			for name in self.indexes[index]:
+				if name and name not in names:
+					names.append(name)
+		return names
+
+
+# Logical schema shared by every backend. Secondary indexes are declared here
+# once; DynamoDB serves them as GSIs, the local engines maintain them in-process.
+TABLES = {
+	'Event': TableSchema(
+		name='Event',
+		hash_key='event_id',
+		# time_key is the event time as a UTC key, status_month "<status>#<YYYY-MM>"
+		# (see timekeys.event_time_attributes): a group's events are read in time
+		# order whatever offset their times were given with, and upcoming events
+		# of a status are a range read over one partition per month
+		indexes={
+			'group_id-time_key-index': IndexSchema('group_id', 'time_key'),
+			'status_month-time_key-index': IndexSchema('status_month', 'time_key'),
+		},
+	),
+	'Group': TableSchema(name='Group', hash_key='group_id'),
+	'Comment': TableSchema(
+		name='Comment',
+		hash_key='comment_id',
+		indexes={'event_id-created_at-index': IndexSchema('event_id', 'created_at')},
+	),
+	'EventMemberRelation': TableSchema(
+		name='EventMemberRelation',
+		hash_key='event_id',
+		range_key='user_id',
+		indexes={'user_id-event_id-index': IndexSchema('user_id', 'event_id')},
+	),
+	# Audit log, one partition per event ordered by log_key ("<UTC timestamp>#<log_id>").
+	# Every entry also carries feed="events" so the feed index holds all logs in time order;
+	# audit writes are rare enough for a single feed partition.
+	'EventsLogV2': TableSchema(
+		name='EventsLogV2',
+		hash_key='event_id',
+		range_key='log_key',
+		indexes={'feed-log_key-index': IndexSchema('feed', 'log_key')},
+	),
+	# Per-event ("event#<event_id>") and per-group ("group#<group_id>") summaries,
+	# kept by the change processor from the Event, EventMemberRelation and
+	# Comment streams, plus its stream positions ("checkpoint#<table>")
+	'Aggregate': TableSchema(name='Aggregate', hash_key='aggregate_id'),
+	# Notifications waiting to be published, written in the same transaction as
+	# the change they announce. Entries are deleted once published; the index
+	# lists them per status ("pending", "dead") in the order they become due.
+	'Outbox': TableSchema(
+		name='Outbox',
+		hash_key='message_id',
+		indexes={'status-available_at-index': IndexSchema('status', 'available_at')},
+	),
+}
+
+
+class Page(NamedTuple):
+	items: List[dict]
+	last_key: Optional[dict] = None
+
+
+class StorageError(Exception):
+	pass
+
+
+class ConditionFailed(StorageError):
+	# a conditional write was rejected (DynamoDB ConditionalCheckFailedException);
+	# `item` is the item as it stood, when the write asked for it
+	def __init__(self, message: str = '', item: Optional[dict] = None):
+		super().__init__(message)
+		self.item = item
+
+
+class Change(NamedTuple):
+	# one item-level change, like a DynamoDB Streams record with NEW_AND_OLD_IMAGES
+	table: str
+	kind: str  # INSERT, MODIFY or REMOVE
+	old: Optional[dict]
+	new: Optional[dict]
+	at: float  # epoch seconds
+
+
+class ChangeReader:
+	# reads a table's change stream in order from `position`; read() returns the
+	# changes made since the last call (possibly none) and advances position,
+	# which can be saved and passed to a new reader to continue after a restart
+	position = None
+
+	def read(self, limit: int) -> List[Change]:
+		raise NotImplementedError
+
+
+class TransactionCanceled(ConditionFailed):
+	# a condition in transact_write failed and nothing was written; `items` maps
+	# the position of each failed action to its item as it stood (None if missing)
+	def __init__(self, message: str = '', items: Optional[Dict[int, Optional[dict]]] = None):
+		super().__init__(message)
+		self.items = items or {}
+
+
+# transact_write actions; a plain (table name, item) pair is a Put
+class Put(NamedTuple):
+	table: str
+	item: dict
+	if_not_exists: bool = False
+
+
+class Delete(NamedTuple):
+	table: str
+	key: dict
+	if_exists: bool = False
+
+
+class Increment(NamedTuple):
+	# adds `by` to a number attribute of an existing item (missing counts as 0).
+	# The result may not go below 0 nor, with at_most, above the item's at_most
+	# attribute; with expected, the attribute must hold that value first. DynamoDB
+	# cannot add in a condition, so an at_most bound with `by` over 1 needs expected.
+	table: str
+	key: dict
+	attribute: str
+	by: int = 1
+	at_most: Optional[str] = None
+	expected: Optional[int] = None
+
+
+def transact_actions(actions) -> list:
+	return [action if isinstance(action, (Put, Delete, Increment)) else Put(*action) for action in actions]
+
+
+def increment_allowed(item: Optional[dict], action: Increment) -> bool:
+	# the conditions of an Increment, for the local engines
+	if item is None:
+		return False
+	current = item.get(action.attribute, 0)
+	if action.expected is not None and current != action.expected:
+		return False
+	value = current + action.by
+	if value < 0:
+		return False
+	return action.at_most is None or (item.get(action.at_most) is not None and value <= item[action.at_most])
+
+
+class Table:
+	# Item-level operations every backend implements. Reads return plain dicts
+	# (or None when the item is missing); list reads return a Page whose
+	# last_key can be passed back as start_key to continue.
+	#
+	# `limit` caps the number of items a call examines, like DynamoDB's Limit,
+	# so a filtered page may hold fewer items than the limit and still carry a
+	# last_key.
+
+	def __init__(self, schema: TableSchema):
+		self.schema = schema
+
+	@property
+	def name(self) -> str:
+		return self.schema.name
+
+	def get_item(self, key: dict) -> Optional[dict]:
+		raise NotImplementedError
+
+	def put_item(self, item: dict, if_not_exists: bool = False) -> None:
+		# with if_not_exists, raises ConditionFailed instead of overwriting an item with the same key
+		raise NotImplementedError
+
+	def update_item(self, key: dict, values: dict) -> dict:
+		# sets the given attributes and returns them as stored
+		raise NotImplementedError
+
+	def update_changed(self, key: dict, values: dict, expected: Optional[dict] = None) -> dict:
+		# one conditional write: sets the given attributes on an existing item
+		# unless it already holds all of them, and returns their previous values
+		# (attributes the item did not have are left out). With `expected`, the
+		# item must also hold those values (None: the attribute is missing).
+		# Raises ConditionFailed with .item set to the current item, or None when
+		# there is no item.
+		raise NotImplementedError
+
+	def delete_item(self, key: dict) -> Optional[dict]:
+		# returns the deleted item, if there was one
+		raise NotImplementedError
+
+	def query(self, value, index: Optional[str] = None, where: Optional[dict] = None,
+			limit: Optional[int] = None, start_key: Optional[dict] = None,
+			range_from=None, range_to=None, descending: bool = False) -> Page:
+		# items whose hash key (of the table or of `index`) equals `value`, in
+		# range key order (reversed with descending), optionally restricted to
+		# range_from <= range key <= range_to
+		raise NotImplementedError
+
+	def scan(self, where: Optional[dict] = None, limit: Optional[int] = None,
+			start_key: Optional[dict] = None, segment: Optional[int] = None,
+			total_segments: Optional[int] = None) -> Page:
+		# with total_segments, only the items of one of that many disjoint
+		# segments, paged independently (DynamoDB parallel scan)
+		raise NotImplementedError
+
+	def batch_get_items(self, keys: List[dict]) -> Tuple[List[dict], List[dict]]:
+		# one BatchGetItem round trip for up to BATCH_GET_SIZE keys; returns the
+		# items found (in no particular order) and the keys left unprocessed
+		raise NotImplementedError
+
+	def batch_write_items(self, puts: List[dict] = (), deletes: List[dict] = ()) -> Tuple[List[dict], List[dict]]:
+		# one BatchWriteItem round trip for up to BATCH_WRITE_SIZE puts and deletes
+		# in total; returns the puts and delete keys left unprocessed
+		raise NotImplementedError
+
+
+class Storage:
+	def __init__(self, schemas: Dict[str, TableSchema] = None):
+		self.schemas = schemas or TABLES
+		self._tables = {}
+		# capacity units consumed so far by batch writes and by scans (DynamoDB
+		# reports them, the local engines estimate them the same way), for rate limiting
+		self.write_capacity = 0.0
+		self.read_capacity = 0.0
+		self._capacity_lock = threading.Lock()
+
+	def record_write_capacity(self, units: float):
+		with self._capacity_lock:
+			self.write_capacity += units
+
+	def record_read_capacity(self, units: float):
+		with self._capacity_lock:
+			self.read_capacity += units
+
+	def table(self, name: str) -> Table:
+		table = self._tables.get(name)
+		if table is None:
+			table = self._tables[name] = self._open_table(self.schemas[name])
+		return table
+
+	def _open_table(self, schema: TableSchema) -> Table:
+		raise NotImplementedError
+
+	def transact_write(self, actions: list = ()) -> None:
+		# applies Put, Delete and Increment actions (or (table name, item) puts)
+		# atomically, all or none, in one TransactWriteItems round trip of up to
+		# TRANSACT_SIZE actions. Raises TransactionCanceled when a condition fails.
+		raise NotImplementedError
+
+	def enable_stream(self, table_name: str) -> None:
+		# start recording item changes of a table (DynamoDB tables have streams
+		# enabled when they are created)
+		pass
+
+	def change_reader(self, table_name: str, position=None) -> ChangeReader:
+		raise NotImplementedError
+
+	def close(self):
+		pass
+
+
+def segment_of(hash_value, total_segments: int) -> int:
+	# scan segment of an item in the local engines, from its hash key
+	return zlib.crc32(str(hash_value).encode()) % total_segments
+
+
+def unchanged(item: dict, values: dict) -> bool:
+	return all(name in item and item[name] == value for name, value in values.items())
+
+
+def holds(item: dict, expected: Optional[dict]) -> bool:
+	return not expected or all(item.get(name) == value for name, value in expected.items())
+
+
+def matches(item: dict, where: Optional[dict]) -> bool:
+	if not where:
+		return True
+	return all(item.get(name) == value for name, value in where.items())
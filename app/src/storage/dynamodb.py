@@ -0,0 +1,363 @@
+import time
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+from ..aws import get_client
+from .base import Change, ChangeReader, ConditionFailed, Delete, Page, Put, Storage, Table, TableSchema, TransactionCanceled, transact_actions
+
+# boto3 and botocore are imported on first use rather than with this module,
+# which keeps importing the app (and so cold starts) cheap. Tables talk to the
+# low-level client, which (unlike boto3 resources) is safe to share between the
+# storage threads; items are converted to and from the wire format here.
+
+
+def _condition_failed(error: Exception) -> bool:
+	from botocore.exceptions import ClientError
+	return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+@lru_cache(maxsize=None)
+def _serializers():
+	from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+	return TypeSerializer(), TypeDeserializer()
+
+
+def _wire(item: dict) -> dict:
+	serialize = _serializers()[0].serialize
+	return {name: serialize(value) for name, value in item.items()}
+
+
+def _from_wire(item: Optional[dict]) -> Optional[dict]:
+	if not item:
+		return None
+	deserialize = _serializers()[1].deserialize
+	return {name: deserialize(value) for name, value in item.items()}
+
+
+def _expression_args(names: dict, values: dict) -> dict:
+	kwargs = {}
+	if names:
+		kwargs['ExpressionAttributeNames'] = names
+	if values:
+		kwargs['ExpressionAttributeValues'] = _wire(values)
+	return kwargs
+
+
+def _failed_item(error: Exception) -> Optional[dict]:
+	# ReturnValuesOnConditionCheckFailure puts the item on the error, in wire format
+	return _from_wire(error.response.get('Item'))
+
+
+def _cancelled_items(error: Exception) -> Optional[dict]:
+	# positions of the transaction actions whose condition failed, with their
+	# items; None when the transaction was cancelled for another reason
+	from botocore.exceptions import ClientError
+	if not isinstance(error, ClientError) or error.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+		return None
+	reasons = error.response.get('CancellationReasons', [])
+	failed = {
+		position: _from_wire(reason.get('Item'))
+		for position, reason in enumerate(reasons) if reason.get('Code') == 'ConditionalCheckFailed'
+	}
+	return failed or None
+
+
+def _transact_item(action, hash_key: str) -> dict:
+	# one TransactWriteItems entry; failed conditions report the item as it stood
+	if isinstance(action, Put):
+		entry = {'TableName': action.table, 'Item': _wire(action.item)}
+		if action.if_not_exists:
+			entry.update(ConditionExpression='attribute_not_exists(#hk)', ExpressionAttributeNames={'#hk': hash_key}, ReturnValuesOnConditionCheckFailure='ALL_OLD')
+		return {'Put': entry}
+	if isinstance(action, Delete):
+		entry = {'TableName': action.table, 'Key': _wire(action.key)}
+		if action.if_exists:
+			entry.update(ConditionExpression='attribute_exists(#hk)', ExpressionAttributeNames={'#hk': hash_key}, ReturnValuesOnConditionCheckFailure='ALL_OLD')
+		return {'Delete': entry}
+
+	names = {'#hk': hash_key, '#a': action.attribute}
+	values = {':zero': 0, ':by': action.by}
+	conditions = ['attribute_exists(#hk)']
+	if action.expected is not None:
+		values[':expected'] = action.expected
+		conditions.append('(#a = :expected OR attribute_not_exists(#a))' if action.expected == 0 else '#a = :expected')
+		if action.expected + action.by < 0:
+			raise ValueError('Increment would go below 0')
+		if action.at_most:
+			names['#max'] = action.at_most
+			values[':result'] = action.expected + action.by
+			conditions.append('#max >= :result')
+	elif action.by < 0:
+		values[':floor'] = -action.by
+		conditions.append('#a >= :floor')
+	elif action.at_most:
+		if action.by > 1:
+			raise ValueError('Increment by more than 1 with at_most needs expected')
+		names['#max'] = action.at_most
+		conditions.append('(#a < #max OR (attribute_not_exists(#a) AND #max >= :by))')
+	return {'Update': {
+		'TableName': action.table,
+		'Key': _wire(action.key),
+		'UpdateExpression': 'SET #a = if_not_exists(#a, :zero) + :by',
+		'ConditionExpression': ' AND '.join(conditions),
+		'ExpressionAttributeNames': names,
+		'ExpressionAttributeValues': _wire(values),
+		'ReturnValuesOnConditionCheckFailure': 'ALL_OLD',
+	}}
+
+
+def _set_expression(values: dict) -> Tuple[str, dict, dict]:
+	names, placeholders, assignments = {}, {}, []
+	for i, (name, value) in enumerate(values.items()):
+		names[f'#a{i}'] = name
+		placeholders[f':v{i}'] = value
+		assignments.append(f'#a{i} = :v{i}')
+	return 'set ' + ', '.join(assignments), names, placeholders
+
+
+def _paging_args(where: Optional[dict], limit: Optional[int], start_key: Optional[dict], names: dict, values: dict) -> dict:
+	# adds the filter's placeholders to names and values
+	kwargs = {}
+	if where:
+		conditions = []
+		for i, (name, value) in enumerate(where.items()):
+			names[f'#w{i}'] = name
+			values[f':w{i}'] = value
+			conditions.append(f'#w{i} = :w{i}')
+		kwargs['FilterExpression'] = ' AND '.join(conditions)
+	if limit:
+		kwargs['Limit'] = limit
+	if start_key:
+		kwargs['ExclusiveStartKey'] = _wire(start_key)
+	return kwargs
+
+
+class DynamoTable(Table):
+	def __init__(self, schema: TableSchema, storage: 'DynamoStorage'):
+		super().__init__(schema)
+		self.storage = storage
+
+	@property
+	def client(self):
+		return self.storage.client
+
+	def get_item(self, key: dict) -> Optional[dict]:
+		return _from_wire(self.client.get_item(TableName=self.name, Key=_wire(key)).get('Item'))
+
+	def put_item(self, item: dict, if_not_exists: bool = False) -> None:
+		kwargs = {}
+		if if_not_exists:
+			kwargs['ConditionExpression'] = 'attribute_not_exists(#hk)'
+			kwargs['ExpressionAttributeNames'] = {'#hk': self.schema.hash_key}
+		try:
+			self.client.put_item(TableName=self.name, Item=_wire(item), **kwargs)
+		except Exception as e:
+			if _condition_failed(e):
+				raise ConditionFailed(f"{self.name} item already exists")
+			raise
+
+	def update_item(self, key: dict, values: dict) -> dict:
+		expression, names, placeholders = _set_expression(values)
+		response = self.client.update_item(
+			TableName=self.name,
+			Key=_wire(key),
+			UpdateExpression=expression,
+			ReturnValues='UPDATED_NEW',
+			**_expression_args(names, placeholders)
+		)
+		return _from_wire(response.get('Attributes')) or {}
+
+	def update_changed(self, key: dict, values: dict, expected: Optional[dict] = None) -> dict:
+		expression, names, placeholders = _set_expression(values)
+		# the item exists and at least one attribute is missing or different
+		differs = ' OR '.join(f'attribute_not_exists({name}) OR {name} <> {value}' for name, value in zip(names, placeholders))
+		condition = f'attribute_exists(#hk) AND ({differs})'
+		names['#hk'] = self.schema.hash_key
+		for i, (name, value) in enumerate((expected or {}).items()):
+			names[f'#e{i}'] = name
+			if value is None:
+				condition += f' AND attribute_not_exists(#e{i})'
+			else:
+				placeholders[f':e{i}'] = value
+				condition += f' AND #e{i} = :e{i}'
+		try:
+			response = self.client.update_item(
+				TableName=self.name,
+				Key=_wire(key),
+				UpdateExpression=expression,
+				ConditionExpression=condition,
+				ReturnValues='UPDATED_OLD',
+				ReturnValuesOnConditionCheckFailure='ALL_OLD',
+				**_expression_args(names, placeholders)
+			)
+		except Exception as e:
+			if _condition_failed(e):
+				raise ConditionFailed(f"{self.name} item is missing, unchanged or not as expected", _failed_item(e))
+			raise
+		return _from_wire(response.get('Attributes')) or {}
+
+	def delete_item(self, key: dict) -> Optional[dict]:
+		response = self.client.delete_item(TableName=self.name, Key=_wire(key), ReturnValues='ALL_OLD')
+		return _from_wire(response.get('Attributes'))
+
+	def query(self, value, index=None, where=None, limit=None, start_key=None, range_from=None, range_to=None, descending=False) -> Page:
+		layout = self.schema.indexes[index] if index else self.schema
+		names, values = {'#hk': layout.hash_key}, {':hk': value}
+		condition = '#hk = :hk'
+		if range_from is not None or range_to is not None:
+			names['#rk'] = layout.range_key
+		if range_from is not None and range_to is not None:
+			values.update({':from': range_from, ':to': range_to})
+			condition += ' AND #rk BETWEEN :from AND :to'
+		elif range_from is not None:
+			values[':from'] = range_from
+			condition += ' AND #rk >= :from'
+		elif range_to is not None:
+			values[':to'] = range_to
+			condition += ' AND #rk <= :to'
+		kwargs = _paging_args(where, limit, start_key, names, values)
+		if index:
+			kwargs['IndexName'] = index
+		if descending:
+			kwargs['ScanIndexForward'] = False
+		response = self.client.query(TableName=self.name, KeyConditionExpression=condition, **kwargs, **_expression_args(names, values))
+		return Page([_from_wire(item) for item in response.get('Items', [])], _from_wire(response.get('LastEvaluatedKey')))
+
+	def scan(self, where=None, limit=None, start_key=None, segment=None, total_segments=None) -> Page:
+		names, values = {}, {}
+		kwargs = _paging_args(where, limit, start_key, names, values)
+		if total_segments:
+			kwargs['Segment'] = segment
+			kwargs['TotalSegments'] = total_segments
+		response = self.client.scan(TableName=self.name, ReturnConsumedCapacity='TOTAL', **kwargs, **_expression_args(names, values))
+		self.storage.record_read_capacity(response.get('ConsumedCapacity', {}).get('CapacityUnits', 0))
+		return Page([_from_wire(item) for item in response.get('Items', [])], _from_wire(response.get('LastEvaluatedKey')))
+
+	def batch_get_items(self, keys: List[dict]) -> Tuple[List[dict], List[dict]]:
+		response = self.client.batch_get_item(RequestItems={self.name: {'Keys': [_wire(key) for key in keys]}})
+		unprocessed = response.get('UnprocessedKeys', {}).get(self.name, {}).get('Keys', [])
+		return [_from_wire(item) for item in response.get('Responses', {}).get(self.name, [])], [_from_wire(key) for key in unprocessed]
+
+	def batch_write_items(self, puts=(), deletes=()) -> Tuple[List[dict], List[dict]]:
+		requests = [{'PutRequest': {'Item': _wire(item)}} for item in puts]
+		requests += [{'DeleteRequest': {'Key': _wire(key)}} for key in deletes]
+		response = self.client.batch_write_item(RequestItems={self.name: requests}, ReturnConsumedCapacity='TOTAL')
+		self.storage.record_write_capacity(sum(used.get('CapacityUnits', 0) for used in response.get('ConsumedCapacity', [])))
+		left = response.get('UnprocessedItems', {}).get(self.name, [])
+		return (
+			[_from_wire(request['PutRequest']['Item']) for request in left if 'PutRequest' in request],
+			[_from_wire(request['DeleteRequest']['Key']) for request in left if 'DeleteRequest' in request]
+		)
+
+
+class DynamoChangeReader(ChangeReader):
+	# Reads a table's DynamoDB stream (NEW_AND_OLD_IMAGES). Position maps each
+	# shard to the last sequence number read; shards in it continue after that
+	# record, and a reader without a position starts at the newest records.
+	# A child shard is read once its parent has been read to the end.
+	SHARD_REFRESH = 10.0
+
+	def __init__(self, table: 'DynamoTable', position: Optional[dict] = None):
+		self.table_name = table.name
+		self.stream_arn = table.client.describe_table(TableName=table.name)['Table'].get('LatestStreamArn')
+		if not self.stream_arn:
+			raise ValueError(f"Table {table.name} has no stream")
+		self.client = get_client('dynamodbstreams', table.storage.region_name)
+		self.position = dict(position or {})
+		self._latest = not position
+		self._shards = {}
+		self._iterators = {}
+		self._finished = set()
+		self._refreshed = 0.0
+
+	def _refresh_shards(self):
+		kwargs = {'StreamArn': self.stream_arn}
+		while True:
+			description = self.client.describe_stream(**kwargs)['StreamDescription']
+			for shard in description.get('Shards', []):
+				if shard['ShardId'] not in self._shards:
+					self._shards[shard['ShardId']] = shard
+					open_shard = 'EndingSequenceNumber' not in shard.get('SequenceNumberRange', {})
+					if self._latest and not open_shard and shard['ShardId'] not in self.position:
+						# a first start reads only what happens from now on
+						self._finished.add(shard['ShardId'])
+			if not description.get('LastEvaluatedShardId'):
+				break
+			kwargs['ExclusiveStartShardId'] = description['LastEvaluatedShardId']
+		self._refreshed = time.monotonic()
+
+	def _iterator(self, shard_id: str) -> str:
+		kwargs = {'StreamArn': self.stream_arn, 'ShardId': shard_id}
+		if shard_id in self.position:
+			kwargs.update(ShardIteratorType='AFTER_SEQUENCE_NUMBER', SequenceNumber=self.position[shard_id])
+		else:
+			kwargs['ShardIteratorType'] = 'LATEST' if self._latest else 'TRIM_HORIZON'
+		return self.client.get_shard_iterator(**kwargs)['ShardIterator']
+
+	def _readable(self, shard: dict) -> bool:
+		parent = shard.get('ParentShardId')
+		return shard['ShardId'] not in self._finished and (parent is None or parent not in self._shards or parent in self._finished)
+
+	def read(self, limit: int) -> List[Change]:
+		from botocore.exceptions import ClientError
+		if time.monotonic() - self._refreshed > self.SHARD_REFRESH:
+			self._refresh_shards()
+		changes = []
+		for shard_id, shard in list(self._shards.items()):
+			if len(changes) >= limit or not self._readable(shard):
+				continue
+			if shard_id not in self._iterators:
+				self._iterators[shard_id] = self._iterator(shard_id)
+			try:
+				response = self.client.get_records(ShardIterator=self._iterators[shard_id], Limit=limit - len(changes))
+			except ClientError as e:
+				if e.response.get('Error', {}).get('Code') != 'ExpiredIteratorException':
+					raise
+				# iterators last 15 minutes; the next read gets a new one from the position
+				del self._iterators[shard_id]
+				continue
+			for record in response.get('Records', []):
+				data = record['dynamodb']
+				changes.append(Change(
+					self.table_name, record['eventName'], _from_wire(data.get('OldImage')), _from_wire(data.get('NewImage')),
+					data['ApproximateCreationDateTime'].timestamp() if 'ApproximateCreationDateTime' in data else time.time(),
+				))
+				self.position[shard_id] = data['SequenceNumber']
+			if response.get('NextShardIterator'):
+				self._iterators[shard_id] = response['NextShardIterator']
+			else:
+				# a closed shard read to the end; its children come next
+				del self._iterators[shard_id]
+				self._finished.add(shard_id)
+				self._refreshed = 0.0
+		self._latest = False
+		return changes
+
+
+class DynamoStorage(Storage):
+	def __init__(self, region_name: str = None, schemas=None):
+		super().__init__(schemas)
+		self.region_name = region_name
+
+	@property
+	def client(self):
+		# the shared, tuned client from src/aws.py; nothing is created until the first call
+		return get_client('dynamodb', self.region_name)
+
+	def _open_table(self, schema: TableSchema) -> Table:
+		return DynamoTable(schema, self)
+
+	def change_reader(self, table_name: str, position=None) -> ChangeReader:
+		return DynamoChangeReader(self.table(table_name), position)
+
+	def transact_write(self, actions=()) -> None:
+		actions = transact_actions(actions)
+		try:
+			self.client.transact_write_items(
+				TransactItems=[_transact_item(action, self.schemas[action.table].hash_key) for action in actions]
+			)
+		except Exception as e:
+			failed = _cancelled_items(e)
+			if failed is not None:
+				raise TransactionCanceled('Transaction cancelled, a condition failed', failed)
+			raise
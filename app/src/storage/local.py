@@ -0,0 +1,153 @@
+import math
+import os
+import threading
+import time
+from typing import List, Optional
+
+from .base import (
+	Change, ChangeReader, Delete, Increment, Put, Storage, Table, TableSchema, TransactionCanceled, increment_allowed,
+	transact_actions,
+)
+
+
+# changes kept per streamed table; older ones are dropped, like records past
+# DynamoDB Streams' 24 hours
+STREAM_RETENTION = int(os.getenv('STREAM_RETENTION', '100000'))
+
+
+class ChangeFeed:
+	# in-process change stream of one table; sequence numbers start at 1
+	def __init__(self, table_name: str, retention: int = STREAM_RETENTION):
+		self.table_name = table_name
+		self.retention = retention
+		self._changes = []
+		self._first = 1
+		self._lock = threading.Lock()
+
+	def record(self, old: Optional[dict], new: Optional[dict]):
+		if old is None and new is None:
+			return
+		kind = 'INSERT' if old is None else 'REMOVE' if new is None else 'MODIFY'
+		with self._lock:
+			self._changes.append(Change(self.table_name, kind, old, new, time.time()))
+			if len(self._changes) >= 2 * self.retention:
+				del self._changes[:self.retention]
+				self._first += self.retention
+
+	def read(self, after: int, limit: int):
+		# changes after sequence number `after`, and the last sequence number returned
+		with self._lock:
+			start = max(after + 1 - self._first, 0)
+			changes = self._changes[start:start + limit]
+			return changes, self._first + start + len(changes) - 1 if changes else after
+
+
+class LocalChangeReader(ChangeReader):
+	def __init__(self, feed: ChangeFeed, position: Optional[int] = None):
+		self.feed = feed
+		self.position = position or 0
+
+	def read(self, limit: int) -> List[Change]:
+		changes, self.position = self.feed.read(self.position, limit)
+		return changes
+
+
+class LocalTable(Table):
+	# Shared behaviour of the in-process engines: optional artificial latency
+	# and read accounting. Scans always walk the table, like DynamoDB, so
+	# items_read reflects what the same access pattern would cost there.
+
+	def __init__(self, schema: TableSchema, storage: 'LocalStorage'):
+		super().__init__(schema)
+		self.storage = storage
+
+	def _round_trip(self):
+		self.storage.record_call()
+
+	def _changed(self, old: Optional[dict], new: Optional[dict]):
+		feed = self.storage.feeds.get(self.name)
+		if feed is not None:
+			feed.record(old, new)
+
+	def _examined(self, count: int):
+		self.storage.record_reads(count)
+
+	def _written(self, puts, deletes=()):
+		# DynamoDB's charge: one unit per started KB of each item, once for the
+		# table and once more for every index the item is in
+		units = len(deletes)
+		for item in puts:
+			size = math.ceil(item_size(item) / 1024) or 1
+			indexed = sum(1 for layout in self.schema.indexes.values() if item.get(layout.hash_key) is not None)
+			units += size * (1 + indexed)
+		self.storage.record_write_capacity(units)
+
+	def _scanned(self, size: int):
+		# a scan page costs half a unit (eventually consistent) per started 4 KB read
+		self.storage.record_read_capacity(math.ceil(size / 4096) * 0.5)
+
+
+def item_size(item: dict) -> int:
+	# DynamoDB item size: attribute names plus values, approximated by their text
+	return sum(len(name) + len(str(value)) for name, value in item.items())
+
+
+class LocalStorage(Storage):
+	def __init__(self, schemas=None, latency: float = 0.0):
+		super().__init__(schemas)
+		# seconds slept on every storage call, to stand in for a network round trip
+		self.latency = latency
+		self._stats_lock = threading.Lock()
+		self.stats = {'calls': 0, 'items_read': 0}
+		self.feeds = {}
+
+	def record_call(self):
+		with self._stats_lock:
+			self.stats['calls'] += 1
+		if self.latency:
+			time.sleep(self.latency)
+
+	def record_reads(self, count: int):
+		with self._stats_lock:
+			self.stats['items_read'] += count
+
+	def reset_stats(self):
+		with self._stats_lock:
+			for name in self.stats:
+				self.stats[name] = 0
+
+	def enable_stream(self, table_name: str) -> None:
+		self.feeds.setdefault(table_name, ChangeFeed(table_name))
+
+	def change_reader(self, table_name: str, position=None) -> ChangeReader:
+		self.enable_stream(table_name)
+		return LocalChangeReader(self.feeds[table_name], position)
+
+	def _transact(self, actions):
+		# TransactWriteItems for the engines; callers hold the locks of every table
+		# involved. Tables provide _load(key), _save(item) and _remove(key).
+		failed, writes = {}, []
+		for position, action in enumerate(actions):
+			table = self.table(action.table)
+			if isinstance(action, Put):
+				if action.if_not_exists:
+					current = table._load(action.item)
+					if current is not None:
+						failed[position] = current
+				writes.append((table._save, dict(action.item)))
+			elif isinstance(action, Delete):
+				current = table._load(action.key)
+				if action.if_exists and current is None:
+					failed[position] = None
+				writes.append((table._remove, action.key))
+			else:
+				current = table._load(action.key)
+				if not increment_allowed(current, action):
+					failed[position] = current
+				else:
+					writes.append((table._save, dict(current, **{action.attribute: current.get(action.attribute, 0) + action.by})))
+		if failed:
+			raise TransactionCanceled('Transaction cancelled, a condition failed', failed)
+		for write, value in writes:
+			write(value)
+
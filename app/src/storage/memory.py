@@ -0,0 +1,196 @@
+import itertools
+import threading
+from contextlib import ExitStack
+from bisect import bisect_left, bisect_right, insort
+from typing import List, Optional, Tuple
+
+from .base import ConditionFailed, IndexSchema, Page, Table, TableSchema, holds, matches, segment_of, transact_actions, unchanged
+from .local import LocalStorage, LocalTable, item_size
+
+
+class MemoryTable(LocalTable):
+	def __init__(self, schema: TableSchema, storage: 'MemoryStorage'):
+		super().__init__(schema, storage)
+		self._lock = threading.RLock()
+		self._key_names = [schema.hash_key] + ([schema.range_key] if schema.range_key else [])
+		self._items = {}
+		# primary keys in sorted order, for scans
+		self._keys = []
+		# index name (None for the table itself) -> hash value -> sorted entries
+		self._layouts = {None: IndexSchema(schema.hash_key, schema.range_key)}
+		self._layouts.update(schema.indexes)
+		self._partitions = {name: {} for name in self._layouts}
+
+	def _pk(self, item: dict) -> tuple:
+		return tuple(item[name] for name in self._key_names)
+
+	def _entry(self, layout: IndexSchema, item: dict, pk: tuple):
+		if layout.range_key is None:
+			return (pk,)
+		sort_value = item.get(layout.range_key)
+		return None if sort_value is None else (sort_value, pk)
+
+	def _index(self, item: dict):
+		pk = self._pk(item)
+		for name, layout in self._layouts.items():
+			hash_value, entry = item.get(layout.hash_key), self._entry(layout, item, pk)
+			if hash_value is not None and entry is not None:
+				insort(self._partitions[name].setdefault(hash_value, []), entry)
+
+	def _unindex(self, item: dict):
+		pk = self._pk(item)
+		for name, layout in self._layouts.items():
+			hash_value, entry = item.get(layout.hash_key), self._entry(layout, item, pk)
+			entries = self._partitions[name].get(hash_value)
+			if not entries or entry is None:
+				continue
+			pos = bisect_left(entries, entry)
+			if pos < len(entries) and entries[pos] == entry:
+				entries.pop(pos)
+			if not entries:
+				del self._partitions[name][hash_value]
+
+	def _load(self, key: dict) -> Optional[dict]:
+		return self._items.get(self._pk(key))
+
+	def _save(self, item: dict):
+		self._store(item)
+
+	def _store(self, item: dict):
+		pk = self._pk(item)
+		previous = self._items.get(pk)
+		if previous is not None:
+			self._unindex(previous)
+		else:
+			insort(self._keys, pk)
+		self._items[pk] = item
+		self._index(item)
+		self._changed(previous, item)
+		return previous
+
+	def get_item(self, key: dict) -> Optional[dict]:
+		self._round_trip()
+		with self._lock:
+			item = self._items.get(self._pk(key))
+			self._examined(1 if item else 0)
+			return dict(item) if item else None
+
+	def put_item(self, item: dict, if_not_exists: bool = False) -> None:
+		self._round_trip()
+		with self._lock:
+			if if_not_exists and self._pk(item) in self._items:
+				raise ConditionFailed(f"{self.name} item already exists")
+			self._store(dict(item))
+
+	def update_item(self, key: dict, values: dict) -> dict:
+		self._round_trip()
+		with self._lock:
+			item = dict(self._items.get(self._pk(key)) or key)
+			item.update(values)
+			self._store(item)
+			return dict(values)
+
+	def update_changed(self, key: dict, values: dict, expected: Optional[dict] = None) -> dict:
+		self._round_trip()
+		with self._lock:
+			current = self._items.get(self._pk(key))
+			if current is None or unchanged(current, values) or not holds(current, expected):
+				raise ConditionFailed(f"{self.name} item is missing, unchanged or not as expected", dict(current) if current else None)
+			item = dict(current)
+			item.update(values)
+			self._store(item)
+			return {name: current[name] for name in values if name in current}
+
+	def _remove(self, key: dict) -> Optional[dict]:
+		pk = self._pk(key)
+		item = self._items.pop(pk, None)
+		if item is not None:
+			self._unindex(item)
+			self._keys.pop(bisect_left(self._keys, pk))
+			self._changed(item, None)
+		return item
+
+	def delete_item(self, key: dict) -> Optional[dict]:
+		self._round_trip()
+		with self._lock:
+			return self._remove(key)
+
+	def _page(self, entries: list, positions: range, to_item, where, limit, index) -> Page:
+		items, examined, last_key = [], 0, None
+		key_names = self.schema.key_attributes(index)
+		for position in positions:
+			if limit and examined == limit:
+				last = to_item(entries[position - positions.step])
+				last_key = {name: last[name] for name in key_names}
+				break
+			item = to_item(entries[position])
+			examined += 1
+			if matches(item, where):
+				items.append(dict(item))
+		self._examined(examined)
+		return Page(items, last_key)
+
+	def query(self, value, index=None, where=None, limit=None, start_key=None, range_from=None, range_to=None, descending=False) -> Page:
+		self._round_trip()
+		with self._lock:
+			layout = self._layouts[index]
+			entries = self._partitions[index].get(value, [])
+			start, end = 0, len(entries)
+			if range_from is not None:
+				start = bisect_left(entries, (range_from,))
+			if range_to is not None:
+				end = bisect_left(entries, (range_to,))
+				while end < len(entries) and entries[end][0] == range_to:
+					end += 1
+			if start_key:
+				entry = self._entry(layout, start_key, self._pk(start_key))
+				if descending:
+					end = min(end, bisect_left(entries, entry))
+				else:
+					start = max(start, bisect_right(entries, entry))
+			positions = range(end - 1, start - 1, -1) if descending else range(start, end)
+			return self._page(entries, positions, lambda entry: self._items[entry[-1]], where, limit, index)
+
+	def scan(self, where=None, limit=None, start_key=None, segment=None, total_segments=None) -> Page:
+		self._round_trip()
+		with self._lock:
+			start = bisect_right(self._keys, self._pk(start_key)) if start_key else 0
+			keys = (self._keys[i] for i in range(start, len(self._keys)))
+			if total_segments:
+				keys = (pk for pk in keys if segment_of(pk[0], total_segments) == segment)
+			# one more key than the limit tells whether there is a next page
+			keys = list(itertools.islice(keys, limit + 1 if limit else None))
+			self._scanned(sum(item_size(self._items[pk]) for pk in keys[:limit or None]))
+			return self._page(keys, range(len(keys)), self._items.__getitem__, where, limit, None)
+
+	def batch_get_items(self, keys: List[dict]) -> Tuple[List[dict], List[dict]]:
+		self._round_trip()
+		with self._lock:
+			found = [self._items.get(self._pk(key)) for key in keys]
+			items = [dict(item) for item in found if item is not None]
+		self._examined(len(items))
+		return items, []
+
+	def batch_write_items(self, puts=(), deletes=()) -> Tuple[List[dict], List[dict]]:
+		self._round_trip()
+		with self._lock:
+			for item in puts:
+				self._store(dict(item))
+			for key in deletes:
+				self._remove(key)
+		self._written(puts, deletes)
+		return [], []
+
+
+class MemoryStorage(LocalStorage):
+	def _open_table(self, schema: TableSchema) -> Table:
+		return MemoryTable(schema, self)
+
+	def transact_write(self, actions=()) -> None:
+		self.record_call()
+		actions = transact_actions(actions)
+		with ExitStack() as stack:
+			# table locks are always taken in name order
+			for name in sorted({action.table for action in actions}):
+				stack.enter_context(self.table(name)._lock)
+			self._transact(actions)
@@ -0,0 +1,240 @@
+import json
+import sqlite3
+import threading
+from decimal import Decimal
+from typing import List, Optional, Tuple
+
+from .base import ConditionFailed, Page, Table, TableSchema, holds, matches, segment_of, transact_actions, unchanged
+from .local import LocalStorage, LocalTable
+
+
+def _encode_default(value):
+	if isinstance(value, Decimal):
+		return int(value) if value == value.to_integral_value() else float(value)
+	raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps(item: dict) -> str:
+	return json.dumps(item, default=_encode_default)
+
+
+class SQLiteTable(LocalTable):
+	# Items are stored as JSON next to their key columns. Every secondary index
+	# gets a pair of extracted columns (ixN_h, ixN_r) backed by a real SQLite
+	# index, so queries by group, user, event or time are index range reads.
+
+	def __init__(self, schema: TableSchema, storage: 'SQLiteStorage'):
+		super().__init__(schema, storage)
+		self._conn = storage.conn
+		self._lock = storage.lock
+		self._table = f'"{schema.name}"'
+		self._columns = {}
+		for position, name in enumerate(schema.indexes):
+			self._columns[name] = (f'ix{position}_h', f'ix{position}_r')
+		self._create()
+
+	def _create(self):
+		extra = ''.join(f', {h}, {r}' for h, r in self._columns.values())
+		with self._lock:
+			self._conn.execute(
+				f'CREATE TABLE IF NOT EXISTS {self._table} ('
+				f'hk NOT NULL, rk NOT NULL DEFAULT \'\', item TEXT NOT NULL{extra}, PRIMARY KEY (hk, rk))'
+			)
+			for name, (h, r) in self._columns.items():
+				self._conn.execute(
+					f'CREATE INDEX IF NOT EXISTS "{self.schema.name}__{name}" ON {self._table} ({h}, {r}, hk, rk)'
+				)
+
+	def _row_key(self, key: dict) -> tuple:
+		range_key = self.schema.range_key
+		return key[self.schema.hash_key], key[range_key] if range_key else ''
+
+	def _load(self, key: dict) -> Optional[dict]:
+		row = self._conn.execute(
+			f'SELECT item FROM {self._table} WHERE hk = ? AND rk = ?', self._row_key(key)
+		).fetchone()
+		return json.loads(row[0]) if row else None
+
+	def _save(self, item: dict):
+		if self.name in self.storage.feeds:
+			self._changed(self._load(item), dict(item))
+		columns, values = ['hk', 'rk', 'item'], list(self._row_key(item)) + [_dumps(item)]
+		for name, (h, r) in self._columns.items():
+			index = self.schema.indexes[name]
+			columns += [h, r]
+			values += [item.get(index.hash_key), item.get(index.range_key) if index.range_key else None]
+		self._conn.execute(
+			f'INSERT OR REPLACE INTO {self._table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(values))})',
+			values
+		)
+
+	def get_item(self, key: dict) -> Optional[dict]:
+		self._round_trip()
+		with self._lock:
+			item = self._load(key)
+		self._examined(1 if item else 0)
+		return item
+
+	def put_item(self, item: dict, if_not_exists: bool = False) -> None:
+		self._round_trip()
+		with self._lock:
+			if if_not_exists and self._load(item) is not None:
+				raise ConditionFailed(f"{self.name} item already exists")
+			self._save(item)
+
+	def update_item(self, key: dict, values: dict) -> dict:
+		self._round_trip()
+		with self._lock:
+			item = self._load(key) or dict(key)
+			item.update(values)
+			self._save(item)
+		return dict(values)
+
+	def update_changed(self, key: dict, values: dict, expected: Optional[dict] = None) -> dict:
+		self._round_trip()
+		with self._lock:
+			current = self._load(key)
+			if current is None or unchanged(current, values) or not holds(current, expected):
+				raise ConditionFailed(f"{self.name} item is missing, unchanged or not as expected", current)
+			item = dict(current)
+			item.update(values)
+			self._save(item)
+		return {name: current[name] for name in values if name in current}
+
+	def _remove(self, key: dict):
+		if self.name in self.storage.feeds:
+			self._changed(self._load(key), None)
+		self._conn.execute(f'DELETE FROM {self._table} WHERE hk = ? AND rk = ?', self._row_key(key))
+
+	def delete_item(self, key: dict) -> Optional[dict]:
+		self._round_trip()
+		with self._lock:
+			item = self._load(key)
+			if item is not None:
+				self._remove(key)
+		return item
+
+	def _select(self, conditions: list, params: list, order: list, start_values, where, limit, index, descending=False, scan=False) -> Page:
+		if start_values is not None:
+			conditions.append(f'({", ".join(order)}) {"<" if descending else ">"} ({", ".join("?" * len(order))})')
+			params += list(start_values)
+		sql = f'SELECT item FROM {self._table}'
+		if conditions:
+			sql += ' WHERE ' + ' AND '.join(conditions)
+		sql += ' ORDER BY ' + ', '.join(f'{column} DESC' if descending else column for column in order)
+		if limit:
+			# one extra row tells us whether there is a next page
+			sql += f' LIMIT {int(limit) + 1}'
+		with self._lock:
+			rows = self._conn.execute(sql, params).fetchall()
+		last_key = None
+		if limit and len(rows) > limit:
+			rows = rows[:limit]
+			last = json.loads(rows[-1][0])
+			last_key = {name: last[name] for name in self.schema.key_attributes(index)}
+		self._examined(len(rows))
+		if scan:
+			self._scanned(sum(len(row[0]) for row in rows))
+		items = [item for item in (json.loads(row[0]) for row in rows) if matches(item, where)]
+		return Page(items, last_key)
+
+	def query(self, value, index=None, where=None, limit=None, start_key=None, range_from=None, range_to=None, descending=False) -> Page:
+		self._round_trip()
+		if index is None:
+			sort_column = 'rk'
+			order = ['rk']
+			conditions, params = ['hk = ?'], [value]
+			start_values = (self._row_key(start_key)[1],) if start_key else None
+		else:
+			layout = self.schema.indexes[index]
+			h, sort_column = self._columns[index]
+			conditions, params = [f'{h} = ?'], [value]
+			order = ['hk', 'rk']
+			if layout.range_key:
+				conditions.append(f'{sort_column} IS NOT NULL')
+				order = [sort_column] + order
+			start_values = None
+			if start_key:
+				start_values = self._row_key(start_key)
+				if layout.range_key:
+					start_values = (start_key[layout.range_key],) + start_values
+		if range_from is not None:
+			conditions.append(f'{sort_column} >= ?')
+			params.append(range_from)
+		if range_to is not None:
+			conditions.append(f'{sort_column} <= ?')
+			params.append(range_to)
+		return self._select(conditions, params, order, start_values, where, limit, index, descending)
+
+	def scan(self, where=None, limit=None, start_key=None, segment=None, total_segments=None) -> Page:
+		self._round_trip()
+		start_values = self._row_key(start_key) if start_key else None
+		conditions, params = [], []
+		if total_segments:
+			conditions.append('segment_of(hk, ?) = ?')
+			params += [total_segments, segment]
+		return self._select(conditions, params, ['hk', 'rk'], start_values, where, limit, None, scan=True)
+
+	def batch_get_items(self, keys: List[dict]) -> Tuple[List[dict], List[dict]]:
+		self._round_trip()
+		if not keys:
+			return [], []
+		pairs = [self._row_key(key) for key in keys]
+		placeholders = ', '.join('(?, ?)' for _ in pairs)
+		with self._lock:
+			rows = self._conn.execute(
+				f'SELECT item FROM {self._table} WHERE (hk, rk) IN (VALUES {placeholders})',
+				[value for pair in pairs for value in pair]
+			).fetchall()
+		self._examined(len(rows))
+		return [json.loads(row[0]) for row in rows], []
+
+	def batch_write_items(self, puts=(), deletes=()) -> Tuple[List[dict], List[dict]]:
+		self._round_trip()
+		with self._lock:
+			self._conn.execute('BEGIN')
+			try:
+				for item in puts:
+					self._save(item)
+				for key in deletes:
+					self._remove(key)
+				self._conn.execute('COMMIT')
+			except Exception:
+				self._conn.execute('ROLLBACK')
+				raise
+		self._written(puts, deletes)
+		return [], []
+
+
+class SQLiteStorage(LocalStorage):
+	def __init__(self, path: str = ':memory:', schemas=None, latency: float = 0.0):
+		super().__init__(schemas, latency)
+		self.lock = threading.RLock()
+		# one connection shared by the storage threads, serialised by self.lock
+		self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+		self.conn.execute('PRAGMA journal_mode=WAL')
+		self.conn.execute('PRAGMA synchronous=NORMAL')
+		# parallel scan segments, computed the same way as in the memory engine
+		self.conn.create_function('segment_of', 2, segment_of, deterministic=True)
+
+	def _open_table(self, schema: TableSchema) -> Table:
+		return SQLiteTable(schema, self)
+
+	def transact_write(self, actions=()) -> None:
+		self.record_call()
+		actions = transact_actions(actions)
+		# tables are opened (and created) before the transaction starts
+		for action in actions:
+			self.table(action.table)
+		with self.lock:
+			self.conn.execute('BEGIN')
+			try:
+				self._transact(actions)
+				self.conn.execute('COMMIT')
+			except Exception:
+				self.conn.execute('ROLLBACK')
+				raise
+
+	def close(self):
+		with self.lock:
+			self.conn.close()
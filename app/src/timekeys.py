@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+# Sortable UTC time keys: fixed-width ISO 8601 with microseconds and a Z suffix,
+# so string order in storage indexes is time order.
+KEY_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def utc_now_key() -> str:
+	return datetime.now(timezone.utc).strftime(KEY_FORMAT)
+
+
+def to_utc_key(value: str) -> str:
+	# accepts any ISO 8601 time; naive times are taken as UTC. Raises ValueError.
+	if value.endswith('Z'):
+		value = value[:-1] + '+00:00'
+	parsed = datetime.fromisoformat(value)
+	if parsed.tzinfo is not None:
+		parsed = parsed.astimezone(timezone.utc)
+	return parsed.strftime(KEY_FORMAT)
+
+
+def utc_key_after(seconds: float) -> str:
+	return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).strftime(KEY_FORMAT)
+
+
+def key_age(key: str) -> float:
+	# seconds between a time key and now
+	then = datetime.strptime(key, KEY_FORMAT).replace(tzinfo=timezone.utc)
+	return (datetime.now(timezone.utc) - then).total_seconds()
+
+
+def event_time_attributes(status: str, time: str) -> dict:
+	# the attributes of an event that place it in status_month-time_key-index:
+	# its time as a key, and "<status>#<YYYY-MM>" buckets of one month per status.
+	# Raises ValueError for a time that is not ISO 8601.
+	time_key = to_utc_key(time)
+	return {'time_key': time_key, 'status_month': f'{status}#{time_key[:7]}'}
+
+
+def month_buckets(start_key: str, end_key: str) -> list:
+	# "YYYY-MM" of every month from the one of start_key to the one of end_key
+	year, month = int(start_key[:4]), int(start_key[5:7])
+	buckets = []
+	while f'{year:04}-{month:02}' <= end_key[:7]:
+		buckets.append(f'{year:04}-{month:02}')
+		year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+	return buckets
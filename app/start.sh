@@ -1,3 +1,5 @@
 source export.sh
 
-python3 main.py
\ No newline at end of file
+# starts the server only; create or update tables as a separate step with
+# python3 ./src/initialize.py --ensure-schema
+exec python3 main.py